@@ -11,15 +11,18 @@ requires: Final[Requirements] = [
     "yapic.json>=1.7.0",
     "pandas>=1.0.3",
     "timeago>=1.0.15",
-    "sqlalchemy>=1.4.23",
+    "sqlalchemy>=1.4.33",
+    "asyncpg",
     "google-api-python-client>=2.58.0",
     "youtube-transcript-api>=0.4.4",
     "langid>=1.1.6",
     "pyarrow",
+    "zstandard",
     "pytube",
     "youtube_comment_downloader",
     # "cqlengine",
     "aiocache",
+    "aiohttp",
     # "aioredis==1.3.1",
     "jsonlines",
     "types-protobuf",
@@ -48,6 +51,6 @@ setup(
     install_requires=requires,
     extras_require={"dev": dev_requires},
     packages=find_packages(exclude=["tests"]),
-    python_requires=">=3.8",
+    python_requires=">=3.9",
     zip_safe=False,
 )
@@ -14,16 +14,22 @@ import asyncio
 import logging
 import sys
 from pathlib import Path
+from typing import Dict, List, Tuple
 
+import pandas as pd
 import uvloop
 from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import get_async_session, get_session
 from youtube_recommender import config as config_dir
 
 from .data_methods import data_methods as dm
-from .db.helpers import get_last_query_results, get_videos_by_query
+from .data_methods import set_copy_on_write
+from .db.engine import get_async_session, get_session
+from .db.helpers import get_cached_queries, get_videos_by_queries
 from .db.models import psql
-from .settings import CONFIG_FILE, VIDEOS_PATH
+from .quota import FileQuotaStore, QuotaScheduler, RedisQuotaStore
+from .response_cache import ResponseCache, SqliteCacheStore
+from .settings import (CONFIG_FILE, VIDEOS_PATH, YOUTUBE_API_DAILY_QUOTA,
+                       YOUTUBE_API_RATE_LIMIT)
 from .utils.misc import load_yaml
 from .video_finder import (concat_dfs, get_start_date_string, save_feather,
                            search_each_term)
@@ -77,6 +83,30 @@ parser.add_argument(
     default=50,
     help="Max search results to fetch from YouTube API",
 )
+parser.add_argument(
+    "--rate-limit",
+    type=float,
+    default=YOUTUBE_API_RATE_LIMIT,
+    help="Max YouTube API requests per second",
+)
+parser.add_argument(
+    "--daily-quota",
+    type=int,
+    default=YOUTUBE_API_DAILY_QUOTA,
+    help="Daily YouTube API quota in units, low priority terms are deferred when it runs out",
+)
+parser.add_argument(
+    "--quota-store",
+    choices=("file", "redis"),
+    default="file",
+    help="Where to persist spent quota units",
+)
+parser.add_argument(
+    "--api-cache",
+    choices=("redis", "sqlite", "none"),
+    default="redis",
+    help="Cache YouTube API responses, redis falls back to sqlite when unreachable",
+)
 parser.add_argument(
     "-s",
     "--save",
@@ -92,8 +122,47 @@ parser.add_argument(
     help="push queryResult and Video rows to PostgreSQL`",
 )
 
+
+async def collect_videos(
+    cached_terms: List[str], search_terms: List[str], uploaded_since: str, **kwargs
+) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """Load `cached_terms` from PostgreSQL and search `search_terms` through the API.
+
+    Both run concurrently and are merged into one scored frame with a `query` column.
+    Returns the merged frame and the API results per search term.
+    """
+
+    async def load_cached() -> pd.DataFrame:
+        if not cached_terms:
+            return pd.DataFrame()
+        recs = await get_videos_by_queries(async_session, cached_terms)
+        return dm.create_df_from_cache(recs)
+
+    async def search() -> Dict[str, pd.DataFrame]:
+        if not search_terms:
+            return {}
+        priorities = {term: -i for i, term in enumerate(search_terms)}
+        res = await search_each_term(
+            search_terms,
+            config["api_key"],
+            uploaded_since,
+            priorities=priorities,
+            **kwargs,
+        )
+        res.pop("top_videos")
+        return res
+
+    cached_df, res = await asyncio.gather(load_cached(), search())
+
+    dfs = [cached_df] + [df.assign(query=query) for query, df in res.items()]
+    df = concat_dfs([df for df in dfs if not df.empty]).reset_index(drop=True)
+
+    return df, res
+
+
 if __name__ == "__main__":
     args = parser.parse_args()
+    set_copy_on_write()
     exiting = False
 
     start_date_string = get_start_date_string(args.search_period)
@@ -101,48 +170,49 @@ if __name__ == "__main__":
     if args.dryrun:
         sys.exit()
 
-    search_terms = set(args.search_terms)
+    # before calling YouTube API, use PostgreSQL cache for search results younger than 7 days
+    cached_terms = set()
     if not args.force:
-        # before calling YouTube API, use PostgreSQL cache for search results younger than 7 days
-        for query in args.search_terms:
-            qrs = get_last_query_results(psession, query=query)  # maxHoursAgo=2
-            if len(qrs) > 0:
-                logger.info(
-                    f"got cache results for {query=:<25}, dismissing it from search_terms"
-                )
-                # filter out the query
-                search_terms.discard(query)
-
-            # psession.close()
-
-    # todo: distinguish between search_terms from cache and others, combine results later. are df's of same shape?
-    if len(search_terms) > 0:
-        # res = search_each_term(search_terms, config["api_key"], start_date_string) # blocking code
-        res = loop.run_until_complete(
-            search_each_term(
-                list(search_terms),
-                config["api_key"],
-                start_date_string,
-                n=int(args.nitems),
+        cached_terms = set(
+            loop.run_until_complete(
+                get_cached_queries(async_session, args.search_terms)
             )
         )
-        df = res["top_videos"].reset_index(drop=True)
-
-    else:
-        # recreate dataframe for cached search terms
-        # get dataframes per search query, combine them later
-        dfs = []
-        for query in args.search_terms:
-            recs = loop.run_until_complete(get_videos_by_query(async_session, query))
-            df_ = dm.create_df_from_cache(recs)
-            dfs.append(df_)
+        for query in cached_terms:
+            logger.info(
+                f"got cache results for {query=:<25}, dismissing it from search_terms"
+            )
 
-        # combine dataframes
-        df = concat_dfs(dfs)
+    # keep CLI order, terms passed first get priority
+    search_terms = [
+        term for term in dict.fromkeys(args.search_terms) if term not in cached_terms
+    ]
+
+    store = RedisQuotaStore() if args.quota_store == "redis" else FileQuotaStore()
+    quota = QuotaScheduler(store, daily_quota=args.daily_quota)
+    cache = None
+    if args.api_cache != "none":
+        cache = ResponseCache(
+            SqliteCacheStore() if args.api_cache == "sqlite" else None
+        )
 
-        # logger.info("nothing to do")
-        # sys.exit()
-        # exiting = True
+    # load cached terms and search missing terms concurrently
+    df, res = loop.run_until_complete(
+        collect_videos(
+            list(cached_terms),
+            search_terms,
+            start_date_string,
+            n=int(args.nitems),
+            rate_limit=args.rate_limit,
+            quota=quota,
+            cache=cache,
+        )
+    )
+    loop.run_until_complete(quota.flush())
+    if search_terms:
+        logger.info(quota.summary())
+        if cache is not None:
+            logger.info(cache.summary())
 
     if df.empty:
         logger.info("nothing to do")
@@ -162,14 +232,15 @@ if __name__ == "__main__":
 
         if args.push_db and len(search_terms) > 0:
 
-            res.pop("top_videos")
             query_dict = {}
 
             # push per query
             for query, df_ in res.items():
                 df_ = df_.pipe(dm.extract_video_id).pipe(dm.extract_channel_id)
 
-                datad = loop.run_until_complete(dm.push_videos(df_, async_session, extract_chapters=True))
+                datad = loop.run_until_complete(
+                    dm.push_videos(df_, async_session, push_chapters=True)
+                )
                 # assert isinstance(datad, dict)
                 query_dict[query] = datad["video"]
 
@@ -8,13 +8,12 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
-
-from apiclient.discovery import build  # type: ignore[import]
 from youtube_transcript_api import NoTranscriptFound  # type: ignore[import]
 from youtube_transcript_api import TranscriptsDisabled, YouTubeTranscriptApi
 
 from .core.types import CaptionId, VideoId
 from .data_methods import data_methods as dm
+from .youtube_api import build_youtube_api
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +26,7 @@ logger = logging.getLogger(__name__)
 def list_captions(video_id: VideoId, api_key: str):
     """Execute captions search through API and returns result."""
     # Initialise API call
-    youtube_api = build("youtube", "v3", developerKey=api_key)
+    youtube_api = build_youtube_api(api_key)
 
     results = youtube_api.captions().list(part="snippet", videoId=video_id).execute()
 
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -7,3 +9,16 @@ class psqlConfig(BaseSettings):
     pg_user: str
     pg_passwd: str
     pg_db: str
+
+
+class psqlReplicaConfig(BaseSettings):
+    """Read-only replica, set REPLICA_PG_HOST to enable. Unset fields fall back to the primary."""
+
+    pg_host: Optional[str] = None
+    pg_port: Optional[int] = None
+    pg_user: Optional[str] = None
+    pg_passwd: Optional[str] = None
+    pg_db: Optional[str] = None
+
+    class Config:
+        env_prefix = "replica_"
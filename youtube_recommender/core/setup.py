@@ -6,9 +6,16 @@ initializing module settings
 from dotenv import load_dotenv
 from scrape_utils.core.config_env_file import config_env
 
-from .config import psqlConfig
+from .config import psqlConfig, psqlReplicaConfig
 
 PYTHON_ENV, ENV_FILE = config_env()
 load_dotenv(ENV_FILE)
 # settings = Settings()
 psql_config = psqlConfig()
+# None when no replica is configured, readers then use the primary
+_replica = psqlReplicaConfig()
+psql_replica_config = (
+    psql_config.copy(update=_replica.dict(exclude_none=True))
+    if _replica.pg_host
+    else None
+)
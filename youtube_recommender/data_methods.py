@@ -3,27 +3,37 @@
 import logging
 import traceback
 import uuid
-from collections import defaultdict
-from operator import itemgetter
-from typing import Dict, List, Tuple
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 
-import langid  # type: ignore[import]
+import numpy as np
 import pandas as pd
-from rarc_utils.misc import map_list, plural
-from yapic import json  # type: ignore[import]
-
-from .core.types import (CaptionRec, ChannelId, ChannelRec, ChapterRec,
-                         CommentId, CommentRec, TableTypes, VideoId, VideoRec)
+from rarc_utils.misc import plural
+from sqlalchemy.future import select  # type: ignore[import]
+
+from .core.types import CaptionRec, ChannelId, CommentId, CommentRec, VideoId
+from .db.bulk import (bulk_connection, insert_associations, upsert_channels,
+                      upsert_chapters, upsert_comments, upsert_keywords,
+                      upsert_videos)
+from .db.cache import invalidate_view
+from .db.compression import codec_tag, ensure_dictionaries
 from .db.helpers import (chapter_locations_to_df, compress_caption,
                          create_many_items, find_chapter_locations)
-from .db.models import (Caption, Channel, Chapter, Comment, Keyword, Video,
-                        queryResult)
-from .settings import YOUTUBE_CHANNEL_PREFIX, YOUTUBE_VIDEO_PREFIX
+from .db.models import Caption, Video, queryResult
+from .db.summary import (COMMENT_DELTA_COLUMNS, VIDEO_DELTA_COLUMNS,
+                         add_comment_deltas, add_video_deltas,
+                         lock_video_stats)
+from .language import classify_texts
+from .scoring import score_videos
+from .settings import (CAPTION_CODEC, LANGUAGE_NPROCESS, PANDAS_COPY_ON_WRITE,
+                       YOUTUBE_CHANNEL_PREFIX, YOUTUBE_VIDEO_PREFIX)
 
 logger = logging.getLogger(__name__)
 
+# json classification of older datasets, replaced by LANGUAGE_CONF
 LANGUAGE_CL = "language_cl"
 LANGUAGE_CODE = "language_code"
+LANGUAGE_CONF = "language_conf"
 
 
 class data_methods:
@@ -37,7 +47,7 @@ class data_methods:
             https://www.youtube.com/watch?v=t0OX4jbFwvM --> t0OX4jbFwvM
         """
         assert urlCol in df.columns
-        df = df.copy()
+        df = _shallow_copy(df)
         df["video_id"] = df[urlCol].str.rsplit("?v=", n=1).str[1]
 
         return df
@@ -50,40 +60,53 @@ class data_methods:
             https://www.youtube.com/channel/UC6ObzOWveHCMF --> UC6ObzOWveHCMF
         """
         assert urlCol in df.columns
-        df = df.copy()
+        df = _shallow_copy(df)
         df["channel_id"] = df[urlCol].str.rsplit("/channel/", n=1).str[1]
 
         return df
 
     @staticmethod
-    def classify_language(df: pd.DataFrame, column: str) -> pd.DataFrame:
-        """Classify the language of a pandas str column."""
+    def classify_language(
+        df: pd.DataFrame, column: str, nprocess: int = LANGUAGE_NPROCESS
+    ) -> pd.DataFrame:
+        """Classify the language of a pandas str column.
+
+        Adds categorical `language_code` and float `language_conf` columns,
+        results are cached per video_id when df has that column, see language.py.
+        """
         assert column in df.columns, f"{column=} not in {df.columns=}"
 
-        df = df.copy()
+        ids = df["video_id"] if "video_id" in df.columns else None
+        codes, confs = classify_texts(
+            df[column], ids=ids, column=column, nprocess=nprocess
+        )
 
-        df[LANGUAGE_CL] = df[column].map(langid.classify)
-        df[LANGUAGE_CODE] = df[LANGUAGE_CL].map(itemgetter(0))
-        df[LANGUAGE_CL] = df[LANGUAGE_CL].map(json.dumps)  # makes it serializable
+        df = _shallow_copy(df)
+        df[LANGUAGE_CODE] = pd.Categorical(codes)
+        df[LANGUAGE_CONF] = confs
 
         return df
 
     @staticmethod
-    def keep_language(df: pd.DataFrame, lang_code: str) -> pd.DataFrame:
-        """Keep only rows of language `lang_code`.
+    def keep_language(
+        df: pd.DataFrame, lang_code: str, min_conf: float = 0.0
+    ) -> pd.DataFrame:
+        """Keep only rows of language `lang_code`, classified with at least `min_conf` confidence.
 
         caution: `classify_language` should run before this method
         """
-        assert LANGUAGE_CL in df.columns
         assert LANGUAGE_CODE in df.columns
+        assert LANGUAGE_CONF in df.columns
 
-        lang_codes = df[LANGUAGE_CODE].to_list()
-        if lang_code not in lang_codes:
-            logger.error(f"no {lang_code=} rows in this dataset. {lang_codes=}")
+        is_lang = df[LANGUAGE_CODE] == lang_code
+        if not is_lang.any():
+            logger.error(
+                f"no {lang_code=} rows in this dataset. lang_codes={df[LANGUAGE_CODE].value_counts().to_dict()}"
+            )
             return pd.DataFrame()
 
         rows_before = len(df)
-        df = df[df.language_code == lang_code].reset_index(drop=True)
+        df = df[is_lang & (df[LANGUAGE_CONF] >= min_conf)].reset_index(drop=True)
         rows_after = len(df)
 
         logger.info(
@@ -96,10 +119,14 @@ class data_methods:
     def merge_captions_with_videos(
         df_captions: pd.DataFrame,
         df_videos: pd.DataFrame,
-        dropCols=("language_cl", "language_code", "video_url"),
+        dropCols=(LANGUAGE_CODE, LANGUAGE_CONF, "video_url"),
     ) -> pd.DataFrame:
-        """Merge video and captions dataset on `video_id` column."""
-        vdf = df_videos.drop(list(dropCols), axis=1)
+        """Merge video and captions dataset on `video_id` column.
+
+        Language columns of the videos are dropped, captions have their own,
+        including `language_cl` of videos saved by older versions.
+        """
+        vdf = df_videos.drop(list(dropCols) + [LANGUAGE_CL], axis=1, errors="ignore")
 
         bdf = pd.merge(df_captions, vdf, left_on="video_id", right_on="video_id")
 
@@ -110,42 +137,37 @@ class data_methods:
     @staticmethod
     def create_df_from_cache(recs: List[dict]) -> pd.DataFrame:
         """Create DataFrame from PostgreSQL cache."""
-        df = pd.DataFrame(recs)
+        # `rn` is the row number per query of `get_videos_by_queries`
+        df = pd.DataFrame(recs).drop(columns="rn", errors="ignore")
 
         # reconstruct URL columns
         df["video_url"] = YOUTUBE_VIDEO_PREFIX + df["video_id"]
         df["channel_url"] = YOUTUBE_CHANNEL_PREFIX + df["channel_id"]
         df["qr_id"] = df["qr_id"].map(str)
 
+        # stored scores are stale, they were computed on the day of the query
+        if {"views", "num_subscribers", "publish_date"} <= set(df.columns):
+            df = score_videos(df)
+
         return df
 
     @classmethod
     def extract_chapters(cls, vdf: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        """Extract Chapter metadata from Video.description."""
+        """Extract chapter rows from Video.description, and add nchapter to vdf."""
         logger.info(f"extracting chapters from video description")
-        chapter_res: List[dict] = find_chapter_locations(
-            vdf[["video_id", "length", "title", "description"]]
-            .rename(columns={"video_id": "id"})
-            .to_dict("records")
+        chapter_res = find_chapter_locations(
+            vdf[["video_id", "length", "title", "description"]].rename(
+                columns={"video_id": "id"}
+            )
         )
         cdf = chapter_locations_to_df(chapter_res)
 
-        vdf["chapters"] = vdf["video_id"].map(lambda x: [])
-
         if not cdf.empty:
             cdf = cls._make_chapter_df(cdf)
 
-            by_vid = cdf[["video_id", "chapter"]].copy().groupby("video_id")
-            chapters = by_vid["chapter"].apply(list).to_dict()
-
-            # insert chapter lists into vdf
-            # deal videos that do not have chapter information in description
-            dd: defaultdict = defaultdict(list)
-            dd.update(chapters)
-
-            vdf["chapters"] = vdf["video_id"].map(dd)
-
-        vdf["nchapter"] = vdf["chapters"].map(len)
+        # videos without chapter information in their description get 0
+        counts = cdf["video_id"].value_counts()
+        vdf["nchapter"] = vdf["video_id"].map(counts).fillna(0).astype(int)
 
         logger.info(f"chapters found: {vdf['nchapter'].sum():,}")
 
@@ -154,127 +176,139 @@ class data_methods:
     @classmethod
     async def push_channels(
         cls, vdf: pd.DataFrame, async_session, columns=("id", "name")
-    ) -> Dict[str, Channel]:
-        """Push channels to db."""
-        channel_recs = cls._make_channel_recs(vdf, columns=columns)
-        items: Dict[str, Channel] = await create_many_items(
-            async_session, Channel, channel_recs, nameAttr="id", returnExisting=True
-        )
+    ) -> List[ChannelId]:
+        """Push channels to db, return channel ids."""
+        async with bulk_connection(async_session) as conn:
+            channel_ids = await upsert_channels(
+                conn, cls._make_channel_df(vdf, columns), columns=columns
+            )
 
-        return items
+        return channel_ids
 
     @classmethod
-    async def push_videos(
-        cls, vdf: pd.DataFrame, async_session, push_chapters=True
-    ) -> Dict[str, Dict[str, TableTypes]]:
-        """Push videos to db.
+    async def push_chapters(cls, cdf: pd.DataFrame, async_session) -> List[str]:
+        """Push chapters from `extract_chapters` to db, return chapter ids.
 
-        First create Keyword, Chapter and Channel items
+        Their videos must exist already, use push_videos to write both at once.
         """
-        vdf = vdf.copy()
+        if cdf.empty:
+            return []
 
-        records_dict = {}
+        async with bulk_connection(async_session) as conn:
+            chapter_ids = await upsert_chapters(conn, cdf)
 
-        keyword_recs = cls._make_keyword_recs(vdf)
-        # todo: turn into transaction, since failing to create Video should remove the Keywords
-        records_dict["keyword"] = await create_many_items(
-            async_session, Keyword, keyword_recs, nameAttr="name", returnExisting=True
-        )
-        # map the keyword objects into vdf
-        if "keywords" not in vdf.columns:
-            vdf["keywords"] = vdf.apply(
-                lambda x: [], axis=1
-            )  # set to empty lists first
-        else:
-            vdf["keywords"] = vdf["keywords"].map(
-                lambda x: map_list(x, records_dict["keyword"])
-            )
-            # make them unique
-            vdf["keywords"] = vdf["keywords"].map(set).map(list)
+        logger.info(f"pushed {len(chapter_ids):,} chapters")
 
-        records_dict["channel"] = await cls.push_channels(vdf, async_session)
+        return chapter_ids
 
-        # map the new channels onto vdf
-        vdf["channel"] = vdf["channel_id"].map(records_dict["channel"])
+    @classmethod
+    async def push_videos(
+        cls,
+        vdf: pd.DataFrame,
+        async_session,
+        push_chapters=True,
+        cdf: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """Push videos to db, in one transaction.
+
+        Writes keywords, channels, videos, video_keyword_association rows,
+        chapters and channel_summary rows of the pushed channels, a failure in
+        any stage rolls back all of them. Cached top videos
+        of the pushed channels are invalidated after commit.
+        Returns upserted ids per table, keyword ids by name.
+
+        cdf:    chapters from `extract_chapters`, extracted from vdf when not given
+        """
+        # extract_chapters adds a column
+        vdf = _shallow_copy(vdf)
 
-        video_recs = cls._make_video_recs(vdf)
+        records_dict: Dict[str, Any] = {}
 
-        records_dict["video"] = await create_many_items(
-            async_session, Video, video_recs, nameAttr="id", returnExisting=True
-        )
+        kdf = cls._explode_keywords(vdf)
 
-        # or use separate method for push_chapters?
-        if push_chapters:
-            # finally create chapters
+        if push_chapters and cdf is None:
             vdf, cdf = cls.extract_chapters(vdf)
-            if not cdf.empty:
-                chapter_recs = cls._make_chapter_recs(cdf)
-                records_dict["chapter"] = await create_many_items(
-                    async_session,
-                    Chapter,
-                    chapter_recs,
-                    nameAttr="id",
-                    returnExisting=True,
-                )
 
-        logger.info("finished")
+        async with bulk_connection(async_session) as conn:
+            records_dict["keyword"] = await upsert_keywords(
+                conn, kdf["keyword"].cat.categories
+            )
+
+            records_dict["channel"] = await upsert_channels(
+                conn, cls._make_channel_df(vdf), columns=("id", "name")
+            )
+
+            old_video_stats = await lock_video_stats(conn, vdf["video_id"])
+            video_rows = await upsert_videos(
+                conn,
+                vdf.rename(columns={"video_id": "id"}, copy=False),
+                returning=VIDEO_DELTA_COLUMNS,
+            )
+            records_dict["video"] = [row["id"] for row in video_rows]
+
+            association_recs = cls._make_video_keyword_recs(
+                kdf, records_dict["keyword"]
+            )
+            await insert_associations(
+                conn,
+                "video_keyword_association",
+                ("video_id", "keyword_id"),
+                association_recs,
+            )
+
+            if push_chapters and not cdf.empty:
+                records_dict["chapter"] = await upsert_chapters(conn, cdf)
+
+            await add_video_deltas(conn, old_video_stats, video_rows)
+
+        await invalidate_view("top_videos", ids=records_dict["channel"])
+
+        logger.info(
+            f"pushed {len(records_dict['video']):,} videos, {len(association_recs):,} keyword associations and {len(records_dict.get('chapter', [])):,} chapters"
+        )
 
         return records_dict
 
     @classmethod
     async def push_comments(
-        cls, df: pd.DataFrame, async_session, autobulk=True, returnExisting=False
-    ) -> Dict[str, Dict[str, TableTypes]]:
-        """Push comments to db.
+        cls, df: pd.DataFrame, async_session
+    ) -> Dict[str, List[str]]:
+        """Push comments to db, using COPY and ON CONFLICT upserts.
 
         Assumes comments come from get_comments.py
-        First maps channels to dataset,
-        get video_id, and update comments by video_id
+        First upserts comment authors as channels, then the comments themselves,
+        and adds new comments to channel_summary of the commented videos' channels.
+        Returns upserted ids per table.
         """
-        df = df.copy()
-        records_dict = {}
-
-        # get/create channels
-        df = df.rename(columns={"author": "channel_name", "channel": "channel_id"})
-        channel_recs = cls._make_channel_recs(df, columns=("id", "name"))
-        records_dict["channel"] = await create_many_items(
-            async_session,
-            Channel,
-            channel_recs,
-            nameAttr="id",
-            # returnExisting=returnExisting,
-            mergeExisting=True,
-            autobulk=autobulk,
-            commit=True,
+        df = df.rename(
+            columns={"author": "channel_name", "channel": "channel_id", "cid": "id"},
+            copy=False,
         )
-        # todo: still better is to save comments in nosql store, and save with upsert method. no back and forth calls needed
-
-        # map the new channels into vdf
-        df["channel"] = df["channel_id"].map(records_dict["channel"])
 
         # drop rows without a channel
-        nrow_before = len(df)
-        df = df.dropna(subset=["channel"])
-        ndropped = nrow_before - len(df)
-        if ndropped:
-            logger.warning(f"dropped {ndropped:,} rows, missing channel/video")
-
-        # get/create comments
-        comment_recs = cls._make_comment_recs(df)
-        # print(f"{list(comment_recs.values())[:5]=}")
-
-        # can only push max 32K items
-        records_dict["comment"] = await create_many_items(
-            async_session,
-            Comment,
-            comment_recs,
-            nameAttr="id",
-            returnExisting=returnExisting,
-            autobulk=autobulk,
-            commit=True,
+        missing = df["channel_id"].isnull()
+        if missing.any():
+            logger.warning(f"dropped {missing.sum():,} rows, missing channel")
+            df = df[~missing]
+
+        cdf = df.rename(
+            columns={"id": "comment_id", "channel_id": "id", "channel_name": "name"},
+            copy=False,
         )
+        records_dict = {}
+        async with bulk_connection(async_session) as conn:
+            records_dict["channel"] = await upsert_channels(
+                conn, cdf, columns=("id", "name")
+            )
+            comment_rows = await upsert_comments(
+                conn, df, returning=("id",) + COMMENT_DELTA_COLUMNS
+            )
+            records_dict["comment"] = [row["id"] for row in comment_rows]
+            await add_comment_deltas(conn, comment_rows)
 
-        logger.info("finished")
+        logger.info(
+            f"upserted {len(records_dict['comment']):,} comments from {len(records_dict['channel']):,} channels"
+        )
 
         return records_dict
 
@@ -288,19 +322,18 @@ class data_methods:
 
         returnExisting:     return captions after creating them
         """
-        df, vdf = df.copy(), vdf.copy()
-        records_dict = await cls.push_videos(vdf, async_session)
-
-        video_records = records_dict["video"]
+        # compression adds columns, push_videos does not modify vdf
+        df = _shallow_copy(df)
+        await cls.push_videos(vdf, async_session)
 
         # save captions to postgres, or: Redis, CassandraDB, DynamoDB?
 
-        # map the videos into captions df
-        df["video"] = df["video_id"].map(video_records)
-
-        # compress captions
-        df["compr"] = df["text"].map(compress_caption)
+        # compress captions, with the latest trained dictionary
+        await ensure_dictionaries(async_session)
+        codec = codec_tag(CAPTION_CODEC)
+        df["compr"] = df["text"].map(partial(compress_caption, codec=codec))
         df["compr_length"] = df["compr"].map(len)
+        df["codec"] = codec
 
         caption_recs = cls._make_caption_recs(df)
 
@@ -319,10 +352,13 @@ class data_methods:
     @classmethod
     def push_query_results(
         cls,
-        queryDict: Dict[str, Dict[str, TableTypes]],
+        queryDict: Dict[str, List[VideoId]],
         session,
     ) -> None:
-        """Push queryResults to db."""
+        """Push queryResults to db.
+
+        queryDict:  video ids per query, as returned by `push_videos`
+        """
         if len(queryDict) == 0:
             return
 
@@ -334,8 +370,10 @@ class data_methods:
         # ]
         # session.add_all(qrs)
 
-        for query, video_records in queryDict.items():
-            videos: List[VideoRec] = list(video_records.values())
+        for query, video_ids in queryDict.items():
+            videos: List[Video] = list(
+                session.execute(select(Video).where(Video.id.in_(video_ids))).scalars()
+            )
 
             qr = queryResult(
                 id=uuid.uuid4(), query=query, videos=videos
@@ -362,90 +400,77 @@ class data_methods:
     # ======================================================================= #
 
     @staticmethod
-    def _make_keyword_recs(df: pd.DataFrame) -> Dict[str, dict]:
-        """Make Keyword records from dataframe."""
-        if "keywords" not in df.columns:
-            return {}
-
-        # when loading from feather, lists get cast to array, revert that first
-        if not isinstance(df.keywords[0], list):
-            df["keywords"] = df["keywords"].map(list)
+    def _explode_keywords(df: pd.DataFrame) -> pd.DataFrame:
+        """Make one (video_id, keyword) row per keyword of a video, keyword is categorical.
 
-        l: List[List[str]] = df.keywords.to_list()
-        ll: List[str] = sum(l, [])
-        ll = list(set(ll))
+        Keyword lists may be arrays, as they are when loaded from feather.
+        """
+        if "keywords" not in df.columns:
+            return pd.DataFrame(
+                {"video_id": pd.Series(dtype=object), "keyword": pd.Categorical([])}
+            )
 
-        recs = {k: {"name": k} for k in ll}
+        kdf = (
+            pd.DataFrame(
+                {
+                    "video_id": df["video_id"].to_numpy(),
+                    "keyword": df["keywords"].to_numpy(),
+                }
+            )
+            .explode("keyword")
+            .dropna()
+            .drop_duplicates()
+        )
 
-        return recs
+        return kdf.astype({"keyword": "category"})
 
     @staticmethod
-    def _make_channel_recs(
+    def _make_channel_df(
         df: pd.DataFrame, columns=("id", "name", "num_subscribers")
-    ) -> Dict[ChannelId, ChannelRec]:
-        """Make Channel records from dataframe."""
-        recs = (
+    ) -> pd.DataFrame:
+        """Make Channel rows from dataframe, for bulk upserts."""
+        return (
             df.rename(
                 columns={
                     "channel_id": "id",
                     "channel_name": "name",
                 }
             )[list(columns)]
-            .assign(index=df["channel_id"])
-            .set_index("index")
+            .dropna(subset=["id"])
             .drop_duplicates("id")
-            .to_dict("index")
         )
 
-        return recs
-
     @staticmethod
-    def _make_video_recs(df: pd.DataFrame) -> Dict[VideoId, VideoRec]:
-        """Make Video records from dataframe."""
-        recs = (
-            df.rename(columns={"video_id": "id",})[
-                [
-                    "id",
-                    "title",
-                    "description",
-                    "views",
-                    "length",
-                    "publish_date",
-                    "custom_score",
-                    "channel_id",
-                    "channel",
-                    "keywords",
-                    # "chapters",
-                ]
-            ]
-            .assign(index=df["video_id"])
-            .set_index("index")
-            .drop_duplicates(subset="id")
-            .to_dict("index")
+    def _make_video_keyword_recs(
+        kdf: pd.DataFrame, keyword_ids: Dict[str, int]
+    ) -> List[Tuple[VideoId, int]]:
+        """Make video_keyword_association rows from `_explode_keywords` output.
+
+        Keyword ids are looked up once per unique keyword, and taken by category code.
+        """
+        ids = np.array(
+            [keyword_ids[k] for k in kdf["keyword"].cat.categories], dtype=np.int64
         )
+        keyword_id = ids[kdf["keyword"].cat.codes.to_numpy()]
 
-        return recs
+        return list(zip(kdf["video_id"].tolist(), keyword_id.tolist()))
 
     @staticmethod
     def _make_caption_recs(df: pd.DataFrame) -> Dict[VideoId, CaptionRec]:
-        """Make Caption records from dataframe."""
-        recs = (
-            df.rename(
-                columns={
-                    "text_len": "length",
-                    "language_code": "lang",
-                }
-            )[["video_id", "video", "length", "compr", "compr_length", "lang"]]
-            .assign(index=df["video_id"])
-            .set_index("index")
-            .drop_duplicates()
-            .to_dict("index")
-        )
-
-        return recs
+        """Make Caption records from dataframe, the last caption of a video wins."""
+        columns = {
+            "video_id": "video_id",
+            "length": "text_len",
+            "compr": "compr",
+            "compr_length": "compr_length",
+            "codec": "codec",
+            "lang": LANGUAGE_CODE,
+        }
+        return _records_by_key(df, columns, "video_id", keep="last")
 
     @staticmethod
     def _make_chapter_df(df: pd.DataFrame) -> pd.DataFrame:
+        """Make chapter rows with the columns of table chapter, see bulk.CHAPTER_COLUMNS."""
         cdf = df.rename(columns={"s": "raw_str", "id": "video_id"})[
             [
                 "video_id",
@@ -455,121 +480,72 @@ class data_methods:
                 "start",
                 "end",
             ]
-        ].copy()
+        ]
 
         assert not cdf["video_id"].isnull().sum()
-        cdf["id"] = cdf["video_id"] + "-" + cdf["sub_id"].astype(str)
-
-        cdf["chapter"] = cdf.drop("video_id", axis=1).apply(
-            lambda x: Chapter(**x), axis=1
-        )
-
-        return cdf
-
-    @staticmethod
-    def _make_chapter_recs(df: pd.DataFrame) -> Dict[VideoId, ChapterRec]:
-        """Make Chapter records from dataframe.
-
-        both video_id and sub_id as index
-        """
-        recs = (
-            df.rename(columns={"s": "raw_str"})[
-                [
-                    "id",
-                    "sub_id",
-                    "name",
-                    "video_id",
-                    "raw_str",
-                    "start",
-                    "end",
-                ]
-            ]
-            # .assign(index=pd.MultiIndex.from_frame(df[["video_id", "sub_id"]]))
-            .assign(index=df["id"])
-            .set_index("index")
-            .drop_duplicates()
-            .to_dict("index")
-        )
-
-        return recs
-
-    # @staticmethod
-    # def _make_chapter_recs_from_vdf(df: pd.DataFrame) -> Dict[VideoId, ChapterRec]:
-    #     """Make Chapter records from video dataframe.
-
-    #     both video_id and sub_id as index
-    #     """
-
-    #     df = df.copy()
-    #     if not isinstance(df.chapter[0], list):
-    #         df["chapter"] = df["chapter"].map(list)
-
-    #     l: List[List[str]] = df.chapters.to_list()
-    #     ll: List[str] = sum(l, [])
-    #     ll = list(set(ll))
-
-    #     cdf = pd.DataFrame([item.as_dict() for item in ll])
-
-    #     recs = {k: {"name": k} for k in ll}
-
-    #     recs = (
-    #         df.rename(columns={"s": "raw_str"})[
-    #             [
-    #                 "sub_id",
-    #                 "name",
-    #                 "video_id",
-    #                 "raw_str",
-    #                 "start",
-    #                 "end",
-    #             ]
-    #         ]
-    #         .assign(index=pd.MultiIndex.from_frame(df[["video_id", "sub_id"]]))
-    #         .set_index("index")
-    #         .drop_duplicates()
-    #         .to_dict("index")
-    #     )
-
-    #     return recs
-
-    # @staticmethod
-    def _make_comment_recs(df: pd.DataFrame) -> Dict[CommentId, CommentRec]:
-        """Make Comment records from dataframe."""
-        recs = (
-            df.rename(columns={"cid": "id"})[
-                [
-                    "id",
-                    "text",
-                    "channel",
-                    "channel_id",
-                    "votes",
-                    "time_parsed",
-                    "video_id",
-                ]
-            ]
-            .drop_duplicates("id")
-            .set_index("id", drop=False)
-            .to_dict("index")
-        )
-
-        return recs
+        # composite id: {video_id}-{sub_id}
+        return cdf.assign(id=cdf["video_id"] + "-" + cdf["sub_id"].astype(str))
 
     @staticmethod
     def _make_comment_recs_scylla(df: pd.DataFrame) -> Dict[CommentId, CommentRec]:
         """Make Comment records from dataframe for ScyllaDB."""
-        recs = (
-            df.rename(columns={"channel": "channel_id"})[
-                [
-                    "id",
-                    "text",
-                    "votes",
-                    "channel_id",
-                    "video_id",
-                    "time_parsed",
-                ]
-            ]
-            .drop_duplicates("id")
-            .set_index("id", drop=False)
-            .to_dict("index")
-        )
-
-        return recs
+        columns = {
+            "id": "id",
+            "text": "text",
+            "votes": "votes",
+            "channel_id": "channel",
+            "video_id": "video_id",
+            "time_parsed": "time_parsed",
+        }
+        return _records_by_key(df, columns, "id")
+
+
+def set_copy_on_write(enable: bool = PANDAS_COPY_ON_WRITE) -> None:
+    """Opt in to pandas copy-on-write, call from CLI entry points.
+
+    With copy-on-write, even partial writes to a shallow copy never reach the caller's frame.
+    Not set on import, it changes pandas semantics for the whole process.
+    """
+    if not enable:
+        return
+
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except KeyError:
+        logger.warning(f"pandas {pd.__version__} has no copy-on-write mode")
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _shallow_copy(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of `df` that shares column data, for adding or replacing whole columns.
+
+    Partial writes (.loc, .iloc, inplace=True) would reach the caller's frame,
+    unless copy-on-write is on, see `set_copy_on_write`.
+    """
+    return df.copy(deep=False)
+
+
+def _records_by_key(
+    df: pd.DataFrame, columns: Dict[str, str], key: str, keep: str = "first"
+) -> Dict[Any, dict]:
+    """Build records {field: value} by `key` straight from column arrays.
+
+    columns:    source column by record field
+    keep:       which row of a duplicate key to keep, first or last
+    """
+    fields = list(columns)
+    keys = df[key].tolist()
+    rows = zip(*(df[source].tolist() for source in columns.values()))
+    if keep == "last":
+        return {k: dict(zip(fields, row)) for k, row in zip(keys, rows)}
+
+    recs: Dict[Any, dict] = {}
+    for k, row in zip(keys, rows):
+        if k not in recs:
+            recs[k] = dict(zip(fields, row))
+
+    return recs
@@ -7,13 +7,12 @@ save to feather file
 import argparse
 import logging
 
-import pandas as pd
 from rarc_utils.log import setup_logger, LOG_FMT
-from rarc_utils.sqlalchemy_base import get_session
 
 # from sqlalchemy.future import select  # type: ignore[import]
 # from youtube_recommender.db.models import Channel, Video, psql
-from youtube_recommender.db.models import psql
+from youtube_recommender.db.arrow import read_dataframe
+from youtube_recommender.db.replica import get_read_session
 from youtube_recommender.io_methods import io_methods as im
 from youtube_recommender.settings import EDUCATIONAL_VIDEOS_PATH
 
@@ -21,7 +20,8 @@ logger = setup_logger(
     cmdLevel=logging.INFO, saveFile=0, savePandas=1, color=1, fmt=LOG_FMT
 )
 
-s = get_session(psql)()
+# read from the replica when one is configured, see db/replica.py
+s = get_read_session()()
 
 parser = argparse.ArgumentParser(
     description="create_educational_videos_dataset optional parameters"
@@ -53,9 +53,9 @@ if __name__ == "__main__":
             50000
     """
 
-    videos = s.execute(stmt).mappings().fetchall()
     # df = pd.DataFrame([v.as_dict() for v in videos])
-    df = pd.DataFrame(videos)
+    # COPY to Arrow through the DBAPI connection of the session
+    df = read_dataframe(s.connection().connection, stmt)
 
     # save to feather
     if args.save_feather:
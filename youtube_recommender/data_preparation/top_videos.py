@@ -9,7 +9,8 @@ import argparse
 import logging
 from youtube_recommender.io_methods import io_methods
 from youtube_recommender.settings import VIDEOS_PATH
-from youtube_recommender.utils.db_conn import load_db_table
+from youtube_recommender.db.arrow import read_dataframe
+from youtube_recommender.db.replica import get_read_session
 from youtube_recommender.config.config import get_project_root
 from rarc_utils.log import setup_logger, LOG_FMT
 
@@ -24,9 +25,9 @@ PROJECT_ROOT = get_project_root()
 # VIEW: Final[str] = "top_videos"
 VIEW: Final[str] = "top_videos_with_description"
 LIMIT: Final[int] = 50_000
-df = load_db_table(
-    config_db="database.ini", query=f"SELECT * FROM {VIEW} LIMIT {LIMIT}"
-)
+# read from the replica when one is configured, see db/replica.py
+s = get_read_session()()
+df = read_dataframe(s.connection().connection, f"SELECT * FROM {VIEW} LIMIT {LIMIT}")
 print(df)
 
 # Save as feather file
@@ -0,0 +1,44 @@
+"""Add secondary indexes on foreign keys and cache lookups
+
+Indexes are built CONCURRENTLY, so writers are not blocked on large tables.
+See db/index_audit.py for the queries they serve.
+
+Revision ID: 086e7bbc3690
+Revises:
+Create Date: 2026-10-17 09:12:41.204113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '086e7bbc3690'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# name, table, columns
+INDEXES = [
+    ("ix_video_channel_id", "video", ["channel_id"]),
+    ("ix_video_updated", "video", ["updated"]),
+    ("ix_chapter_video_id", "chapter", ["video_id"]),
+    ("ix_comment_video_id", "comment", ["video_id"]),
+    ("ix_comment_channel_id", "comment", ["channel_id"]),
+    ("ix_caption_video_id_updated", "caption", ["video_id", "updated"]),
+    ("ix_query_result_query_updated", "query_result", ["query", "updated"]),
+    ("ix_video_keyword_association_keyword_id", "video_keyword_association", ["keyword_id"]),
+    ("ix_query_video_association_video_id", "query_video_association", ["video_id"]),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
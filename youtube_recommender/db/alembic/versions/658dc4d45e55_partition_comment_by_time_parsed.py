@@ -0,0 +1,101 @@
+"""Partition comment by time_parsed
+
+Recreates `comment` as a table range partitioned by time_parsed, one partition
+per year plus a default partition, and copies all rows. The primary key
+becomes (id, time_parsed), comments without time_parsed get their `created` time.
+
+Materialized views reading comment are dropped, recreate them afterwards with views.sql.
+
+Revision ID: 658dc4d45e55
+Revises: 086e7bbc3690
+Create Date: 2026-10-17 10:02:17.551620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '658dc4d45e55'
+down_revision = '086e7bbc3690'
+branch_labels = None
+depends_on = None
+
+DEPENDENT_VIEWS = ["vw_comments", "vw_users_with_most_votes", "top_videos_with_comments"]
+COLUMNS = "id, text, votes, channel_id, video_id, time_parsed, created, updated"
+
+
+def _create_comment_table(partitioned: bool):
+    op.execute(
+        """
+        CREATE TABLE comment (
+            id VARCHAR NOT NULL,
+            text VARCHAR NOT NULL,
+            votes INTEGER NOT NULL,
+            channel_id VARCHAR NOT NULL REFERENCES channel (id),
+            video_id VARCHAR NOT NULL REFERENCES video (id),
+            time_parsed TIMESTAMP {not_null},
+            created TIMESTAMP DEFAULT now(),
+            updated TIMESTAMP DEFAULT now(),
+            PRIMARY KEY ({primary_key})
+        ) {partition_by}
+        """.format(
+            not_null="NOT NULL" if partitioned else "",
+            primary_key="id, time_parsed" if partitioned else "id",
+            partition_by="PARTITION BY RANGE (time_parsed)" if partitioned else "",
+        )
+    )
+    op.create_index("ix_comment_video_id", "comment", ["video_id"])
+    op.create_index("ix_comment_channel_id", "comment", ["channel_id"])
+
+
+def _rename_old_table():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS {}".format(", ".join(DEPENDENT_VIEWS)))
+    op.execute("ALTER TABLE comment RENAME TO comment_old")
+    op.execute("ALTER INDEX comment_pkey RENAME TO comment_old_pkey")
+    op.execute("ALTER INDEX ix_comment_video_id RENAME TO ix_comment_old_video_id")
+    op.execute("ALTER INDEX ix_comment_channel_id RENAME TO ix_comment_old_channel_id")
+
+
+def upgrade():
+    _rename_old_table()
+    _create_comment_table(partitioned=True)
+
+    bind = op.get_bind()
+    first, last = bind.execute(
+        sa.text(
+            "SELECT EXTRACT(YEAR FROM MIN(t))::int, EXTRACT(YEAR FROM MAX(t))::int "
+            "FROM (SELECT COALESCE(time_parsed, created, now()) AS t FROM comment_old) c"
+        )
+    ).one()
+    # always cover the current year, new comments land there
+    this_year = bind.execute(sa.text("SELECT EXTRACT(YEAR FROM now())::int")).scalar()
+    first, last = min(first or this_year, this_year), max(last or this_year, this_year)
+
+    for year in range(first, last + 1):
+        op.execute(
+            "CREATE TABLE comment_y{0} PARTITION OF comment "
+            "FOR VALUES FROM ('{0}-01-01') TO ('{1}-01-01')".format(year, year + 1)
+        )
+    op.execute("CREATE TABLE comment_default PARTITION OF comment DEFAULT")
+
+    op.execute(
+        "INSERT INTO comment ({cols}) "
+        "SELECT id, text, votes, channel_id, video_id, COALESCE(time_parsed, created, now()), created, updated "
+        "FROM comment_old".format(cols=COLUMNS)
+    )
+    op.execute("DROP TABLE comment_old")
+
+
+def downgrade():
+    _rename_old_table()
+    _create_comment_table(partitioned=False)
+
+    # a comment might be stored in several partitions, keep the most recently updated
+    op.execute(
+        "INSERT INTO comment ({cols}) "
+        "SELECT DISTINCT ON (id) {cols} FROM comment_old ORDER BY id, updated DESC".format(
+            cols=COLUMNS
+        )
+    )
+    op.execute("DROP TABLE comment_old")
@@ -0,0 +1,46 @@
+"""Add caption codec and caption_dictionary
+
+Existing captions are zlib compressed and get codec 'zlib'. Recompress them
+afterwards with `ipy -m youtube_recommender.db.compression -- --train --recompress`.
+
+Revision ID: c41f0a9e7d2b
+Revises: 658dc4d45e55
+Create Date: 2026-10-17 11:24:38.310457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f0a9e7d2b'
+down_revision = '658dc4d45e55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "caption_dictionary",
+        sa.Column("id", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("num_samples", sa.Integer(), nullable=False),
+        sa.Column("created", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # a constant server default does not rewrite the table
+    op.add_column(
+        "caption",
+        sa.Column("codec", sa.String(), server_default="zlib", nullable=False),
+    )
+
+
+def downgrade():
+    # captions compressed with zstd cannot be read as zlib anymore
+    op.execute(
+        "DO $$ BEGIN IF EXISTS (SELECT 1 FROM caption WHERE codec <> 'zlib') THEN "
+        "RAISE EXCEPTION 'recompress captions with codec zlib before downgrading'; "
+        "END IF; END $$"
+    )
+    op.drop_column("caption", "codec")
+    op.drop_table("caption_dictionary")
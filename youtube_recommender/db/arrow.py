@@ -0,0 +1,199 @@
+"""arrow.py, columnar fetch path from PostgreSQL to Arrow and pandas.
+
+Query results are exported with `COPY (query) TO STDOUT` in CSV format and
+parsed by the multithreaded pyarrow CSV reader, using column types looked up
+from the query. No Python object is created per row, converting to pandas is
+a column-wise copy at most.
+
+usage:
+    # psycopg2, or the DBAPI connection of a sync SQLAlchemy session: session.connection().connection
+    df = read_dataframe(conn, "SELECT * FROM top_videos LIMIT 50000")
+
+    # asyncpg, through an async SQLAlchemy session
+    df = loop.run_until_complete(aread_dataframe(async_session, "SELECT * FROM video"))
+"""
+
+import io
+import logging
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa  # type: ignore[import]
+import pyarrow.csv as pa_csv  # type: ignore[import]
+
+from .bulk import bulk_connection
+
+logger = logging.getLogger(__name__)
+
+# types without a mapping, like json and arrays, are read as strings
+PG_TO_ARROW: Dict[str, pa.DataType] = {
+    "bool": pa.bool_(),
+    "int2": pa.int16(),
+    "int4": pa.int32(),
+    "int8": pa.int64(),
+    "float4": pa.float32(),
+    "float8": pa.float64(),
+    "numeric": pa.float64(),
+    "text": pa.string(),
+    "varchar": pa.string(),
+    "bpchar": pa.string(),
+    "uuid": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+    # COPY writes the offset of the session time zone, values are converted to UTC
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+    # exported as microseconds, see `_copy_sql`
+    "interval": pa.duration("us"),
+    # exported as hex, see `_copy_sql`
+    "bytea": pa.binary(),
+}
+# COPY expression exporting a column of these types in a form pyarrow can parse
+EXPORT_EXPRESSIONS: Dict[str, str] = {
+    "interval": "(EXTRACT(EPOCH FROM {col}) * 1000000)::int8",
+    "bytea": "encode({col}, 'hex')",
+}
+# psycopg2 only reports type oids
+PG_OID_NAMES: Dict[int, str] = {
+    16: "bool",
+    17: "bytea",
+    20: "int8",
+    21: "int2",
+    23: "int4",
+    25: "text",
+    700: "float4",
+    701: "float8",
+    1042: "bpchar",
+    1043: "varchar",
+    1082: "date",
+    1114: "timestamp",
+    1184: "timestamptz",
+    1186: "interval",
+    1700: "numeric",
+    2950: "uuid",
+}
+
+__all__ = [
+    "read_arrow",
+    "read_dataframe",
+    "aread_arrow",
+    "aread_dataframe",
+    "PG_TO_ARROW",
+]
+
+
+def read_arrow(conn, query: str) -> pa.Table:
+    """Fetch `query` as Arrow table, through a psycopg2 connection."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM ({query}) q LIMIT 0")
+        columns = [
+            (col.name, PG_OID_NAMES.get(col.type_code, "")) for col in cur.description
+        ]
+
+        buf = io.BytesIO()
+        cur.copy_expert(_copy_sql(query, columns), buf)
+
+    return _parse_csv(buf, columns)
+
+
+async def aread_arrow(asession, query: str) -> pa.Table:
+    """Fetch `query` as Arrow table, through the asyncpg connection of a session."""
+    async with bulk_connection(asession) as conn:
+        stmt = await conn.prepare(query)
+        columns = [(attr.name, attr.type.name) for attr in stmt.get_attributes()]
+
+        buf = io.BytesIO()
+        await conn.copy_from_query(
+            _export_query(query, columns), output=buf, format="csv", header=True
+        )
+
+    return _parse_csv(buf, columns)
+
+
+def read_dataframe(conn, query: str) -> pd.DataFrame:
+    """Fetch `query` as DataFrame, see `read_arrow`."""
+    return _to_pandas(read_arrow(conn, query))
+
+
+async def aread_dataframe(asession, query: str) -> pd.DataFrame:
+    """Fetch `query` as DataFrame, see `aread_arrow`."""
+    return _to_pandas(await aread_arrow(asession, query))
+
+
+def _copy_sql(query: str, columns: List[Tuple[str, str]]) -> str:
+    return f"COPY ({_export_query(query, columns)}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+
+def _export_query(query: str, columns: List[Tuple[str, str]]) -> str:
+    """Wrap `query` to export columns with EXPORT_EXPRESSIONS, `query` itself when there are none."""
+    if not any(type_ in EXPORT_EXPRESSIONS for _, type_ in columns):
+        return query
+
+    exprs = []
+    for name, type_ in columns:
+        col = '"{}"'.format(name.replace('"', '""'))
+        if type_ in EXPORT_EXPRESSIONS:
+            exprs.append(f"{EXPORT_EXPRESSIONS[type_].format(col=col)} AS {col}")
+        else:
+            exprs.append(col)
+
+    return f"SELECT {', '.join(exprs)} FROM ({query}) q"
+
+
+def _parse_csv(buf: io.BytesIO, columns: List[Tuple[str, str]]) -> pa.Table:
+    buf.seek(0)
+    column_types = {
+        name: _csv_type(PG_TO_ARROW.get(type_, pa.string())) for name, type_ in columns
+    }
+
+    table = pa_csv.read_csv(
+        buf,
+        # COPY quotes values with newlines, like multi-line descriptions and comments
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            # COPY writes NULL as an unquoted empty field, and empty strings as ""
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            true_values=["t"],
+            false_values=["f"],
+        ),
+    )
+    table = _convert_exported(table, columns)
+    logger.info(f"fetched {table.num_rows:,} rows, {table.nbytes / 1e6:.1f} MB")
+
+    return table
+
+
+def _csv_type(type_: pa.DataType) -> pa.DataType:
+    # exported columns are read as they appear in the CSV, then converted
+    if pa.types.is_duration(type_):
+        return pa.int64()
+    if pa.types.is_binary(type_):
+        return pa.string()
+
+    return type_
+
+
+def _convert_exported(table: pa.Table, columns: List[Tuple[str, str]]) -> pa.Table:
+    for name, type_ in columns:
+        if type_ == "interval":
+            col = table[name].cast(pa.duration("us"))
+        elif type_ == "bytea":
+            col = pa.array(
+                [
+                    None if v is None else bytes.fromhex(v)
+                    for v in table[name].to_pylist()
+                ],
+                type=pa.binary(),
+            )
+        else:
+            continue
+        table = table.set_column(table.schema.get_field_index(name), name, col)
+
+    return table
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    # release Arrow buffers while converting, so peak memory stays near one copy
+    return table.to_pandas(split_blocks=True, self_destruct=True)
@@ -0,0 +1,269 @@
+"""bulk.py, bulk upserts through PostgreSQL COPY.
+
+Records are streamed into a temporary table with asyncpg `copy_records_to_table`,
+and merged into the target table with `INSERT ... ON CONFLICT DO UPDATE`.
+Only the keys callers need are returned, no ORM objects are created.
+
+usage:
+    async with bulk_connection(async_session) as conn:
+        keyword_ids = await upsert_keywords(conn, ["python", "pandas"])
+        await upsert_channels(conn, cdf)
+        await upsert_videos(conn, vdf)
+"""
+
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from typing import (Any, AsyncIterator, Dict, Iterable, List, Optional,
+                    Sequence, Tuple)
+
+import asyncpg  # type: ignore[import]
+import pandas as pd
+
+from ..core.types import ChannelId
+from .partitions import ensure_comment_partitions
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_COLUMNS = ("id", "name", "num_subscribers")
+VIDEO_COLUMNS = (
+    "id",
+    "title",
+    "description",
+    "views",
+    "length",
+    "publish_date",
+    "custom_score",
+    "channel_id",
+)
+CHAPTER_COLUMNS = ("id", "sub_id", "name", "video_id", "raw_str", "start", "end")
+COMMENT_COLUMNS = ("id", "text", "votes", "channel_id", "video_id", "time_parsed")
+# position of a record in its batch, numbered by COPY in input order
+ORDINAL_COLUMN = "_ordinal"
+# pseudo column for `returning`: true for inserted rows, false for updated rows
+INSERTED = "inserted"
+# time_parsed is derived from relative times like "2 years ago", and shifts between scrapes.
+# keep the stored value, so a comment stays in its partition and is not inserted twice
+PIN_COMMENT_TIME_QUERY = """
+    UPDATE {tmp_table} tmp SET time_parsed = comment.time_parsed
+    FROM comment WHERE comment.id = tmp.id
+"""
+
+__all__ = [
+    "INSERTED",
+    "bulk_connection",
+    "copy_upsert",
+    "df_to_records",
+    "upsert_keywords",
+    "upsert_channels",
+    "upsert_videos",
+    "upsert_chapters",
+    "upsert_comments",
+    "insert_associations",
+]
+
+
+@asynccontextmanager
+async def bulk_connection(asession) -> AsyncIterator[asyncpg.Connection]:
+    """Yield the raw asyncpg connection of a session, inside one transaction."""
+    async with asession() as session:
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        apg: asyncpg.Connection = raw.driver_connection
+
+        async with apg.transaction():
+            yield apg
+
+
+def df_to_records(df: pd.DataFrame, columns: Sequence[str]) -> List[tuple]:
+    """Convert `columns` of `df` to tuples of Python objects, NaN becomes None.
+
+    Works column by column, `df` is never copied as a whole.
+    """
+    arrays = []
+    for column in columns:
+        values = df[column].astype(object).to_numpy()
+        isnull = pd.isnull(values)
+        if isnull.any():
+            values[isnull] = None
+        arrays.append(values)
+
+    return list(zip(*arrays))
+
+
+async def copy_upsert(
+    conn: asyncpg.Connection,
+    table: str,
+    columns: Sequence[str],
+    records: Iterable[tuple],
+    key: Sequence[str] = ("id",),
+    update: Optional[Sequence[str]] = None,
+    returning: Optional[Sequence[str]] = None,
+    touch_updated: bool = False,
+    prepare: Optional[str] = None,
+) -> List[asyncpg.Record]:
+    """COPY `records` into a temp table and merge them into `table`.
+
+    key:            conflict target, of duplicate keys in `records` the last row wins
+    update:         columns to overwrite on conflict, all non-key columns by default,
+                    empty to leave existing rows untouched
+    returning:      columns to return for every inserted or updated row, may hold INSERTED
+    touch_updated:  set `updated` on conflict, `onupdate` only works through the ORM
+    prepare:        SQL run on the temp table before merging, `{tmp_table}` is replaced by its name
+    """
+    columns, key = list(columns), list(key)
+    update = [c for c in columns if c not in key] if update is None else list(update)
+    tmp_table = f"tmp_{table}_{uuid.uuid4().hex[:8]}"
+
+    await conn.execute(
+        f"CREATE TEMP TABLE {tmp_table} ON COMMIT DROP AS "
+        f"SELECT {_cols(columns)} FROM {table} WITH NO DATA"
+    )
+    await conn.execute(f"ALTER TABLE {tmp_table} ADD COLUMN {ORDINAL_COLUMN} bigserial")
+    await conn.copy_records_to_table(tmp_table, records=records, columns=columns)
+    if prepare is not None:
+        await conn.execute(prepare.format(tmp_table=tmp_table))
+
+    sets = [f'"{c}" = EXCLUDED."{c}"' for c in update]
+    if touch_updated:
+        sets.append("updated = now()")
+    on_conflict = f"DO UPDATE SET {', '.join(sets)}" if sets else "DO NOTHING"
+
+    query = (
+        f"INSERT INTO {table} ({_cols(columns)}) "
+        f"SELECT DISTINCT ON ({_cols(key)}) {_cols(columns)} FROM {tmp_table} "
+        f"ORDER BY {_cols(key)}, {ORDINAL_COLUMN} DESC "
+        f"ON CONFLICT ({_cols(key)}) {on_conflict}"
+    )
+    if returning:
+        query += f" RETURNING {_returning(returning)}"
+
+    rows = await conn.fetch(query)
+    logger.debug(f"upserted {len(rows):,} rows into {table}")
+
+    return rows
+
+
+async def upsert_keywords(
+    conn: asyncpg.Connection, names: Iterable[str]
+) -> Dict[str, int]:
+    """Upsert keywords by name, return keyword id by name."""
+    records = [(name,) for name in set(names)]
+    if not records:
+        return {}
+
+    rows = await copy_upsert(
+        conn,
+        "keyword",
+        ["name"],
+        records,
+        key=["name"],
+        # a no-op update, so existing keywords are returned as well
+        update=["name"],
+        returning=["id", "name"],
+    )
+
+    return {row["name"]: row["id"] for row in rows}
+
+
+async def upsert_channels(
+    conn: asyncpg.Connection,
+    df: pd.DataFrame,
+    columns: Sequence[str] = CHANNEL_COLUMNS,
+) -> List[ChannelId]:
+    """Upsert channels from a dataframe with `columns`, return channel ids."""
+    rows = await copy_upsert(
+        conn,
+        "channel",
+        columns,
+        df_to_records(df, columns),
+        returning=["id"],
+        touch_updated=True,
+    )
+
+    return [row["id"] for row in rows]
+
+
+async def upsert_videos(
+    conn: asyncpg.Connection, df: pd.DataFrame, returning: Sequence[str] = ("id",)
+) -> List[asyncpg.Record]:
+    """Upsert videos from a dataframe with `VIDEO_COLUMNS`, return `returning` of upserted rows."""
+    return await copy_upsert(
+        conn,
+        "video",
+        VIDEO_COLUMNS,
+        df_to_records(df, VIDEO_COLUMNS),
+        returning=returning,
+        touch_updated=True,
+    )
+
+
+async def upsert_chapters(conn: asyncpg.Connection, df: pd.DataFrame) -> List[str]:
+    """Upsert chapters from a dataframe with `CHAPTER_COLUMNS`, return chapter ids."""
+    rows = await copy_upsert(
+        conn,
+        "chapter",
+        CHAPTER_COLUMNS,
+        df_to_records(df, CHAPTER_COLUMNS),
+        returning=["id"],
+        touch_updated=True,
+    )
+
+    return [row["id"] for row in rows]
+
+
+async def upsert_comments(
+    conn: asyncpg.Connection, df: pd.DataFrame, returning: Sequence[str] = ("id",)
+) -> List[asyncpg.Record]:
+    """Upsert comments from a dataframe with `COMMENT_COLUMNS`, return `returning` of upserted rows.
+
+    Creates missing partitions first. Comments without time_parsed get the current time,
+    the partition key cannot be NULL.
+    """
+    # only copy the columns that are written
+    df = df[list(COMMENT_COLUMNS)].drop_duplicates("id")
+    now = pd.Timestamp.utcnow().tz_localize(None)
+    df = df.assign(time_parsed=df["time_parsed"].fillna(now))
+    await ensure_comment_partitions(conn, df["time_parsed"])
+
+    return await copy_upsert(
+        conn,
+        "comment",
+        COMMENT_COLUMNS,
+        df_to_records(df, COMMENT_COLUMNS),
+        key=("id", "time_parsed"),
+        returning=returning,
+        touch_updated=True,
+        prepare=PIN_COMMENT_TIME_QUERY,
+    )
+
+
+async def insert_associations(
+    conn: asyncpg.Connection,
+    table: str,
+    columns: Tuple[str, str],
+    records: Iterable[Tuple[Any, Any]],
+) -> int:
+    """Insert association rows, existing rows are skipped. Return number of new rows."""
+    rows = await copy_upsert(
+        conn,
+        table,
+        columns,
+        records,
+        key=columns,
+        update=[],
+        returning=list(columns[:1]),
+    )
+
+    return len(rows)
+
+
+def _cols(columns: Sequence[str]) -> str:
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def _returning(columns: Sequence[str]) -> str:
+    # xmax is 0 for a row version created by an insert, not by an update
+    return ", ".join(
+        f"(xmax = 0) AS {INSERTED}" if c == INSERTED else f'"{c}"' for c in columns
+    )
@@ -0,0 +1,262 @@
+"""cache.py, Redis cache for DataFrames returned by db helpers.
+
+Frames are serialized as Arrow IPC streams instead of pickle: smaller,
+faster to load, and readable by any Arrow client. Helpers that filter on a
+list of ids can cache one entry per id, so a request for several ids reuses
+entries cached by earlier requests and only queries the missing ids.
+
+Cached entries are dropped after a TTL, or when the data they derive from
+changes: writers call `invalidate_view` with the view and the ids they touched.
+When Redis cannot be reached, helpers query the database directly and
+invalidation only logs a warning.
+
+usage:
+    @cached_frame("top_videos", views=("top_videos",), split_on="channel_id")
+    async def get_top_videos_by_channel_ids(asession, channel_ids=None):
+        ...
+
+    # after pushing videos of these channels
+    await invalidate_view("top_videos", ids=channel_ids)
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+from collections import defaultdict
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Sequence,
+                    Set, Tuple)
+
+import pandas as pd
+import pyarrow as pa  # type: ignore[import]
+from aiocache import Cache  # type: ignore[import]
+from aiocache.serializers import BaseSerializer  # type: ignore[import]
+
+from ..settings import PSQL_CACHE_TTL
+from ..utils.errors import CACHE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "db_cache"
+# key of the entry holding the unfiltered result, when no ids are passed
+ALL_KEY = "__all__"
+
+FrameGetter = Callable[..., Awaitable[pd.DataFrame]]
+
+# cache namespaces by the view they derive from
+_view_namespaces: Dict[str, Set[str]] = defaultdict(set)
+# namespaces holding one entry per id
+_split_namespaces: Set[str] = set()
+# one Cache per namespace, rebuilt when used from another event loop
+_caches: Dict[str, Tuple[Any, Cache]] = {}
+
+__all__ = [
+    "ArrowSerializer",
+    "cached_frame",
+    "canonical_ids",
+    "canonical_key",
+    "invalidate",
+    "invalidate_view",
+    "invalidate_view_sync",
+]
+
+
+class ArrowSerializer(BaseSerializer):
+    """Serialize DataFrames to Arrow IPC stream bytes."""
+
+    DEFAULT_ENCODING = None
+
+    def dumps(self, value: pd.DataFrame) -> bytes:
+        table = pa.Table.from_pandas(value, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return sink.getvalue().to_pybytes()
+
+    def loads(self, value: Optional[bytes]) -> Optional[pd.DataFrame]:
+        if value is None:
+            return None
+
+        return pa.ipc.open_stream(value).read_all().to_pandas()
+
+
+def canonical_ids(ids: Sequence[str]) -> List[str]:
+    """Sort and deduplicate ids, so the same set always maps to the same key."""
+    return sorted(set(ids))
+
+
+def canonical_key(ids: Optional[Sequence[str]]) -> str:
+    """Key of the entry holding the result for a set of ids."""
+    if ids is None:
+        return ALL_KEY
+
+    return hashlib.sha1(",".join(canonical_ids(ids)).encode()).hexdigest()
+
+
+def cached_frame(
+    name: str,
+    views: Sequence[str] = (),
+    split_on: Optional[str] = None,
+    ttl: int = PSQL_CACHE_TTL,
+) -> Callable[[FrameGetter], FrameGetter]:
+    """Cache a helper `f(asession, ids=None, ...) -> pd.DataFrame`.
+
+    The second parameter of the helper holds the ids, whatever its name.
+
+    name:       cache namespace, also used to invalidate entries
+    views:      views the result is read from, see `invalidate_view`
+    split_on:   column holding the id, to cache one entry per id and assemble
+                multi-id requests from them. Without it, the result is cached
+                per canonical set of ids
+    ttl:        seconds an entry lives without being invalidated
+
+    Calls passing other arguments than their defaults bypass the cache.
+    """
+    namespace = _namespace(name)
+    for view in views:
+        _view_namespaces[view].add(namespace)
+    if split_on is not None:
+        _split_namespaces.add(namespace)
+
+    def decorator(func: FrameGetter) -> FrameGetter:
+        signature = inspect.signature(func)
+        session_param, ids_param = list(signature.parameters)[:2]
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> pd.DataFrame:
+            bound = signature.bind(*args, **kwargs)
+            if set(bound.arguments) - {session_param, ids_param}:
+                return await func(*args, **kwargs)
+
+            asession = bound.arguments[session_param]
+            ids = bound.arguments.get(ids_param)
+
+            if split_on is None or ids is None:
+                return await _get_or_set(func, asession, namespace, ids, ttl)
+
+            return await _get_or_set_per_id(
+                func, asession, namespace, canonical_ids(ids), split_on, ttl
+            )
+
+        return wrapper
+
+    return decorator
+
+
+async def invalidate(name: str, ids: Optional[Sequence[str]] = None) -> None:
+    """Drop cached entries of `name`.
+
+    Drops the entries of `ids` and the unfiltered result. Entries cached per
+    set of ids cannot be matched to the ids they hold, so namespaces without
+    per-id entries are dropped entirely, as when no ids are passed.
+    """
+    await _invalidate_namespace(_namespace(name), ids)
+
+
+async def invalidate_view(view: str, ids: Optional[Sequence[str]] = None) -> None:
+    """Drop cached entries read from `view`, see `invalidate`.
+
+    Best effort, writers call it after committing: failures are logged, never
+    raised, stale entries expire after their TTL.
+
+    usage:
+        await invalidate_view("top_videos", ids=channel_ids)
+    """
+    for namespace in _view_namespaces.get(view, ()):
+        try:
+            await _invalidate_namespace(namespace, ids)
+        except Exception as e:
+            logger.warning(f"cannot invalidate {namespace=}: {e!r}")
+
+
+def invalidate_view_sync(view: str, ids: Optional[Sequence[str]] = None) -> None:
+    """Blocking `invalidate_view`, for sync callers without a running event loop."""
+    if view not in _view_namespaces:
+        return
+
+    asyncio.run(invalidate_view(view, ids))
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _namespace(name: str) -> str:
+    return f"{KEY_PREFIX}:{name}:"
+
+
+def _get_cache(namespace: str) -> Cache:
+    loop = asyncio.get_running_loop()
+    if namespace not in _caches or _caches[namespace][0] is not loop:
+        cache = Cache(Cache.REDIS, namespace=namespace, serializer=ArrowSerializer())
+        _caches[namespace] = (loop, cache)
+
+    return _caches[namespace][1]
+
+
+async def _get_or_set(
+    func: FrameGetter, asession, namespace: str, ids, ttl: int
+) -> pd.DataFrame:
+    cache = _get_cache(namespace)
+    key = canonical_key(ids)
+
+    df = await _try_cache(cache.get(key), namespace)
+    if df is None:
+        df = await func(asession, ids)
+        await _try_cache(cache.set(key, df, ttl=ttl), namespace)
+
+    return df
+
+
+async def _get_or_set_per_id(
+    func: FrameGetter,
+    asession,
+    namespace: str,
+    ids: List[str],
+    split_on: str,
+    ttl: int,
+) -> pd.DataFrame:
+    if not ids:
+        return pd.DataFrame()
+
+    cache = _get_cache(namespace)
+    cached = await _try_cache(cache.multi_get(ids), namespace)
+    frames = dict(zip(ids, cached or [None] * len(ids)))
+    missing = [id_ for id_, df in frames.items() if df is None]
+    logger.debug(
+        f"{namespace}: {len(ids) - len(missing):,} hits, {len(missing):,} misses"
+    )
+
+    if missing:
+        df = await func(asession, missing)
+        groups = dict(tuple(df.groupby(split_on))) if not df.empty else {}
+        # ids without rows are cached too, as empty frames
+        fetched = {id_: groups.get(id_, df.iloc[:0]) for id_ in missing}
+        await _try_cache(cache.multi_set(list(fetched.items()), ttl=ttl), namespace)
+        frames.update(fetched)
+
+    return pd.concat([frames[id_] for id_ in ids], ignore_index=True)
+
+
+async def _try_cache(op: Awaitable, namespace: str) -> Any:
+    """Await cache operation `op`, None when the cache cannot be reached."""
+    try:
+        return await op
+    except CACHE_ERRORS as e:
+        logger.warning(f"cannot reach cache for {namespace}, using db directly: {e!r}")
+        return None
+
+
+async def _invalidate_namespace(namespace: str, ids: Optional[Sequence[str]]) -> None:
+    cache = _get_cache(namespace)
+    if ids is None or namespace not in _split_namespaces:
+        await cache.clear(namespace=namespace)
+        return
+
+    for id_ in canonical_ids(ids):
+        await cache.delete(id_)
+    await cache.delete(ALL_KEY)
+    logger.debug(f"invalidated {len(ids):,} ids in {namespace}")
@@ -0,0 +1,331 @@
+"""compression.py, codecs of Caption.compr.
+
+Every caption stores the tag of the codec that compressed it in Caption.codec:
+
+    zlib                    zlib.compress at the default level, all captions before codecs existed
+    zstd                    zstd at CAPTION_ZSTD_LEVEL, without dictionary
+    zstd:<dictionary id>    zstd with a dictionary trained on captions, stored in caption_dictionary
+
+Captions repeat a lot of phrasing across videos, a shared dictionary compresses
+them better than each caption on its own, and decompresses faster than zlib.
+Dictionaries are never deleted, old captions keep decoding with theirs. A tag
+of a dictionary trained after this process loaded its dictionaries reloads them.
+
+usage:
+    ipy -m youtube_recommender.db.compression -- --train
+    ipy -m youtube_recommender.db.compression -- --recompress
+
+    await load_dictionaries(async_session)
+    tag = codec_tag("zstd")
+    compr = encode("some caption", tag)
+    text = decode(compr, tag)
+"""
+
+import argparse
+import asyncio
+import logging
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import zstandard as zstd  # type: ignore[import]
+from rarc_utils.log import setup_logger
+from sqlalchemy import text
+
+from ..settings import (CAPTION_CODEC, CAPTION_DICT_SAMPLES, CAPTION_DICT_SIZE,
+                        CAPTION_RECOMPRESS_BATCH, CAPTION_ZSTD_LEVEL)
+from .bulk import bulk_connection
+from .engine import get_async_session, get_engine
+
+LOG_FMT = "%(asctime)s - %(module)-16s - %(lineno)-4s - %(funcName)-16s - %(levelname)-7s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+CODECS = (CODEC_ZLIB, CODEC_ZSTD)
+
+DICTIONARIES_QUERY = "SELECT id, data FROM caption_dictionary ORDER BY created, id"
+INSERT_DICTIONARY_QUERY = """
+    INSERT INTO caption_dictionary (id, data, num_samples) VALUES ($1, $2, $3)
+    ON CONFLICT (id) DO NOTHING
+"""
+SAMPLE_CAPTIONS_QUERY = "SELECT compr, codec FROM caption ORDER BY random() LIMIT $1"
+# keyset pagination over captions not compressed with `$1` yet
+CAPTIONS_TO_RECOMPRESS_QUERY = """
+    SELECT id, compr, codec FROM caption
+    WHERE codec <> $1 AND ($2::uuid IS NULL OR id > $2)
+    ORDER BY id
+    LIMIT $3
+"""
+# `updated` is left alone, the caption text does not change
+UPDATE_COMPRESSED_CAPTIONS_QUERY = """
+    UPDATE caption SET compr = r.compr, compr_length = r.compr_length, codec = $4
+    FROM unnest($1::uuid[], $2::bytea[], $3::int[]) AS r(id, compr, compr_length)
+    WHERE caption.id = r.id
+"""
+
+# dictionaries by id, in order of creation, the last one compresses new captions
+_dictionaries: Dict[int, zstd.ZstdCompressionDict] = {}
+# (de)compressors by codec tag, zstandard objects are not thread safe
+_compressors: Dict[str, zstd.ZstdCompressor] = {}
+_decompressors: Dict[str, zstd.ZstdDecompressor] = {}
+
+__all__ = [
+    "CODEC_ZLIB",
+    "CODEC_ZSTD",
+    "codec_tag",
+    "encode",
+    "decode",
+    "decode_many",
+    "register_dictionary",
+    "train_dictionary",
+    "load_dictionaries",
+    "ensure_dictionaries",
+    "train_caption_dictionary",
+    "recompress_captions",
+]
+
+
+def codec_tag(codec: str = CAPTION_CODEC) -> str:
+    """Tag new captions get with `codec`, zstd uses the latest registered dictionary."""
+    if codec not in CODECS:
+        raise ValueError(f"unknown codec {codec!r}, choose from {CODECS}")
+
+    if codec == CODEC_ZSTD and _dictionaries:
+        return f"{CODEC_ZSTD}:{list(_dictionaries)[-1]}"
+
+    return codec
+
+
+def encode(text: str, tag: str = CODEC_ZLIB) -> bytes:
+    """Compress `text` with the codec of `tag`."""
+    assert isinstance(text, str)
+    if tag == CODEC_ZLIB:
+        return zlib.compress(text.encode())
+
+    return _compressor(tag).compress(text.encode())
+
+
+def decode(compr: bytes, tag: str = CODEC_ZLIB) -> str:
+    """Decompress `compr` with the codec of `tag`."""
+    assert isinstance(compr, bytes)
+    if tag == CODEC_ZLIB:
+        return zlib.decompress(compr).decode()
+
+    return _decompressor(tag).decompress(compr).decode()
+
+
+def decode_many(comprs: Sequence[bytes], tags: Sequence[str]) -> List[str]:
+    """Decompress captions with their codec tags, e.g. columns `compr` and `codec` of a query."""
+    return [decode(bytes(compr), tag) for compr, tag in zip(comprs, tags)]
+
+
+def register_dictionary(dictionary: zstd.ZstdCompressionDict) -> str:
+    """Make `dictionary` the one new captions are compressed with, return its codec tag."""
+    _dictionaries.pop(dictionary.dict_id(), None)
+    _dictionaries[dictionary.dict_id()] = dictionary
+
+    return f"{CODEC_ZSTD}:{dictionary.dict_id()}"
+
+
+def train_dictionary(
+    texts: Sequence[str], dict_size: int = CAPTION_DICT_SIZE
+) -> zstd.ZstdCompressionDict:
+    """Train a zstd dictionary on `texts`, raises zstd.ZstdError on too few samples."""
+    return zstd.train_dictionary(
+        dict_size, [text.encode() for text in texts], level=CAPTION_ZSTD_LEVEL
+    )
+
+
+async def load_dictionaries(asession) -> List[int]:
+    """Register all dictionaries stored in the database, return their ids."""
+    async with bulk_connection(asession) as conn:
+        rows = await conn.fetch(DICTIONARIES_QUERY)
+
+    for row in rows:
+        register_dictionary(zstd.ZstdCompressionDict(bytes(row["data"])))
+
+    return [row["id"] for row in rows]
+
+
+async def ensure_dictionaries(asession, tags: Iterable[str] = ()) -> None:
+    """Load the stored dictionaries, unless this process has them already.
+
+    tags:   codec tags about to be decoded, dictionaries are reloaded when one is unknown
+    """
+    if not _dictionaries or any(not _is_loaded(tag) for tag in set(tags)):
+        await load_dictionaries(asession)
+
+
+async def train_caption_dictionary(
+    asession,
+    num_samples: int = CAPTION_DICT_SAMPLES,
+    dict_size: int = CAPTION_DICT_SIZE,
+) -> str:
+    """Train a dictionary on a random sample of stored captions, store and register it.
+
+    Returns the codec tag of the new dictionary.
+    """
+    await load_dictionaries(asession)
+    async with bulk_connection(asession) as conn:
+        rows = await conn.fetch(SAMPLE_CAPTIONS_QUERY, num_samples)
+        texts = decode_many(
+            [row["compr"] for row in rows], [row["codec"] for row in rows]
+        )
+        dictionary = train_dictionary(texts, dict_size)
+        await conn.execute(
+            INSERT_DICTIONARY_QUERY,
+            dictionary.dict_id(),
+            dictionary.as_bytes(),
+            len(texts),
+        )
+
+    tag = register_dictionary(dictionary)
+    logger.info(f"trained {tag} on {len(texts):_} captions")
+
+    return tag
+
+
+async def recompress_captions(
+    asession,
+    codec: str = CAPTION_CODEC,
+    batch_size: int = CAPTION_RECOMPRESS_BATCH,
+    limit: Optional[int] = None,
+) -> int:
+    """Recompress captions with the current tag of `codec`, one transaction per batch.
+
+    Safe to interrupt and rerun, captions that already have the tag are skipped.
+    Returns the number of recompressed captions.
+
+    usage:
+        n = loop.run_until_complete(recompress_captions(async_session, limit=10_000))
+    """
+    await load_dictionaries(asession)
+    tag = codec_tag(codec)
+    last_id = None
+    count, size_before, size_after = 0, 0, 0
+
+    while limit is None or count < limit:
+        n = batch_size if limit is None else min(batch_size, limit - count)
+        async with bulk_connection(asession) as conn:
+            rows = await conn.fetch(CAPTIONS_TO_RECOMPRESS_QUERY, tag, last_id, n)
+            if not rows:
+                break
+
+            comprs = [
+                encode(decode(bytes(row["compr"]), row["codec"]), tag) for row in rows
+            ]
+            await conn.execute(
+                UPDATE_COMPRESSED_CAPTIONS_QUERY,
+                [row["id"] for row in rows],
+                comprs,
+                [len(compr) for compr in comprs],
+                tag,
+            )
+
+        last_id = rows[-1]["id"]
+        count += len(rows)
+        size_before += sum(len(row["compr"]) for row in rows)
+        size_after += sum(len(compr) for compr in comprs)
+        logger.info(
+            f"recompressed {count:_} captions with {tag}, {size_before:_} -> {size_after:_} bytes"
+        )
+
+    return count
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _dictionary(tag: str) -> Optional[zstd.ZstdCompressionDict]:
+    codec, _, dict_id = tag.partition(":")
+    if codec != CODEC_ZSTD:
+        raise ValueError(f"unknown codec tag {tag!r}")
+
+    if not dict_id:
+        return None
+
+    if int(dict_id) not in _dictionaries:
+        # trained after this process loaded its dictionaries
+        logger.info(f"dictionary of {tag!r} is not loaded, reloading dictionaries")
+        for data in _fetch_dictionaries():
+            register_dictionary(zstd.ZstdCompressionDict(data))
+
+    if int(dict_id) not in _dictionaries:
+        raise KeyError(f"dictionary of {tag!r} is not stored in caption_dictionary")
+
+    return _dictionaries[int(dict_id)]
+
+
+def _is_loaded(tag: str) -> bool:
+    codec, _, dict_id = tag.partition(":")
+    return codec != CODEC_ZSTD or not dict_id or int(dict_id) in _dictionaries
+
+
+def _fetch_dictionaries() -> List[bytes]:
+    """Stored dictionaries in order of creation, sync, for decoding outside of async code."""
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(DICTIONARIES_QUERY)).fetchall()
+
+    return [bytes(row.data) for row in rows]
+
+
+def _compressor(tag: str) -> zstd.ZstdCompressor:
+    if tag not in _compressors:
+        _compressors[tag] = zstd.ZstdCompressor(
+            level=CAPTION_ZSTD_LEVEL, dict_data=_dictionary(tag)
+        )
+
+    return _compressors[tag]
+
+
+def _decompressor(tag: str) -> zstd.ZstdDecompressor:
+    if tag not in _decompressors:
+        _decompressors[tag] = zstd.ZstdDecompressor(dict_data=_dictionary(tag))
+
+    return _decompressors[tag]
+
+
+CLI = argparse.ArgumentParser()
+CLI.add_argument(
+    "--train",
+    action="store_true",
+    default=False,
+    help="train a new dictionary on stored captions, new captions are compressed with it",
+)
+CLI.add_argument(
+    "--recompress",
+    action="store_true",
+    default=False,
+    help="recompress captions that do not use the current codec",
+)
+CLI.add_argument(
+    "--codec",
+    type=str,
+    default=CAPTION_CODEC,
+    choices=CODECS,
+    help="codec to recompress with",
+)
+CLI.add_argument(
+    "--limit", type=int, default=None, help="max number of captions to recompress"
+)
+
+if __name__ == "__main__":
+    args = CLI.parse_args()
+
+    logger = setup_logger(
+        cmdLevel=logging.INFO, saveFile=0, savePandas=0, color=1, fmt=LOG_FMT
+    )
+
+    async_session = get_async_session()
+    loop = asyncio.new_event_loop()
+
+    if args.train:
+        loop.run_until_complete(train_caption_dictionary(async_session))
+
+    if args.recompress:
+        loop.run_until_complete(
+            recompress_captions(async_session, codec=args.codec, limit=args.limit)
+        )
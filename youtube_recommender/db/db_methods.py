@@ -4,20 +4,29 @@ methods to help with deleting and updating data in the database
 used to run independently from main codebase
 """
 
+import argparse
 import asyncio
 import logging
-from typing import List
+import time
+from typing import List, Sequence
 
 from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import (get_async_db, get_async_session,
-                                        get_session)
-from sqlalchemy import delete, select
+from rarc_utils.sqlalchemy_base import get_async_db
+from sqlalchemy import delete, select, text
 from youtube_recommender import config as config_dir
 from youtube_recommender.core.setup import psql_config as psql
 from youtube_recommender.core.types import ChannelId
-from youtube_recommender.db.models import Channel, Chapter, Video
+from youtube_recommender.db.bulk import bulk_connection
+from youtube_recommender.db.cache import invalidate_view_sync
+from youtube_recommender.db.engine import get_async_session, get_session
+from youtube_recommender.db.helpers import execute_by_ids
+from youtube_recommender.db.models import (Channel, ChannelSummary, Chapter,
+                                           Video)
+from youtube_recommender.db.summary import rebuild_channel_summary
 from youtube_recommender.io_methods import io_methods as im
-from youtube_recommender.settings import CHAPTERS_JL_FILE
+from youtube_recommender.settings import (CHAPTERS_JL_FILE,
+                                          PSQL_REFRESH_INTERVAL,
+                                          PSQL_REFRESH_VIEWS)
 
 LOG_FMT = "%(asctime)s - %(module)-16s - %(lineno)-4s - %(funcName)-16s - %(levelname)-7s - %(message)s"
 
@@ -26,17 +35,61 @@ psession = get_session(psql)()
 
 logger = logging.getLogger(__name__)
 
+DELETE_KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY = (
+    "DELETE FROM video_keyword_association WHERE video_id = ANY(:ids)"
+)
+DELETE_CHAPTERS_BY_VIDEO_IDS_QUERY = "DELETE FROM chapter WHERE video_id = ANY(:ids)"
+DELETE_VIDEOS_BY_IDS_QUERY = "DELETE FROM video WHERE id = ANY(:ids)"
+SET_EDUCATIONAL_BY_CHANNEL_IDS_QUERY = """
+    UPDATE video
+    SET is_educational = 't'
+    WHERE channel_id = ANY(:ids)
+"""
+
+
+def refresh_view(vw: str, concurrently=True) -> None:
+    """Refresh materialized view, and drop cached results read from it.
 
-def refresh_view(vw: str) -> None:
-    """Refresh materialized view."""
-    query = """REFRESH MATERIALIZED VIEW {};""".format(vw)
+    concurrently:   do not lock out readers, needs a unique index on the view, see views.sql
+    """
+    query = """REFRESH MATERIALIZED VIEW {}{};""".format(
+        "CONCURRENTLY " if concurrently else "", vw
+    )
     logger.info(f"running query: {query}")
-    psession.execute(query)
-    logger.info("finished query")
+    t0 = time.time()
+    psession.execute(text(query))
+    psession.commit()
+    logger.info(f"finished query in {time.time() - t0:.1f}s")
+
+    invalidate_view_sync(vw)
+
+
+def refresh_views(views: Sequence[str] = PSQL_REFRESH_VIEWS, concurrently=True) -> None:
+    """Refresh materialized views one by one, a failing view does not stop the others."""
+    for vw in views:
+        try:
+            refresh_view(vw, concurrently=concurrently)
+        except Exception as e:
+            psession.rollback()
+            logger.error(f"cannot refresh {vw=}: {e}")
+
+
+def schedule_refresh_views(
+    views: Sequence[str] = PSQL_REFRESH_VIEWS, interval: int = PSQL_REFRESH_INTERVAL
+) -> None:
+    """Refresh materialized views every `interval` seconds, run as a separate process.
+
+    usage:
+        ipy -m youtube_recommender.db.db_methods -- --refresh-views --interval 1800
+    """
+    while True:
+        refresh_views(views)
+        logger.info(f"next refresh in {interval:,}s")
+        time.sleep(interval)
 
 
 async def delete_videos_from_channel(asession, channel_id: str):
-    """Delete all video rows related to a Channel, including video_keyword associations.
+    """Delete all video rows related to a Channel, including video_keyword associations and its summary.
 
     usage:
         channel_id = "UCsvqVGtbbyHaMoevxPAq9Fg"
@@ -47,33 +100,27 @@ async def delete_videos_from_channel(asession, channel_id: str):
 
     async with asession() as session:
         video_ids = (await session.execute(videosq)).scalars().all()
-        print(video_ids[:3])
-
-        # select all keywords
-        fmt_ids = "'{0}'".format("', '".join(video_ids))
-        delete_kw = (
-            """DELETE FROM video_keyword_association WHERE video_id IN ({});""".format(
-                fmt_ids
-            )
-        )
-        # logger.info(f"{delete_kw=}")
-
-        _ = await session.execute(delete_kw)
+        logger.info(f"deleting {len(video_ids):,} videos of {channel_id=}")
 
-        # logger.info(f"{kw_res=}, {dir(kw_res)=} \n{kw_res.one()=}")
-        # logger.info(f"{len(kw_res)=:,} {kw_res[:3]=}")
+        nkeyword = await execute_by_ids(
+            session, DELETE_KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY, video_ids
+        )
 
         # now chapters, videos and channel can be deleted
-        dchap = delete(Chapter).where(Chapter.video_id.in_(video_ids))
-        dvid = delete(Video).where(Video.id.in_(video_ids))
+        nchapter = await execute_by_ids(
+            session, DELETE_CHAPTERS_BY_VIDEO_IDS_QUERY, video_ids
+        )
+        nvideo = await execute_by_ids(session, DELETE_VIDEOS_BY_IDS_QUERY, video_ids)
+        await session.execute(
+            delete(ChannelSummary).where(ChannelSummary.channel_id == channel_id)
+        )
         dchan = delete(Channel).where(Channel.id == channel_id)
-
-        # chapter_delete_result = video_id
-        chapter_delete_result = await session.execute(dchap)
-        video_delete_result = await session.execute(dvid)
         channel_delete_result = await session.execute(dchan)
+
+        await session.commit()
+
         logger.info(
-            f"{chapter_delete_result=}, {video_delete_result=} {channel_delete_result=}"
+            f"deleted {nkeyword=:,} {nchapter=:,} {nvideo=:,} nchannel={channel_delete_result.rowcount}"
         )
 
 
@@ -89,20 +136,23 @@ async def set_educational_by_channel_id(asession, channel_ids: List[ChannelId]):
         channel_ids = ['UCkw4JCwteGrDHIsyIIKo4tQ','UCs6nmQViDpUw0nuIx9c_WvA','UCsvqVGtbbyHaMoevxPAq9Fg','UC8butISFwT-Wl7EV0hUK0BQ']
         loop.run_until_complete(set_educational_by_channel_id(async_session, channel_ids))
     """
-    fmt_ids = "'{0}'".format("', '".join(channel_ids))
-    q = """ 
-    UPDATE video
-    SET is_educational = 't'
-    FROM channel
-    WHERE channel.id IN ({}) AND channel.id = video.channel_id;
-    """.format(
-        fmt_ids
-    )
+    async with asession() as session:
+        nvideo = await execute_by_ids(
+            session, SET_EDUCATIONAL_BY_CHANNEL_IDS_QUERY, channel_ids
+        )
+        await session.commit()
 
-    logger.info(f"q: \n\n{q}")
+    logger.info(f"set {nvideo:,} videos to is_educational")
 
-    async with asession() as session:
-        await session.execute(q)
+
+async def rebuild_summary(asession) -> int:
+    """Recompute channel_summary for all channels, in one transaction.
+
+    usage:
+        ipy -m youtube_recommender.db.db_methods -- --rebuild-summary
+    """
+    async with bulk_connection(asession) as conn:
+        return await rebuild_channel_summary(conn)
 
 
 def migrate_chapter_ids_to_composite(session) -> None:
@@ -131,7 +181,29 @@ def create_chapters_from_json(session, file=CHAPTERS_JL_FILE) -> None:
     session.commit()
 
 
+CLI = argparse.ArgumentParser()
+CLI.add_argument(
+    "--refresh-views",
+    action="store_true",
+    default=False,
+    help=f"refresh materialized views concurrently: {', '.join(PSQL_REFRESH_VIEWS)}",
+)
+CLI.add_argument(
+    "--interval",
+    type=int,
+    default=0,
+    help="with --refresh-views, keep refreshing every `interval` seconds",
+)
+CLI.add_argument(
+    "--rebuild-summary",
+    action="store_true",
+    default=False,
+    help="recompute channel_summary for all channels",
+)
+
 if __name__ == "__main__":
+    args = CLI.parse_args()
+
     logger = setup_logger(
         cmdLevel=logging.INFO, saveFile=0, savePandas=0, color=1, fmt=LOG_FMT
     )
@@ -141,3 +213,12 @@ if __name__ == "__main__":
     async_db = get_async_db(psql)()
 
     loop = asyncio.new_event_loop()
+
+    if args.rebuild_summary:
+        loop.run_until_complete(rebuild_summary(async_session))
+
+    if args.refresh_views:
+        if args.interval > 0:
+            schedule_refresh_views(interval=args.interval)
+        else:
+            refresh_views()
@@ -0,0 +1,174 @@
+"""engine.py, one shared sync and async engine per database config.
+
+Engines are built on first use and reused by every session factory of the
+process, so a worker holds at most `PSQL_POOL_SIZE + PSQL_MAX_OVERFLOW`
+connections per engine, instead of one pool per module that creates a session.
+A forked worker builds its own engines, pooled connections are never shared
+across processes.
+
+`get_session` and `get_async_session` mirror the rarc_utils functions they
+replace: they return session factories.
+
+usage:
+    from youtube_recommender.db.engine import get_async_session, get_session
+
+    async_session = get_async_session()
+    psession = get_session()()
+
+    logger.info(pool_metrics())
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    create_async_engine)
+from sqlalchemy.orm import sessionmaker
+
+from ..core.setup import psql_config
+from ..settings import (PSQL_MAX_OVERFLOW, PSQL_POOL_PRE_PING,
+                        PSQL_POOL_RECYCLE, PSQL_POOL_SIZE, PSQL_POOL_TIMEOUT,
+                        PSQL_STATEMENT_CACHE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+SYNC_DRIVER = "postgresql+psycopg2"
+ASYNC_DRIVER = "postgresql+asyncpg"
+
+EngineKey = Tuple[str, str, int, str, str]
+
+# engines by (kind, host, port, user, database), with the pid that built them
+_engines: Dict[EngineKey, Tuple[int, Any]] = {}
+
+__all__ = [
+    "make_url",
+    "get_engine",
+    "get_async_engine",
+    "get_session",
+    "get_async_session",
+    "pool_metrics",
+    "dispose_engines",
+]
+
+
+def make_url(cfg, driver: str) -> URL:
+    """Build connection URL from a psqlConfig, the password is escaped."""
+    return URL.create(
+        driver,
+        username=cfg.pg_user,
+        password=cfg.pg_passwd,
+        host=cfg.pg_host,
+        port=cfg.pg_port,
+        database=cfg.pg_db,
+    )
+
+
+def get_engine(cfg=None) -> Engine:
+    """Get the shared sync engine of `cfg`, psql_config by default."""
+    cfg = cfg or psql_config
+    return _get_or_create(
+        _key("sync", cfg),
+        lambda: create_engine(make_url(cfg, SYNC_DRIVER), **_pool_kwargs()),
+    )
+
+
+def get_async_engine(cfg=None) -> AsyncEngine:
+    """Get the shared async engine of `cfg`, psql_config by default."""
+    cfg = cfg or psql_config
+    return _get_or_create(
+        _key("async", cfg),
+        lambda: create_async_engine(
+            make_url(cfg, ASYNC_DRIVER),
+            connect_args={"statement_cache_size": PSQL_STATEMENT_CACHE_SIZE},
+            **_pool_kwargs(),
+        ),
+    )
+
+
+def get_session(cfg=None) -> sessionmaker:
+    """Get a sync session factory bound to the shared engine of `cfg`."""
+    return sessionmaker(bind=get_engine(cfg))
+
+
+def get_async_session(cfg=None) -> sessionmaker:
+    """Get an async session factory bound to the shared engine of `cfg`."""
+    return sessionmaker(
+        get_async_engine(cfg), class_=AsyncSession, expire_on_commit=False
+    )
+
+
+def pool_metrics() -> List[Dict[str, Any]]:
+    """Connection pool usage per engine of this process.
+
+    checked_out are connections in use, overflow counts connections above pool_size.
+    """
+    metrics = []
+    for (kind, host, port, user, database), (pid, engine) in _engines.items():
+        if pid != os.getpid():
+            continue
+
+        pool = engine.sync_engine.pool if kind == "async" else engine.pool
+        metrics.append(
+            {
+                "kind": kind,
+                "database": f"{user}@{host}:{port}/{database}",
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        )
+
+    return metrics
+
+
+async def dispose_engines() -> None:
+    """Close all pooled connections of this process, engines are rebuilt on next use."""
+    for key, (pid, engine) in list(_engines.items()):
+        if pid == os.getpid():
+            if isinstance(engine, AsyncEngine):
+                await engine.dispose()
+            else:
+                engine.dispose()
+        del _engines[key]
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _key(kind: str, cfg) -> EngineKey:
+    return (kind, cfg.pg_host, cfg.pg_port, cfg.pg_user, cfg.pg_db)
+
+
+def _pool_kwargs() -> Dict[str, Any]:
+    return dict(
+        pool_size=PSQL_POOL_SIZE,
+        max_overflow=PSQL_MAX_OVERFLOW,
+        pool_timeout=PSQL_POOL_TIMEOUT,
+        pool_recycle=PSQL_POOL_RECYCLE,
+        pool_pre_ping=PSQL_POOL_PRE_PING,
+    )
+
+
+def _get_or_create(key: EngineKey, create) -> Any:
+    pid = os.getpid()
+    entry: Optional[Tuple[int, Any]] = _engines.get(key)
+    if entry is not None and entry[0] == pid:
+        return entry[1]
+
+    if entry is not None:
+        # inherited from the parent process, leave its connections to the parent
+        inherited = entry[1]
+        sync_engine = inherited.sync_engine if key[0] == "async" else inherited
+        sync_engine.dispose(close=False)
+
+    engine = create()
+    _engines[key] = (pid, engine)
+    logger.debug(f"created {key[0]} engine for {key[3]}@{key[1]}:{key[2]}/{key[4]}")
+
+    return engine
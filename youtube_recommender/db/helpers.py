@@ -2,22 +2,24 @@
 
 import logging
 import re
-import zlib
-from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 
 import numpy as np
 import pandas as pd
-from aiocache import Cache, cached  # type: ignore[import]
-from aiocache.serializers import PickleSerializer  # type: ignore[import]
+import pyarrow as pa  # type: ignore[import]
 from rarc_utils.sqlalchemy_base import add_many, create_many
-from sqlalchemy import and_
+from sqlalchemy import and_, text
 from sqlalchemy.future import select  # type: ignore[import]
 
 from ..core.types import ChannelId, VideoId, VideoRec
-from ..settings import HOUR_LIMIT, PSQL_HOURS_AGO
+from ..settings import HOUR_LIMIT, PSQL_HOURS_AGO, PSQL_STREAM_CHUNKSIZE
+from ..utils.misc import chunks
+from .cache import cached_frame
+from .compression import CODEC_ZLIB, decode, encode, ensure_dictionaries
 from .models import Caption, Channel, Comment, Video, queryResult
+from .partitions import time_window
+from .replica import read_only
 
 logger = logging.getLogger(__name__)
 
@@ -25,95 +27,205 @@ time_pattern = re.compile(r"(\d+:\d+:\d+)(.+)")
 # a group with time pattern and (hopefully) the name of the chapter, might leave orphaned ']'  or ')' bracket
 # removing this remainder bracket, use a replace pattern for now
 replace_pat = re.compile(r"^[\]|\)-]+")
+# H:M:S or M:S, hours are optional
+duration_pattern = re.compile(r"^(?:(\d+):)?(\d+):(\d+)$")
+SECONDS_PER_PART = np.array([3600, 60, 1])
+CHAPTER_LOCATION_COLUMNS = ["video_id", "video_length", "video_end", "s", "name"]
+
+# id sets larger than this are queried in chunks
+MAX_IDS_PER_QUERY = 10_000
+
+# queries bind one array parameter `:ids`, so the SQL text stays small and PostgreSQL can reuse the plan
+TOP_VIDEOS_QUERY = "SELECT * FROM top_videos"
+TOP_VIDEOS_BY_CHANNEL_IDS_QUERY = (
+    "SELECT * FROM top_videos WHERE channel_id = ANY(:ids)"
+)
+KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY = (
+    "SELECT * FROM video_keyword_association WHERE video_id = ANY(:ids)"
+)
+COMMENTS_BY_VIDEO_IDS_QUERY = """
+    SELECT
+        video_channel.name AS vid_channel_name,
+        video.title AS video_title,
+        comment.*,
+        comment_channel.name AS com_channel_name
+    FROM video
+    LEFT JOIN channel AS video_channel ON video.channel_id = video_channel.id
+    LEFT JOIN comment ON video.id = comment.video_id
+        -- bounds on the partition key, so only partitions in the window are scanned
+        AND comment.time_parsed >= :since AND comment.time_parsed < :until
+    LEFT JOIN channel AS comment_channel ON comment.channel_id = comment_channel.id
+    WHERE video.id = ANY(:ids)
+"""
+TOP_CHANNELS_WITH_COMMENTS_QUERY = "SELECT * FROM top_channels_with_comments"
+VIDEOS_BY_QUERY_QUERY = """
+    SELECT * FROM last_videos
+    WHERE query = :query AND qr_updated > :since
+    LIMIT :n
+"""
+
+
+def find_chapter_locations(
+    videos: Union[pd.DataFrame, List[VideoRec]], display=False
+) -> pd.DataFrame:
+    """Find lines in video descriptions that capture time link data, one row per line.
 
-# cache = Cache(Cache.REDIS, serializer=JsonSerializer())
+    Matches all descriptions at once, videos need columns id, length and description.
 
+    Example:
+        ⌨️ (0:00:00) Introduction
+        ⌨️ (0:00:34) Colab intro (importing wine dataset)
+    """
+    videos = pd.DataFrame(videos)
+    if videos.empty:
+        return pd.DataFrame(columns=CHAPTER_LOCATION_COLUMNS)
+
+    # positional index, so matches map back to their video when the index has duplicates
+    descriptions = pd.Series(videos["description"].fillna("").to_numpy(dtype=object))
+    matches = descriptions.str.extractall(time_pattern)
+    if matches.empty:
+        return pd.DataFrame(columns=CHAPTER_LOCATION_COLUMNS)
+
+    pos = matches.index.get_level_values(0).to_numpy()
+    lengths = videos["length"].to_numpy()[pos]
+    df = pd.DataFrame(
+        {
+            "video_id": videos["id"].to_numpy()[pos],
+            "video_length": lengths,
+            "video_end": pd.to_timedelta(lengths, unit="s"),
+            "s": matches[0].to_numpy(),
+            "name": matches[1]
+            .str.replace(replace_pat, "", regex=True)
+            .str.strip()
+            .to_numpy(),
+        }
+    )
 
-def parse_time(row, levels=("seconds", "minutes", "hours")) -> Optional[timedelta]:
-    """Parse time from YouTube chapter as generic as possible.
+    if display:
+        for title, chapters in df.groupby(videos["title"].to_numpy()[pos], sort=False):
+            print(f"{title=}, \n{chapters[['s', 'name']]} \n\n")
 
-    Caution: sometimes only M:S format: 23:20, sometimes full H:M:S format: 15:10:10
-    """
-    s = row.s
-    # split and reverse order (seconds first)
-    parts = s.split(":")[::-1]
+    return df
 
-    # determine number of time parts
-    if len(parts) > 3:
-        logger.error(f"too many parts: {s=}, {row.video_id=}")
-        return None
 
-    dd_level = defaultdict(int)
+def chapter_locations_to_df(ret: Union[pd.DataFrame, List[dict]]) -> pd.DataFrame:
+    """Add chapter start, end and sub_id to chapter locations.
 
-    for part, level in zip(parts, levels):
-        dd_level[level] = int(part)
+    Times are parsed as H:M:S or M:S with integer math, a chapter ends where the
+    next chapter of its video starts, the last one at the end of the video.
+    sub_id is the position of the chapter in the description.
+    """
+    df = pd.DataFrame(ret)
+    if df.empty:
+        return df
 
-    # create timedelta object
-    return timedelta(**dd_level)
+    hms = df["s"].str.extract(duration_pattern)
+    invalid = hms[2].isnull()
+    if invalid.any():
+        logger.error(
+            f"cannot parse {invalid.sum():,} times: {df.loc[invalid, 's'].tolist()[:5]}"
+        )
+        df, hms = df[~invalid], hms[~invalid]
 
+    df = df.reset_index(drop=True)
+    start_seconds = hms.fillna(0).astype("int64").to_numpy() @ SECONDS_PER_PART
+    df["start_seconds"] = start_seconds
+    df["start"] = pd.to_timedelta(start_seconds, unit="s")
 
-def find_chapter_locations(video_recs: List[VideoRec], display=False) -> List[dict]:
-    """Find lines in video description that capture time link data.
+    # calculate end time, using next start time of the same video, if available
+    by_vid = df.groupby("video_id", sort=False)
+    next_start = by_vid["start_seconds"].shift(-1)
+    df["end_seconds"] = next_start.fillna(df["video_length"]).astype("int64")
+    df["end"] = pd.to_timedelta(df["end_seconds"], unit="s")
 
-    Example:
-        ⌨️ (0:00:00) Introduction
-        ⌨️ (0:00:34) Colab intro (importing wine dataset)
-    """
-    ret = []
-    for video_rec in video_recs:
-        assert isinstance(video_rec, dict)
-
-        rec_factory = lambda: {
-            "video_id": video_rec["id"],
-            "video_description": video_rec["description"],
-            "video_length": video_rec["length"],
-            "video_end": timedelta(seconds=video_rec["length"]),
-        }
+    # add sub_id per video, before dropping duplicates
+    df["sub_id"] = by_vid.cumcount()
 
-        res = time_pattern.findall(video_rec["description"])
-        if len(res) > 0:
-            if display:
-                print(f"{video_rec['title']=}, \n{res=} \n\n")
+    df = df.sort_values(["start_seconds", "end_seconds"], kind="mergesort")
+    # drop duplicate (start, name) rows
+    df = df.drop_duplicates(subset=["video_id", "name", "start_seconds"])
 
-        for r in res:
-            rec = rec_factory()
-            rec["s"] = r[0]
-            rec["name"] = re.sub(replace_pat, "", r[1]).strip()
-            ret.append(rec)
+    return df
 
-    return ret
 
+async def fetch_by_ids(
+    session, query: str, ids: List[str], chunksize=MAX_IDS_PER_QUERY, **params
+) -> List[Dict[str, Any]]:
+    """Fetch rows of `query` that filters on `= ANY(:ids)`, in chunks of `ids`.
 
-def chapter_locations_to_df(ret: List[dict]) -> pd.DataFrame:
-    """Parse list of chapter locations to pd.DataFrame."""
-    assert isinstance(ret, list), f"{type(ret)=}, should be list"
-    df = pd.DataFrame(ret)
+    usage:
+        rows = await fetch_by_ids(session, TOP_VIDEOS_BY_CHANNEL_IDS_QUERY, channel_ids)
+    """
+    rows: List[Dict[str, Any]] = []
+    for chunk in chunks(list(ids), chunksize):
+        res = await session.execute(text(query), {"ids": chunk, **params})
+        rows += res.mappings().fetchall()
 
-    if df.empty:
-        return df
+    return rows
 
-    df["len"] = df["s"].map(len)
 
-    # prepend a 0 when first item has len 1
-    # df['s'] = np.where(df['len'] == 7, '0' + df['s'], df['s'])
+async def execute_by_ids(
+    session, query: str, ids: List[str], chunksize=MAX_IDS_PER_QUERY, **params
+) -> int:
+    """Execute DML `query` that filters on `= ANY(:ids)`, in chunks of `ids`.
 
-    # todo: dismiss time strings with len >= 9?
-    df["start"] = df.apply(parse_time, axis=1)
-    df["start_seconds"] = df["start"].dt.total_seconds().astype(int)
+    Returns the number of affected rows.
+    """
+    rowcount = 0
+    for chunk in chunks(list(ids), chunksize):
+        res = await session.execute(text(query), {"ids": chunk, **params})
+        rowcount += res.rowcount
 
-    # calculate end time, using next start time, if available
-    by_vid = df.groupby("video_id")
-    df["end"] = by_vid["start"].shift(-1)
-    # make last chapter.end equal to video length
-    df["end"] = np.where(df["end"].isnull(), df["video_end"], df["end"])
-    df["end_seconds"] = df["end"].dt.total_seconds().astype(int)
+    return rowcount
 
-    df = df.sort_values(["start", "end"])
-    # drop duplicate (start, name) rows
-    df = df.drop_duplicates(subset=["video_id", "name", "start"])
 
-    # add sub_id per video
-    df["sub_id"] = by_vid["video_id"].cumcount()
+async def stream_query(
+    asession,
+    query: str,
+    chunksize: int = PSQL_STREAM_CHUNKSIZE,
+    as_arrow: bool = False,
+    **params,
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """Stream rows of `query` through a server-side cursor.
+
+    Yields DataFrames, or Arrow record batches, of at most `chunksize` rows,
+    so the full result never has to fit in memory.
+
+    usage:
+        async for df in stream_query(async_session, TOP_CHANNELS_WITH_COMMENTS_QUERY):
+            ...
+    """
+    async with asession() as session:
+        result = await session.stream(text(query), params)
+        async for partition in result.mappings().partitions(chunksize):
+            yield _rows_to_chunk(partition, as_arrow)
+
+
+async def stream_by_ids(
+    asession,
+    query: str,
+    ids: List[str],
+    chunksize: int = PSQL_STREAM_CHUNKSIZE,
+    as_arrow: bool = False,
+    **params,
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """Stream rows of `query` that filters on `= ANY(:ids)`, see `stream_query`."""
+    for id_chunk in chunks(list(ids), MAX_IDS_PER_QUERY):
+        async for chunk in stream_query(
+            asession,
+            query,
+            chunksize=chunksize,
+            as_arrow=as_arrow,
+            ids=id_chunk,
+            **params,
+        ):
+            yield chunk
+
+
+def _rows_to_chunk(rows, as_arrow: bool) -> Union[pd.DataFrame, pa.RecordBatch]:
+    df = pd.DataFrame(rows)
+    if as_arrow:
+        return pa.RecordBatch.from_pandas(df, preserve_index=False)
 
     return df
 
@@ -148,23 +260,15 @@ def get_all(session, model):
 
 
 async def get_keyword_association_rows_by_ids(asession, video_ids: List[VideoId]):
-    """Get existing video ids.
+    """Get video_keyword_association rows of video ids.
 
     usage:
         kws = loop.run_until_complete(get_keyword_association_rows_by_ids(async_session, df.video_id.to_list()))
     """
-    q = select(Video.id).filter(Video.id.in_(video_ids))
-
     async with asession() as session:
-        video_ids = (await session.execute(q)).scalars().all()
-
-        fmt_ids = "'{0}'".format("', '".join(video_ids))
-        kws = """SELECT * FROM video_keyword_association WHERE video_id IN ({});""".format(
-            fmt_ids
+        kw_rows = await fetch_by_ids(
+            session, KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY, video_ids
         )
-        # logger.info(f"{kws=}")
-
-        kw_rows = (await session.execute(kws)).fetchall()
 
     return kw_rows
 
@@ -183,34 +287,47 @@ async def get_video_ids_by_ids(asession, video_ids: List[VideoId]) -> List[Video
     return video_ids
 
 
-# @cached(ttl=None, cache=cache)
-# , n: Optional[int] = None
-# do not pass `n` parameter, because with caching its faster to query dataframe in memory, through redis
+@cached_frame("top_videos", views=("top_videos",), split_on="channel_id")
 async def get_top_videos_by_channel_ids(
     asession, channel_ids: Optional[List[ChannelId]] = None
 ) -> pd.DataFrame:
-    # ) -> List[dict]:
-    """Get top videos by channel ids."""
-    # todo: I use inner method to only cache `channel_ids`, is there a work around for this?
-    @cached(ttl=None, cache=Cache.REDIS, serializer=PickleSerializer())
-    async def inner(channel_ids=channel_ids):
-        async with asession() as session:
-            query: str = """SELECT * FROM top_videos"""
-            if channel_ids is not None:
-                fmt_ids = "'{0}'".format("', '".join(channel_ids))
-                query += """ WHERE channel_id IN ({})""".format(fmt_ids)
-            # if n is not None:
-            #     query += " LIMIT {}".format(n)
+    """Get top videos by channel ids.
 
-            res = await session.execute(query)
-
-            rows: List[dict] = res.fetchall()
-            logger.info(f"fetched {len(rows):,} rows from db")
-
-        # return rows
-        return pd.DataFrame(rows)
+    Cached per channel in redis, see db/cache.py. Querying the dataframe in
+    memory is faster than passing a limit to the cached query.
+    """
+    async with asession() as session:
+        if channel_ids is None:
+            res = await session.execute(text(TOP_VIDEOS_QUERY))
+            rows = res.mappings().fetchall()
+        else:
+            rows = await fetch_by_ids(
+                session, TOP_VIDEOS_BY_CHANNEL_IDS_QUERY, channel_ids
+            )
+        logger.info(f"fetched {len(rows):,} rows from db")
+
+    return pd.DataFrame(rows)
+
+
+def stream_top_videos_by_channel_ids(
+    asession,
+    channel_ids: Optional[List[ChannelId]] = None,
+    chunksize: int = PSQL_STREAM_CHUNKSIZE,
+    as_arrow: bool = False,
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """Stream top videos by channel ids in chunks, uncached."""
+    if channel_ids is None:
+        return stream_query(
+            asession, TOP_VIDEOS_QUERY, chunksize=chunksize, as_arrow=as_arrow
+        )
 
-    return await inner(channel_ids)
+    return stream_by_ids(
+        asession,
+        TOP_VIDEOS_BY_CHANNEL_IDS_QUERY,
+        channel_ids,
+        chunksize=chunksize,
+        as_arrow=as_arrow,
+    )
 
 
 async def get_videos_by_ids(asession, video_ids: List[VideoId]):
@@ -248,18 +365,77 @@ async def get_videos_by_query(
 
     # uses materialized view `last_videos`, assuming it refreshes on every query_result record insert
     async with asession() as session:
+        res = await session.execute(
+            text(VIDEOS_BY_QUERY_QUERY), {"query": query, "since": since, "n": n}
+        )
+
+        instances = res.mappings().fetchall()
+
+    return instances
+
+
+async def get_videos_by_queries(
+    asession, queries: List[str], maxHoursAgo: int = PSQL_HOURS_AGO, n=200
+) -> List[Dict[str, Any]]:
+    """Get Videos associated with any of `queries` from db, in one round trip.
+
+    Returns at most `n` videos per query, with a `query` column to split them.
+
+    usage:
+        recs = loop.run_until_complete(get_videos_by_queries(async_session, ["python", "rust"]))
+    """
+    maxHoursAgo = min(maxHoursAgo, HOUR_LIMIT)
+    since = datetime.utcnow() - timedelta(hours=maxHoursAgo)
 
-        # todo: this can be done with SQLAlchemy models, raw SQL is not needed
-        query_ = f"SELECT * FROM last_videos WHERE query = '{query}' AND qr_updated > '{since.isoformat()}' LIMIT {n};"
-        # logger.info(f"{query_=}")
+    query_ = text(
+        """
+        SELECT * FROM (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (PARTITION BY query ORDER BY qr_updated DESC) AS rn
+            FROM last_videos
+            WHERE query = ANY(:queries) AND qr_updated > :since
+        ) lv
+        WHERE rn <= :n
+        """
+    )
 
-        res = await session.execute(query_)
+    async with asession() as session:
+        res = await session.execute(
+            query_, {"queries": list(queries), "since": since, "n": n}
+        )
 
         instances = res.mappings().fetchall()
 
     return instances
 
 
+async def get_cached_queries(
+    asession, queries: List[str], maxHoursAgo: int = PSQL_HOURS_AGO
+) -> List[str]:
+    """Get which of `queries` have query results younger than `maxHoursAgo`.
+
+    usage:
+        cached = loop.run_until_complete(get_cached_queries(async_session, search_terms))
+    """
+    maxHoursAgo = min(maxHoursAgo, HOUR_LIMIT)
+    since = datetime.utcnow() - timedelta(hours=maxHoursAgo)
+
+    query_ = text(
+        """
+        SELECT DISTINCT query FROM query_result
+        WHERE query = ANY(:queries) AND updated > :since
+        """
+    )
+
+    async with asession() as session:
+        res = await session.execute(query_, {"queries": list(queries), "since": since})
+
+        cached = res.scalars().fetchall()
+
+    return cached
+
+
 async def get_channels_by_video_ids(
     asession, video_ids: List[str]
 ) -> Dict[ChannelId, Channel]:
@@ -282,6 +458,7 @@ async def get_channels_by_video_ids(
 
 
 # , n: Optional[int] = None
+@read_only
 async def get_top_channels_with_comments(asession, dropna=False) -> pd.DataFrame:
     """Get top channels from materialized view."""
     query = """SELECT * FROM top_channels_with_comments;"""
@@ -300,40 +477,72 @@ async def get_top_channels_with_comments(asession, dropna=False) -> pd.DataFrame
     return df
 
 
+@read_only
+def stream_top_channels_with_comments(
+    asession, chunksize: int = PSQL_STREAM_CHUNKSIZE, as_arrow: bool = False
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """Stream top channels from materialized view in chunks."""
+    return stream_query(
+        asession,
+        TOP_CHANNELS_WITH_COMMENTS_QUERY,
+        chunksize=chunksize,
+        as_arrow=as_arrow,
+    )
+
+
 async def get_comments_by_popularity():
     """Get comments by popularity."""
     raise NotImplementedError
 
 
+@read_only
 async def get_comments_by_video_ids(
-    asession, video_ids: List[str]
+    asession,
+    video_ids: List[str],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
 ) -> List[Dict[str, Any]]:
-    """Get Comments by video_ids."""
-    # q = select(Comment).join(Video).filter(Video.id.in_(video_ids))
-    ids_str = "', '".join(video_ids)
-    q = """ 
-        SELECT 
-            video_channel.name AS vid_channel_name, 
-            video.title AS video_title, 
-            comment.*,
-            comment_channel.name AS com_channel_name
-        FROM video
-        LEFT JOIN channel AS video_channel ON video.channel_id = video_channel.id
-        LEFT JOIN comment ON video.id = comment.video_id
-        LEFT JOIN channel AS comment_channel ON comment.channel_id = comment_channel.id
-        WHERE video.id IN ('{}')
-    """.format(
-        ids_str
-    )
+    """Get Comments by video_ids.
 
+    since, until:   only include comments with `since <= time_parsed < until`,
+                    skips comment partitions outside the window
+    """
     async with asession() as session:
-        res = await session.execute(q)
-
-        instances: List[Dict[str, Any]] = res.mappings().fetchall()
+        instances = await fetch_by_ids(
+            session,
+            COMMENTS_BY_VIDEO_IDS_QUERY,
+            video_ids,
+            **time_window(since, until),
+        )
 
     return instances
 
 
+@read_only
+def stream_comments_by_video_ids(
+    asession,
+    video_ids: List[str],
+    chunksize: int = PSQL_STREAM_CHUNKSIZE,
+    as_arrow: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """Stream Comments by video_ids in chunks, see `get_comments_by_video_ids`.
+
+    usage:
+        async for df in stream_comments_by_video_ids(async_session, video_ids):
+            ...
+    """
+    return stream_by_ids(
+        asession,
+        COMMENTS_BY_VIDEO_IDS_QUERY,
+        video_ids,
+        chunksize=chunksize,
+        as_arrow=as_arrow,
+        **time_window(since, until),
+    )
+
+
 async def get_captions_by_vids(
     asession, video_ids: List[VideoId], maxHoursAgo: int = PSQL_HOURS_AGO
 ):
@@ -352,6 +561,9 @@ async def get_captions_by_vids(
 
         instances = res.scalars().fetchall()
 
+    # so Caption.text() can decode zstd dictionary captions, also of newly trained dictionaries
+    await ensure_dictionaries(asession, [caption.codec for caption in instances])
+
     logger.info(f"using {len(instances)} existing captions")
 
     return instances
@@ -374,13 +586,11 @@ def get_last_query_results(session, query: str, maxHoursAgo: int = PSQL_HOURS_AG
     return list(session.execute(stmt).scalars())
 
 
-def compress_caption(caption: str) -> bytes:
-    """Compress str caption using zlib, saves ~ 50% storage."""
-    assert isinstance(caption, str)
-    return zlib.compress(caption.encode())
+def compress_caption(caption: str, codec: str = CODEC_ZLIB) -> bytes:
+    """Compress str caption with codec tag `codec`, see compression.py."""
+    return encode(caption, codec)
 
 
-def decompress_caption(compr: bytes) -> str:
-    """Decompress str caption using zlib."""
-    assert isinstance(compr, bytes)
-    return zlib.decompress(compr).decode()
+def decompress_caption(compr: bytes, codec: str = CODEC_ZLIB) -> str:
+    """Decompress str caption with codec tag `codec`, Caption.codec of stored captions."""
+    return decode(compr, codec)
@@ -0,0 +1,264 @@
+"""index_audit.py, audit query plans of the db helpers.
+
+Runs `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` over the queries in helpers.py,
+with sample parameters taken from the database itself, and reports every plan
+node: sequential scans, estimated versus actual rows and buffer usage. Also
+lists indexes declared in models.py that do not exist in the database yet,
+see alembic/versions for the migration that adds them.
+
+EXPLAIN ANALYZE executes the query, only SELECT queries are audited, and each
+runs inside a transaction that is rolled back.
+
+usage:
+    ipy -m youtube_recommender.db.index_audit -- --sample-size 100
+    ipy -m youtube_recommender.db.index_audit -- --seq-scans-only
+
+    report = loop.run_until_complete(audit_queries(async_session))
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+from rarc_utils.log import setup_logger
+from sqlalchemy import text
+from youtube_recommender.core.setup import psql_config as psql
+from youtube_recommender.db.engine import get_async_session
+from youtube_recommender.db.helpers import (COMMENTS_BY_VIDEO_IDS_QUERY,
+                                            KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY,
+                                            TOP_VIDEOS_BY_CHANNEL_IDS_QUERY,
+                                            VIDEOS_BY_QUERY_QUERY)
+from youtube_recommender.db.models import Base
+from youtube_recommender.db.partitions import time_window
+
+LOG_FMT = "%(asctime)s - %(module)-16s - %(lineno)-4s - %(funcName)-16s - %(levelname)-7s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+# SQL equivalents of the ORM queries in helpers.py
+CAPTIONS_BY_VIDEO_IDS_QUERY = (
+    "SELECT * FROM caption WHERE video_id = ANY(:video_ids) AND updated > :since"
+)
+LAST_QUERY_RESULTS_QUERY = """
+    SELECT * FROM query_result
+    WHERE query = :query AND updated > :since
+    ORDER BY updated DESC
+"""
+CACHED_QUERIES_QUERY = """
+    SELECT DISTINCT query FROM query_result
+    WHERE query = ANY(:queries) AND updated > :since
+"""
+VIDEO_IDS_BY_CHANNEL_IDS_QUERY = "SELECT id FROM video WHERE channel_id = ANY(:ids)"
+CHANNELS_BY_VIDEO_IDS_QUERY = """
+    SELECT channel.* FROM channel
+    JOIN comment ON channel.id = comment.channel_id
+    JOIN video ON video.id = comment.video_id
+    WHERE comment.video_id = ANY(:ids)
+"""
+
+# name: (query, parameter kind), parameters are sampled by kind, see `sample_params`
+AUDIT_QUERIES: Dict[str, tuple] = {
+    "top_videos_by_channel_ids": (TOP_VIDEOS_BY_CHANNEL_IDS_QUERY, "channel_ids"),
+    "video_ids_by_channel_ids": (VIDEO_IDS_BY_CHANNEL_IDS_QUERY, "channel_ids"),
+    "keyword_associations_by_video_ids": (
+        KEYWORD_ASSOCIATIONS_BY_VIDEO_IDS_QUERY,
+        "video_ids",
+    ),
+    "comments_by_video_ids": (COMMENTS_BY_VIDEO_IDS_QUERY, "video_ids"),
+    "channels_by_video_ids": (CHANNELS_BY_VIDEO_IDS_QUERY, "video_ids"),
+    "captions_by_video_ids": (CAPTIONS_BY_VIDEO_IDS_QUERY, "caption"),
+    "last_query_results": (LAST_QUERY_RESULTS_QUERY, "query"),
+    "cached_queries": (CACHED_QUERIES_QUERY, "queries"),
+    "videos_by_query": (VIDEOS_BY_QUERY_QUERY, "query"),
+}
+
+SAMPLE_CHANNEL_IDS_QUERY = "SELECT id FROM channel ORDER BY updated DESC LIMIT :n"
+SAMPLE_VIDEO_IDS_QUERY = "SELECT id FROM video ORDER BY updated DESC LIMIT :n"
+SAMPLE_QUERIES_QUERY = "SELECT DISTINCT query FROM query_result ORDER BY query LIMIT :n"
+EXISTING_INDEXES_QUERY = "SELECT indexname FROM pg_indexes WHERE schemaname = 'public'"
+
+# a plan node is misestimated when actual and estimated rows differ by this factor
+MISESTIMATE_FACTOR = 10
+
+__all__ = [
+    "AUDIT_QUERIES",
+    "audit_queries",
+    "explain_query",
+    "missing_indexes",
+    "plan_nodes",
+    "sample_params",
+    "seq_scans",
+]
+
+
+async def sample_params(session, sample_size: int = 100) -> Dict[str, Dict[str, Any]]:
+    """Sample query parameters per kind from the database, most recent rows first."""
+    channel_ids = await _scalars(session, SAMPLE_CHANNEL_IDS_QUERY, n=sample_size)
+    video_ids = await _scalars(session, SAMPLE_VIDEO_IDS_QUERY, n=sample_size)
+    queries = await _scalars(session, SAMPLE_QUERIES_QUERY, n=sample_size)
+    # far in the past, so time filters do not hide the scan
+    since = datetime(2000, 1, 1)
+
+    return {
+        "channel_ids": {"ids": channel_ids},
+        "video_ids": {"ids": video_ids, **time_window()},
+        "caption": {"video_ids": video_ids, "since": since},
+        "query": {"query": queries[0] if queries else "", "since": since, "n": 200},
+        "queries": {"queries": queries, "since": since},
+    }
+
+
+async def explain_query(session, query: str, params: Dict[str, Any]) -> dict:
+    """EXPLAIN ANALYZE `query` inside a savepoint, return the JSON plan.
+
+    A failing query only rolls back its savepoint, callers roll back the transaction.
+    """
+    async with session.begin_nested():
+        res = await session.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), params
+        )
+        value = res.scalar_one()
+
+    (plan,) = json.loads(value) if isinstance(value, str) else value
+
+    return plan
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    """Walk plan nodes depth first."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def audit_queries(
+    asession,
+    queries: Optional[Dict[str, tuple]] = None,
+    sample_size: int = 100,
+) -> pd.DataFrame:
+    """Explain `queries` and report one row per plan node.
+
+    usage:
+        report = loop.run_until_complete(audit_queries(async_session))
+        seq_scans(report)
+    """
+    queries = queries or AUDIT_QUERIES
+    recs: List[Dict[str, Any]] = []
+
+    async with asession() as session:
+        params = await sample_params(session, sample_size)
+
+        for name, (query, kind) in queries.items():
+            try:
+                explained = await explain_query(session, query, params[kind])
+            except Exception as e:
+                logger.error(f"cannot explain {name=}: {e}")
+                continue
+
+            root = explained["Plan"]
+            for node in plan_nodes(root):
+                recs.append(
+                    {
+                        "query": name,
+                        "node_type": node["Node Type"],
+                        "relation": node.get("Relation Name"),
+                        "index": node.get("Index Name"),
+                        "plan_rows": node.get("Plan Rows"),
+                        "actual_rows": node.get("Actual Rows"),
+                        "shared_hit": node.get("Shared Hit Blocks"),
+                        "shared_read": node.get("Shared Read Blocks"),
+                        "total_ms": node.get("Actual Total Time"),
+                        "execution_ms": explained.get("Execution Time"),
+                    }
+                )
+
+        await session.rollback()
+
+    report = pd.DataFrame(recs)
+    if report.empty:
+        return report
+
+    ratio = (report["actual_rows"] + 1) / (report["plan_rows"] + 1)
+    report["misestimated"] = (ratio > MISESTIMATE_FACTOR) | (
+        ratio < 1 / MISESTIMATE_FACTOR
+    )
+
+    return report
+
+
+def seq_scans(report: pd.DataFrame) -> pd.DataFrame:
+    """Sequential scans over tables in an audit report, most blocks read first."""
+    if report.empty:
+        return report
+
+    scans = report[report["node_type"] == "Seq Scan"]
+    blocks = scans["shared_hit"].fillna(0) + scans["shared_read"].fillna(0)
+
+    return scans.assign(blocks=blocks).sort_values("blocks", ascending=False)
+
+
+async def missing_indexes(asession) -> List[str]:
+    """Indexes declared in models.py that do not exist in the database."""
+    declared = [
+        index.name
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+    ]
+    async with asession() as session:
+        existing = set(await _scalars(session, EXISTING_INDEXES_QUERY))
+
+    return [name for name in declared if name not in existing]
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+async def _scalars(session, query: str, **params) -> List[Any]:
+    res = await session.execute(text(query), params)
+    return list(res.scalars().fetchall())
+
+
+CLI = argparse.ArgumentParser()
+CLI.add_argument(
+    "--sample-size",
+    type=int,
+    default=100,
+    help="number of sampled ids passed to queries that filter on ids",
+)
+CLI.add_argument(
+    "--seq-scans-only",
+    action="store_true",
+    default=False,
+    help="only report sequential scans",
+)
+
+if __name__ == "__main__":
+    args = CLI.parse_args()
+
+    logger = setup_logger(
+        cmdLevel=logging.INFO, saveFile=0, savePandas=0, color=1, fmt=LOG_FMT
+    )
+
+    async_session = get_async_session(psql)
+    loop = asyncio.new_event_loop()
+
+    report = loop.run_until_complete(
+        audit_queries(async_session, sample_size=args.sample_size)
+    )
+    if args.seq_scans_only:
+        report = seq_scans(report)
+
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(report)
+
+    missing = loop.run_until_complete(missing_indexes(async_session))
+    if missing:
+        logger.warning(
+            f"indexes missing from database, run `alembic upgrade head`: {missing}"
+        )
@@ -51,8 +51,11 @@ Get last videos:
     or query materialized view vw_last_videos:
         select * from vw_last_videos limit 5;
 
-Refresh and show any materialized view:
-    REFRESH MATERIALIZED VIEW last_messages;
+Channel aggregates live in table channel_summary, updated by the push pipeline. Backfill it once with:
+    ipy -m youtube_recommender.db.db_methods -- --rebuild-summary
+
+Refresh and show any materialized view (CONCURRENTLY does not block readers, needs a unique index):
+    REFRESH MATERIALIZED VIEW CONCURRENTLY last_messages;
     SELECT * FROM last_messages;
 
 Show materialized views using:
@@ -70,14 +73,18 @@ from rarc_utils.log import (LOG_FMT, loggingLevelNames, set_log_level,
 from rarc_utils.misc import trunc_msg
 from rarc_utils.sqlalchemy_base import (UtilityBase, async_main, get_async_db,
                                         get_async_session, get_session)
-from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Integer,
-                        Interval, LargeBinary, String, UniqueConstraint, func)
+from sqlalchemy import (DDL, BigInteger, Boolean, Column, DateTime, Float,
+                        ForeignKey, Index, Integer, Interval, LargeBinary,
+                        String, UniqueConstraint, event, func)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Table
 # from youtube_recommender import config as config_dir
 from youtube_recommender.core.setup import psql_config as psql
+from youtube_recommender.db.compression import decode
+from youtube_recommender.db.partitions import (CREATE_DEFAULT_PARTITION_QUERY,
+                                               DEFAULT_COMMENT_PARTITION)
 
 Base = declarative_base()
 
@@ -93,7 +100,7 @@ video_keyword_association = Table(
     "video_keyword_association",
     Base.metadata,
     Column("video_id", String, ForeignKey("video.id")),
-    Column("keyword_id", Integer, ForeignKey("keyword.id")),
+    Column("keyword_id", Integer, ForeignKey("keyword.id"), index=True),
     UniqueConstraint("video_id", "keyword_id"),
 )
 
@@ -102,7 +109,7 @@ query_video_association = Table(
     "query_video_association",
     Base.metadata,
     Column("query_result_id", UUID(as_uuid=True), ForeignKey("query_result.id")),
-    Column("video_id", String, ForeignKey("video.id")),
+    Column("video_id", String, ForeignKey("video.id"), index=True),
     UniqueConstraint("query_result_id", "video_id"),
 )
 
@@ -174,14 +181,17 @@ class Video(Base, UtilityBase):
     thumbnail_url = Column(String, nullable=True, unique=False)
     is_educational = Column(Boolean)
 
-    channel_id = Column(String, ForeignKey("channel.id"), nullable=False)
+    channel_id = Column(String, ForeignKey("channel.id"), nullable=False, index=True)
     channel = relationship("Channel", uselist=False, lazy="selectin")
 
     chapters = relationship("Chapter", uselist=True, lazy="selectin")
     # back_populates="video"
 
     created = Column(DateTime, server_default=func.now())  # current_timestamp()
-    updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # index: view last_videos orders by last update
+    updated = Column(
+        DateTime, server_default=func.now(), onupdate=func.now(), index=True
+    )
 
     # add this so that it can be accessed
     __mapper_args__ = {"eager_defaults": True}
@@ -217,7 +227,7 @@ class Chapter(Base, UtilityBase):
 
     # unique or not? are authors allowed to make mistakes in this?
     name = Column(String, nullable=False, unique=False)
-    video_id = Column(String, ForeignKey("video.id"), nullable=False)
+    video_id = Column(String, ForeignKey("video.id"), nullable=False, index=True)
     video = relationship("Video", uselist=False, lazy="selectin")
 
     raw_str = Column(String, nullable=False)
@@ -319,22 +329,64 @@ class Channel(Base, UtilityBase):
         return self.as_dict()
 
 
+class ChannelSummary(Base, UtilityBase):
+    """ChannelSummary: video and comment aggregates per Channel.
+
+    Kept up to date by the push pipeline for the channels it touches, see db/summary.py,
+    so the dashboard never waits for a full refresh over the comment table.
+    """
+
+    __tablename__ = "channel_summary"
+    channel_id = Column(String, ForeignKey("channel.id"), primary_key=True)
+    channel_name = Column(String, nullable=False, unique=False)
+    video_count = Column(Integer, nullable=False, default=0)
+    total_views = Column(BigInteger, nullable=False, default=0)
+    comment_count = Column(Integer, nullable=False, default=0)
+    # last update of any video of the channel
+    last_updated = Column(DateTime)
+
+    updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    # add this so that it can be accessed
+    __mapper_args__ = {"eager_defaults": True}
+
+    def __repr__(self):
+        return "ChannelSummary(channel_name={}, video_count={:,}, total_views={:,}, comment_count={:,})".format(
+            self.channel_name,
+            self.video_count,
+            self.total_views,
+            self.comment_count,
+        )
+
+    def as_dict(self) -> dict:
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    def json(self) -> dict:
+        return self.as_dict()
+
+
 class Comment(Base, UtilityBase):
-    """Comment: YouTube comments."""
+    """Comment: YouTube comments.
+
+    Range partitioned by time_parsed, one partition per year, see db/partitions.py.
+    The partition key has to be part of the primary key.
+    """
 
     __tablename__ = "comment"
+    __table_args__ = {"postgresql_partition_by": "RANGE (time_parsed)"}
+
     id = Column(String, primary_key=True)
     text = Column(String, nullable=False, unique=False)
     votes = Column(Integer, nullable=False)
 
     # channel also represents a user
-    channel_id = Column(String, ForeignKey("channel.id"), nullable=False)
+    channel_id = Column(String, ForeignKey("channel.id"), nullable=False, index=True)
     channel = relationship("Channel", uselist=False, lazy="selectin")
 
-    video_id = Column(String, ForeignKey("video.id"), nullable=False)
+    video_id = Column(String, ForeignKey("video.id"), nullable=False, index=True)
     video = relationship("Video", uselist=False, lazy="selectin")
 
-    time_parsed = Column(DateTime)
+    time_parsed = Column(DateTime, primary_key=True)
     created = Column(DateTime, server_default=func.now())  # current_timestamp()
     updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -359,6 +411,18 @@ class Comment(Base, UtilityBase):
         return self.as_dict()
 
 
+# rows outside the yearly partitions land here, yearly partitions are created by the push path
+event.listen(
+    Comment.__table__,
+    "after_create",
+    DDL(
+        CREATE_DEFAULT_PARTITION_QUERY.format(
+            name=DEFAULT_COMMENT_PARTITION, table="comment"
+        )
+    ),
+)
+
+
 class Keyword(Base, UtilityBase):
     """Keyword: every Video can contain keywords, set by the author."""
 
@@ -385,6 +449,9 @@ class Caption(Base, UtilityBase):
     """Caption: contains compressed captions in Bytes for YouTube videos."""
 
     __tablename__ = "caption"
+    # cache lookups filter on video_id and updated, see helpers.get_captions_by_vids
+    __table_args__ = (Index("ix_caption_video_id_updated", "video_id", "updated"),)
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
     video_id = Column(String, ForeignKey("video.id"), nullable=False)
@@ -393,6 +460,8 @@ class Caption(Base, UtilityBase):
     length = Column(Integer, nullable=False)
     compr = Column(LargeBinary, nullable=False)
     compr_length = Column(Integer, nullable=False)
+    # codec tag of compr: zlib, zstd or zstd:<dictionary id>, see db/compression.py
+    codec = Column(String, nullable=False, default="zlib", server_default="zlib")
     lang = Column(String, nullable=False)
 
     created = Column(DateTime, server_default=func.now())  # current_timestamp()
@@ -413,6 +482,33 @@ class Caption(Base, UtilityBase):
     def compr_pct(self) -> float:
         return self.compr_length / self.length
 
+    def text(self) -> str:
+        """Decompress caption, zstd dictionaries are loaded by `get_captions_by_vids`."""
+        return decode(self.compr, self.codec)
+
+    def as_dict(self) -> dict:
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    def json(self) -> dict:
+        return self.as_dict()
+
+
+class CaptionDictionary(Base, UtilityBase):
+    """CaptionDictionary: zstd dictionary trained on captions, referenced by Caption.codec."""
+
+    __tablename__ = "caption_dictionary"
+    # dictionary id stored in the zstd frames it compressed
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    num_samples = Column(Integer, nullable=False)
+
+    created = Column(DateTime, server_default=func.now())  # current_timestamp()
+
+    def __repr__(self):
+        return "CaptionDictionary(id={}, size={:_}, num_samples={:_})".format(
+            self.id, len(self.data), self.num_samples
+        )
+
     def as_dict(self) -> dict:
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
@@ -473,6 +569,9 @@ class queryResult(Base, UtilityBase):
     """
 
     __tablename__ = "query_result"
+    # cache lookups filter on query and updated, see helpers.get_last_query_results
+    __table_args__ = (Index("ix_query_result_query_updated", "query", "updated"),)
+
     id = Column(
         UUID(as_uuid=True),
         primary_key=True,
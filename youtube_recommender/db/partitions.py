@@ -0,0 +1,199 @@
+"""partitions.py, yearly range partitions of the comment table.
+
+`comment` is partitioned by `time_parsed`, one partition per year plus a
+default partition. Partitions are created on demand by the push path, old
+ones can be detached without rewriting the table. Rows that landed in the
+default partition, e.g. inserted outside the push path, are moved to the
+yearly partition when it is created. Queries that bound
+`time_parsed` only scan the partitions in their window, see `time_window`.
+
+usage:
+    async with bulk_connection(async_session) as conn:
+        await ensure_comment_partitions(conn, df["time_parsed"])
+        ...
+        await detach_comment_partition(conn, 2012)
+
+    rows = loop.run_until_complete(get_comments_by_video_ids(async_session, video_ids, **time_window(since=datetime(2021, 1, 1))))
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg  # type: ignore[import]
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COMMENT_TABLE = "comment"
+DEFAULT_COMMENT_PARTITION = "comment_default"
+# bounds of an unbounded time window, timestamp columns cannot hold datetime.min / max
+MIN_TIME = datetime(1970, 1, 1)
+MAX_TIME = datetime(9999, 1, 1)
+
+PARTITIONS_QUERY = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = $1
+"""
+CREATE_PARTITION_QUERY = """
+    CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+    FOR VALUES FROM ('{start}') TO ('{end}')
+"""
+CREATE_DEFAULT_PARTITION_QUERY = (
+    "CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} DEFAULT"
+)
+DETACH_PARTITION_QUERY = "ALTER TABLE {table} DETACH PARTITION {name}{concurrently}"
+ATTACH_DEFAULT_PARTITION_QUERY = "ALTER TABLE {table} ATTACH PARTITION {name} DEFAULT"
+DEFAULT_PARTITION_HAS_ROWS_QUERY = """
+    SELECT EXISTS (
+        SELECT 1 FROM {name} WHERE time_parsed >= $1 AND time_parsed < $2
+    )
+"""
+# the default partition is detached meanwhile, so moved rows are routed to the new partition
+MOVE_FROM_DEFAULT_PARTITION_QUERY = """
+    WITH moved AS (
+        DELETE FROM {name} WHERE time_parsed >= $1 AND time_parsed < $2
+        RETURNING *
+    )
+    INSERT INTO {table} SELECT * FROM moved
+"""
+
+__all__ = [
+    "comment_partition_name",
+    "comment_partition_bounds",
+    "create_comment_partition_sql",
+    "create_comment_partition",
+    "ensure_comment_partitions",
+    "detach_comment_partition",
+    "time_window",
+]
+
+
+def comment_partition_name(year: int) -> str:
+    """Name of the partition holding comments of `year`."""
+    return f"{COMMENT_TABLE}_y{year}"
+
+
+def comment_partition_bounds(year: int) -> Tuple[datetime, datetime]:
+    """Inclusive start and exclusive end of the partition of `year`."""
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+def create_comment_partition_sql(year: int) -> str:
+    """DDL creating the partition of `year`, if it does not exist."""
+    start, end = comment_partition_bounds(year)
+    return CREATE_PARTITION_QUERY.format(
+        name=comment_partition_name(year),
+        table=COMMENT_TABLE,
+        start=start.isoformat(),
+        end=end.isoformat(),
+    )
+
+
+async def ensure_comment_partitions(
+    conn: asyncpg.Connection, times: Iterable[datetime]
+) -> List[str]:
+    """Create missing partitions for the years in `times`, return names of created partitions.
+
+    Existing partitions are looked up first, so the common case takes no lock on `comment`.
+    PostgreSQL refuses to create a partition while the default partition holds
+    rows of its range, those rows are moved into the new partition, see
+    `create_comment_partition`.
+    """
+    years = {ts.year for ts in pd.to_datetime(pd.Series(list(times))).dropna()}
+    rows = await conn.fetch(PARTITIONS_QUERY, COMMENT_TABLE)
+    existing = {row["relname"] for row in rows}
+
+    created = []
+    for year in sorted(years):
+        name = comment_partition_name(year)
+        if name in existing:
+            continue
+
+        await create_comment_partition(
+            conn, year, has_default=DEFAULT_COMMENT_PARTITION in existing
+        )
+        created.append(name)
+
+    if created:
+        logger.info(f"created comment partitions: {created}")
+
+    return created
+
+
+async def create_comment_partition(
+    conn: asyncpg.Connection, year: int, has_default: bool = True
+) -> int:
+    """Create the partition of `year`, return the number of rows moved into it from the default partition.
+
+    Moving detaches the default partition until the end of the statement
+    sequence, run inside a transaction so other sessions never see it missing.
+    """
+    if not has_default:
+        await conn.execute(create_comment_partition_sql(year))
+        return 0
+
+    start, end = comment_partition_bounds(year)
+    has_rows = await conn.fetchval(
+        DEFAULT_PARTITION_HAS_ROWS_QUERY.format(name=DEFAULT_COMMENT_PARTITION),
+        start,
+        end,
+    )
+    if not has_rows:
+        await conn.execute(create_comment_partition_sql(year))
+        return 0
+
+    await conn.execute(
+        DETACH_PARTITION_QUERY.format(
+            table=COMMENT_TABLE, name=DEFAULT_COMMENT_PARTITION, concurrently=""
+        )
+    )
+    await conn.execute(create_comment_partition_sql(year))
+    status = await conn.execute(
+        MOVE_FROM_DEFAULT_PARTITION_QUERY.format(
+            table=COMMENT_TABLE, name=DEFAULT_COMMENT_PARTITION
+        ),
+        start,
+        end,
+    )
+    await conn.execute(
+        ATTACH_DEFAULT_PARTITION_QUERY.format(
+            table=COMMENT_TABLE, name=DEFAULT_COMMENT_PARTITION
+        )
+    )
+    nrow = int(status.split()[-1])
+    logger.info(
+        f"moved {nrow:,} rows from {DEFAULT_COMMENT_PARTITION} to {comment_partition_name(year)}"
+    )
+
+    return nrow
+
+
+async def detach_comment_partition(
+    conn: asyncpg.Connection, year: int, concurrently: bool = False
+) -> str:
+    """Detach the partition of `year` from `comment`, it stays available as plain table.
+
+    concurrently:   do not block readers and writers, PostgreSQL 14+, cannot run inside a transaction
+    """
+    name = comment_partition_name(year)
+    await conn.execute(
+        DETACH_PARTITION_QUERY.format(
+            table=COMMENT_TABLE,
+            name=name,
+            concurrently=" CONCURRENTLY" if concurrently else "",
+        )
+    )
+    logger.info(f"detached {name}")
+
+    return name
+
+
+def time_window(
+    since: Optional[datetime] = None, until: Optional[datetime] = None
+) -> Dict[str, datetime]:
+    """Bind parameters `since` and `until` of queries that prune comment partitions."""
+    return {"since": since or MIN_TIME, "until": until or MAX_TIME}
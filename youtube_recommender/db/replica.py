@@ -0,0 +1,207 @@
+"""replica.py, route read-only helpers to a read replica.
+
+Set REPLICA_PG_HOST, and optionally the other REPLICA_PG_* variables, to enable
+a replica, see core/config.py. Helpers decorated with `read_only` then run on
+the replica when they receive the default session factory of the primary, as
+long as the replica lags less than `max_lag` seconds behind. When the replica
+lags, is unreachable or drops the connection, the helper runs on the primary.
+
+A failed read is retried on the primary, so only decorate helpers that do not write.
+
+usage:
+    @read_only
+    async def get_top_channels_with_comments(asession, dropna=False):
+        ...
+
+    # sync dataset builders
+    s = get_read_session()()
+"""
+
+import functools
+import inspect
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from ..core.setup import psql_replica_config
+from ..settings import PSQL_REPLICA_CHECK_INTERVAL, PSQL_REPLICA_MAX_LAG
+from .engine import (get_async_engine, get_async_session, get_engine,
+                     get_session)
+
+logger = logging.getLogger(__name__)
+
+# 0 on a primary, or on a replica that replayed all WAL it received
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+            'Infinity'
+        )
+    END
+"""
+# errors after which a read is retried on the primary
+REPLICA_ERRORS = (OSError, OperationalError, InterfaceError)
+
+# last measured replica lag in seconds, and the monotonic time it was measured
+_lag: Dict[str, float] = {"seconds": math.inf, "checked": -math.inf}
+
+__all__ = [
+    "read_only",
+    "route_read",
+    "replica_lag",
+    "replica_lag_sync",
+    "get_read_session",
+]
+
+
+def read_only(
+    func: Optional[Callable] = None, *, max_lag: float = PSQL_REPLICA_MAX_LAG
+):
+    """Run helper `func(asession, ...)` on the replica, falling back to the primary.
+
+    Works on coroutine functions and on functions returning an async iterator,
+    a stream is only retried on the primary when it failed before its first chunk.
+
+    usage:
+        @read_only
+        async def get_comments_by_video_ids(asession, video_ids):
+            ...
+
+        @read_only(max_lag=5)
+        def stream_comments_by_video_ids(asession, video_ids):
+            ...
+    """
+    if func is None:
+        return functools.partial(read_only, max_lag=max_lag)
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(asession, *args, **kwargs):
+            routed = await route_read(asession, max_lag)
+            if routed is asession:
+                return await func(asession, *args, **kwargs)
+
+            try:
+                return await func(routed, *args, **kwargs)
+            except REPLICA_ERRORS as e:
+                _mark_unavailable(e)
+                return await func(asession, *args, **kwargs)
+
+        return wrapper
+
+    @functools.wraps(func)
+    async def stream_wrapper(asession, *args, **kwargs):
+        routed = await route_read(asession, max_lag)
+        started = False
+        try:
+            async for chunk in func(routed, *args, **kwargs):
+                started = True
+                yield chunk
+        except REPLICA_ERRORS as e:
+            if routed is asession or started:
+                raise
+
+            _mark_unavailable(e)
+            async for chunk in func(asession, *args, **kwargs):
+                yield chunk
+
+    return stream_wrapper
+
+
+async def route_read(asession, max_lag: float = PSQL_REPLICA_MAX_LAG):
+    """Session factory a read should use, the replica when `asession` is the default primary and the replica is fresh enough.
+
+    Session factories of other databases are returned as is.
+    """
+    if psql_replica_config is None or not _is_primary(asession):
+        return asession
+
+    if await replica_lag() > max_lag:
+        return asession
+
+    return get_async_session(psql_replica_config)
+
+
+async def replica_lag() -> float:
+    """Seconds the replica is behind the primary, infinite when unreachable or not configured.
+
+    Measured at most once every PSQL_REPLICA_CHECK_INTERVAL seconds.
+    """
+    if psql_replica_config is None:
+        return math.inf
+
+    if _fresh():
+        return _lag["seconds"]
+
+    try:
+        async with get_async_engine(psql_replica_config).connect() as conn:
+            res = await conn.execute(text(REPLICA_LAG_QUERY))
+            seconds = res.scalar()
+    except REPLICA_ERRORS as e:
+        _mark_unavailable(e)
+        return math.inf
+
+    return _remember(seconds)
+
+
+def replica_lag_sync() -> float:
+    """Seconds the replica is behind the primary, see `replica_lag`."""
+    if psql_replica_config is None:
+        return math.inf
+
+    if _fresh():
+        return _lag["seconds"]
+
+    try:
+        with get_engine(psql_replica_config).connect() as conn:
+            seconds = conn.execute(text(REPLICA_LAG_QUERY)).scalar()
+    except REPLICA_ERRORS as e:
+        _mark_unavailable(e)
+        return math.inf
+
+    return _remember(seconds)
+
+
+def get_read_session(max_lag: float = PSQL_REPLICA_MAX_LAG) -> sessionmaker:
+    """Sync session factory for read-only work, the replica when it is fresh enough, else the primary.
+
+    Queries are not retried, the replica is only checked once here.
+    """
+    if replica_lag_sync() <= max_lag:
+        return get_session(psql_replica_config)
+
+    return get_session()
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _is_primary(asession: Any) -> bool:
+    return getattr(asession, "kw", {}).get("bind") is get_async_engine()
+
+
+def _fresh() -> bool:
+    return time.monotonic() - _lag["checked"] < PSQL_REPLICA_CHECK_INTERVAL
+
+
+def _remember(seconds: Optional[float]) -> float:
+    seconds = math.inf if seconds is None else float(seconds)
+    _lag.update(seconds=seconds, checked=time.monotonic())
+    logger.debug(f"replica lag: {seconds:.1f}s")
+
+    return seconds
+
+
+def _mark_unavailable(e: Exception) -> None:
+    logger.warning(f"replica unavailable, reading from primary: {e}")
+    _remember(math.inf)
@@ -0,0 +1,259 @@
+"""summary.py, incremental maintenance of the channel_summary table.
+
+Instead of refreshing a materialized view over all videos and comments, the
+push pipeline adds the changes of each batch to the summary rows of the
+channels it touched, inside its own transaction: a new video adds to
+video_count, a changed view count adds its difference, a new comment adds to
+comment_count. The cost depends on the batch, not on the size of a channel.
+The view `top_channels_with_comments` reads from this table, see views.sql.
+
+Deltas assume the summary was exact before the batch, backfill it once, and
+repair it after manual edits, with the exact recompute `rebuild_channel_summary`.
+
+usage:
+    async with bulk_connection(async_session) as conn:
+        old = await lock_video_stats(conn, vdf["id"])
+        rows = await upsert_videos(conn, vdf, returning=VIDEO_DELTA_COLUMNS)
+        await add_video_deltas(conn, old, rows)
+
+        rows = await upsert_comments(conn, df, returning=COMMENT_DELTA_COLUMNS)
+        await add_comment_deltas(conn, rows)
+
+    # backfill, or repair after manual edits
+    ipy -m youtube_recommender.db.db_methods -- --rebuild-summary
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import asyncpg  # type: ignore[import]
+
+from ..core.types import ChannelId, VideoId
+from .bulk import INSERTED
+
+logger = logging.getLogger(__name__)
+
+# columns `upsert_videos` and `upsert_comments` return for the deltas
+VIDEO_DELTA_COLUMNS = ("id", "channel_id", "views", "updated", INSERTED)
+COMMENT_DELTA_COLUMNS = ("video_id", INSERTED)
+
+# channel and views of videos before they are upserted, locked until commit
+LOCK_VIDEO_STATS_QUERY = """
+    SELECT id, channel_id, views FROM video
+    WHERE id = ANY($1::varchar[])
+    ORDER BY id
+    FOR UPDATE
+"""
+# add per channel deltas, channels without a summary row get one
+ADD_VIDEO_DELTAS_QUERY = """
+    INSERT INTO channel_summary
+        (channel_id, channel_name, video_count, total_views, comment_count, last_updated, updated)
+    SELECT d.channel_id, channel.name, d.video_count, d.total_views, 0, d.last_updated, now()
+    FROM unnest($1::varchar[], $2::int[], $3::bigint[], $4::timestamp[])
+        AS d(channel_id, video_count, total_views, last_updated)
+    INNER JOIN channel ON channel.id = d.channel_id
+    ORDER BY d.channel_id
+    ON CONFLICT (channel_id) DO UPDATE SET
+        channel_name = EXCLUDED.channel_name,
+        video_count = channel_summary.video_count + EXCLUDED.video_count,
+        total_views = channel_summary.total_views + EXCLUDED.total_views,
+        last_updated = GREATEST(channel_summary.last_updated, EXCLUDED.last_updated),
+        updated = EXCLUDED.updated
+"""
+# count new comments per channel of their video, only the videos of the batch are read
+ADD_COMMENT_DELTAS_QUERY = """
+    UPDATE channel_summary SET
+        comment_count = channel_summary.comment_count + d.comment_count,
+        updated = now()
+    FROM (
+        SELECT video.channel_id, COUNT(*) AS comment_count
+        FROM unnest($1::varchar[]) AS c(video_id)
+        INNER JOIN video ON video.id = c.video_id
+        GROUP BY video.channel_id
+    ) d
+    WHERE channel_summary.channel_id = d.channel_id
+"""
+# channels whose last video moved to another channel
+DELETE_DRAINED_CHANNEL_SUMMARY_QUERY = """
+    DELETE FROM channel_summary
+    WHERE channel_id = ANY($1::varchar[]) AND video_count <= 0
+"""
+# aggregates of channels in `$1`, channels without videos are left out
+UPSERT_CHANNEL_SUMMARY_QUERY = """
+    INSERT INTO channel_summary
+        (channel_id, channel_name, video_count, total_views, comment_count, last_updated, updated)
+    SELECT
+        channel.id,
+        channel.name,
+        v.video_count,
+        v.total_views,
+        COALESCE(c.comment_count, 0),
+        v.last_updated,
+        now()
+    FROM channel
+    INNER JOIN (
+        SELECT
+            channel_id,
+            COUNT(*) AS video_count,
+            COALESCE(SUM(views), 0) AS total_views,
+            MAX(updated) AS last_updated
+        FROM video
+        WHERE channel_id = ANY($1::varchar[])
+        GROUP BY channel_id
+    ) v ON v.channel_id = channel.id
+    LEFT JOIN (
+        SELECT video.channel_id, COUNT(*) AS comment_count
+        FROM comment
+        INNER JOIN video ON video.id = comment.video_id
+        WHERE video.channel_id = ANY($1::varchar[])
+        GROUP BY video.channel_id
+    ) c ON c.channel_id = channel.id
+    ON CONFLICT (channel_id) DO UPDATE SET
+        channel_name = EXCLUDED.channel_name,
+        video_count = EXCLUDED.video_count,
+        total_views = EXCLUDED.total_views,
+        comment_count = EXCLUDED.comment_count,
+        last_updated = EXCLUDED.last_updated,
+        updated = EXCLUDED.updated
+"""
+# channels whose last video was deleted
+DELETE_EMPTY_CHANNEL_SUMMARY_QUERY = """
+    DELETE FROM channel_summary
+    WHERE channel_id = ANY($1::varchar[])
+        AND NOT EXISTS (SELECT 1 FROM video WHERE video.channel_id = channel_summary.channel_id)
+"""
+ALL_CHANNEL_IDS_WITH_VIDEOS_QUERY = "SELECT DISTINCT channel_id FROM video"
+DELETE_OTHER_CHANNEL_SUMMARY_QUERY = (
+    "DELETE FROM channel_summary WHERE NOT channel_id = ANY($1::varchar[])"
+)
+
+VideoStats = Dict[VideoId, Tuple[ChannelId, int]]
+
+__all__ = [
+    "VIDEO_DELTA_COLUMNS",
+    "COMMENT_DELTA_COLUMNS",
+    "lock_video_stats",
+    "add_video_deltas",
+    "add_comment_deltas",
+    "refresh_channel_summary",
+    "rebuild_channel_summary",
+]
+
+
+async def lock_video_stats(
+    conn: asyncpg.Connection, video_ids: Iterable[VideoId]
+) -> VideoStats:
+    """Lock existing videos of `video_ids` until commit, return their channel and views.
+
+    Call before upserting the videos, `add_video_deltas` subtracts these values.
+    """
+    rows = await conn.fetch(LOCK_VIDEO_STATS_QUERY, list(set(video_ids)))
+
+    return {row["id"]: (row["channel_id"], row["views"] or 0) for row in rows}
+
+
+async def add_video_deltas(
+    conn: asyncpg.Connection, old: VideoStats, rows: Sequence[asyncpg.Record]
+) -> int:
+    """Add changes of upserted videos to channel_summary, return number of channels.
+
+    old:    stats before the upsert, from `lock_video_stats`
+    rows:   upserted videos with VIDEO_DELTA_COLUMNS
+    """
+    deltas = video_deltas(old, rows)
+    if not deltas:
+        return 0
+
+    channel_ids = sorted(deltas)
+    await conn.execute(
+        ADD_VIDEO_DELTAS_QUERY,
+        channel_ids,
+        [deltas[c][0] for c in channel_ids],
+        [deltas[c][1] for c in channel_ids],
+        [deltas[c][2] for c in channel_ids],
+    )
+    await conn.execute(DELETE_DRAINED_CHANNEL_SUMMARY_QUERY, channel_ids)
+    logger.debug(f"added video deltas to summary of {len(channel_ids):,} channels")
+
+    return len(channel_ids)
+
+
+async def add_comment_deltas(
+    conn: asyncpg.Connection, rows: Sequence[asyncpg.Record]
+) -> int:
+    """Count inserted comments in channel_summary, return number of new comments.
+
+    rows:   upserted comments with COMMENT_DELTA_COLUMNS, updated comments are not counted
+    """
+    video_ids = [row["video_id"] for row in rows if row[INSERTED]]
+    if video_ids:
+        await conn.execute(ADD_COMMENT_DELTAS_QUERY, video_ids)
+        logger.debug(f"added {len(video_ids):,} new comments to summary")
+
+    return len(video_ids)
+
+
+def video_deltas(
+    old: VideoStats, rows: Sequence[asyncpg.Record]
+) -> Dict[ChannelId, Tuple[int, int, datetime]]:
+    """Changes of video_count and total_views per channel, with its last updated video."""
+    counts: Dict[ChannelId, int] = defaultdict(int)
+    views: Dict[ChannelId, int] = defaultdict(int)
+    last_updated: Dict[ChannelId, datetime] = {}
+
+    for row in rows:
+        channel_id, nview = row["channel_id"], row["views"] or 0
+        if row[INSERTED]:
+            counts[channel_id] += 1
+            views[channel_id] += nview
+        elif row["id"] in old:
+            old_channel_id, old_nview = old[row["id"]]
+            counts[old_channel_id] -= 1
+            views[old_channel_id] -= old_nview
+            counts[channel_id] += 1
+            views[channel_id] += nview
+        # else: inserted by a concurrent push after `lock_video_stats`, which counted it
+
+        if channel_id not in last_updated or row["updated"] > last_updated[channel_id]:
+            last_updated[channel_id] = row["updated"]
+
+    return {
+        channel_id: (
+            counts[channel_id],
+            views[channel_id],
+            last_updated.get(channel_id),
+        )
+        for channel_id in sorted(counts.keys() | last_updated.keys())
+    }
+
+
+async def refresh_channel_summary(
+    conn: asyncpg.Connection, channel_ids: Sequence[ChannelId]
+) -> int:
+    """Recompute channel_summary rows of `channel_ids`, return number of rows written.
+
+    Exact but slow for large channels: scans all their videos and comments.
+    """
+    channel_ids = list(set(channel_ids))
+    if not channel_ids:
+        return 0
+
+    await conn.execute(DELETE_EMPTY_CHANNEL_SUMMARY_QUERY, channel_ids)
+    status = await conn.execute(UPSERT_CHANNEL_SUMMARY_QUERY, channel_ids)
+    nrow = int(status.split()[-1])
+    logger.debug(f"refreshed summary of {nrow:,} channels")
+
+    return nrow
+
+
+async def rebuild_channel_summary(conn: asyncpg.Connection) -> int:
+    """Recompute channel_summary for all channels, slow: scans all comments."""
+    rows = await conn.fetch(ALL_CHANNEL_IDS_WITH_VIDEOS_QUERY)
+    channel_ids: List[ChannelId] = [row["channel_id"] for row in rows]
+    await conn.execute(DELETE_OTHER_CHANNEL_SUMMARY_QUERY, channel_ids)
+    nrow = await refresh_channel_summary(conn, channel_ids)
+    logger.info(f"rebuilt summary of {nrow:,} channels")
+
+    return nrow
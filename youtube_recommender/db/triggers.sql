@@ -4,7 +4,8 @@ CREATE OR REPLACE FUNCTION refresh_last_query_results()
 RETURNS TRIGGER LANGUAGE plpgsql
 AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW last_query_results;
+    -- CONCURRENTLY: readers are not locked out, needs ux_last_query_results, see views.sql
+    REFRESH MATERIALIZED VIEW CONCURRENTLY last_query_results;
     RETURN NULL;
 END $$;
 
@@ -12,24 +13,24 @@ CREATE OR REPLACE FUNCTION refresh_last_videos()
 RETURNS TRIGGER LANGUAGE plpgsql
 AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW last_videos;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY last_videos;
     RETURN NULL;
 END $$;
 
 -- triggers
 
 -- todo: why is running AFTER last record was inserted? it lags behind by 1 
+-- once per statement: a FOR EACH ROW trigger refreshed the full view for every inserted row
 DROP TRIGGER IF EXISTS refresh_last_query_results ON query_result;
 CREATE TRIGGER refresh_last_query_results
 AFTER INSERT OR UPDATE OR DELETE
 ON query_result
-FOR EACH ROW
--- FOR EACH STATEMENT
+FOR EACH STATEMENT
 EXECUTE PROCEDURE refresh_last_query_results();
 
 DROP TRIGGER IF EXISTS refresh_last_videos ON query_result;
 CREATE TRIGGER refresh_last_videos
 AFTER INSERT OR UPDATE OR DELETE
 ON query_result
-FOR EACH ROW
+FOR EACH STATEMENT
 EXECUTE PROCEDURE refresh_last_videos();
@@ -7,6 +7,7 @@ SELECT
     video.channel_id,
     video.views,
     video.custom_score,
+    video.publish_date,
     channel.name AS channel_name,
     channel.num_subscribers,
     query_result.query,
@@ -163,7 +164,6 @@ SELECT
     video.views,
     video.length,
     video.nchapter,
-    vidoe.
     LENGTH(video.description) AS dlen
 FROM
     (
@@ -267,27 +267,23 @@ LIMIT
     100;
 
 -- to also see channels without comments: they need comment scraping
-DROP MATERIALIZED VIEW IF EXISTS top_channels_with_comments;
-CREATE MATERIALIZED VIEW top_channels_with_comments AS
-SELECT DISTINCT
-    channel.name AS channel_name,
-    channel.id AS channel_id,
-    COUNT(DISTINCT video.id) AS video_count,
-    SUM(video.views) AS total_views,
-    COUNT(comment.id) AS comment_count,
-    MAX(video.updated) AS last_updated
-    -- summing here creates duplicate sums
-    -- SUM(video.views) AS total_views,
-    -- LPAD(TO_CHAR(SUM(video.views), 'fm999G999G999G999'), 15) AS total_views_fmt
+-- reads from table channel_summary, kept up to date by the push pipeline, so it never needs a refresh
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'top_channels_with_comments') THEN
+        DROP MATERIALIZED VIEW top_channels_with_comments;
+    END IF;
+END $$;
+CREATE OR REPLACE VIEW top_channels_with_comments AS
+SELECT
+    channel_name,
+    channel_id,
+    video_count,
+    total_views,
+    comment_count,
+    last_updated
 FROM
-    video
-    INNER JOIN channel ON video.channel_id = channel.id
-    LEFT JOIN comment ON video.id = comment.video_id
-GROUP BY
-    GROUPING SETS (
-        (channel.id, channel.name),
-        (comment.id)
-    )
+    channel_summary
 ORDER BY
     video_count DESC
 LIMIT
@@ -324,3 +320,20 @@ GROUP BY channel.id
 LIMIT 50;
 
 -- view channels by categories
+
+
+-- unique indexes, so views can be refreshed without locking out readers:
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY top_videos;
+-- see db_methods.refresh_views
+CREATE UNIQUE INDEX IF NOT EXISTS ux_last_videos ON last_videos (video_id, qr_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_last_query_results ON last_query_results (query_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_vw_last_videos ON vw_last_videos (video_id, qr_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_vw_videos_with_chapters ON vw_videos_with_chapters (video_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_top_videos ON top_videos (video_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_top_videos_with_description ON top_videos_with_description (video_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_top_videos_with_comments ON top_videos_with_comments (video_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_top_channels ON top_channels (id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_top_keywords ON top_keywords (keyword_name);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_channels_over_educational ON channels_over_educational (id);
+-- lookups of top videos by channel, see helpers.get_top_videos_by_channel_ids
+CREATE INDEX IF NOT EXISTS ix_top_videos_channel_id ON top_videos (channel_id);
@@ -0,0 +1,416 @@
+r"""fake_youtube_api.py, local stand-in for the YouTube Data API v3.
+
+Serves search.list, videos.list, channels.list and captions.list from
+fixtures, so `search_each_term`, `caption_finder.list_captions` and the
+pagination loop in `video_finder` can run without an API key or network.
+
+Fixtures are a json file with `videos`, `channels` and `captions` (by video_id),
+shaped like real API resources. Without a fixture file, a deterministic
+synthetic dataset is generated.
+
+Run:
+    python -m youtube_recommender.fake_youtube_api --port 8088 --latency 0.05 --error-rate 0.01 --quota 10000
+
+    # point the real code paths to it
+    export YOUTUBE_API_BASE_URL=http://localhost:8088/youtube/v3
+    ipy -m youtube_recommender -- 'search term 1' 'search term 2' -n 200
+
+    # request counters, spent quota
+    curl localhost:8088/_stats
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from .settings import YOUTUBE_API_QUOTA_COSTS
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/youtube/v3"
+DEFAULT_PORT = 8088
+DEFAULT_MAX_RESULTS = 5
+MAX_RESULTS = 50
+
+WORDS = (
+    "python data science machine learning tutorial course lecture history "
+    "physics math music guitar cooking travel review news podcast interview"
+).split()
+
+
+class FakeYouTubeApi:
+    """Fixture driven fake of the YouTube Data API.
+
+    latency:        seconds to wait before every response
+    jitter:         max extra random latency, in seconds
+    error_rate:     fraction of requests answered with a 500 backendError
+    quota:          units available before every request fails with quotaExceeded, 0 is unlimited
+    """
+
+    def __init__(
+        self,
+        fixtures: Dict[str, Any],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        quota: int = 0,
+        seed: Optional[int] = None,
+    ):
+        self.videos: Dict[str, dict] = {v["id"]: v for v in fixtures["videos"]}
+        self.channels: Dict[str, dict] = {c["id"]: c for c in fixtures["channels"]}
+        self.captions: Dict[str, List[dict]] = fixtures.get("captions", {})
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota = quota
+
+        self.quota_used: int = 0
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._random = random.Random(seed)
+
+    def make_app(self) -> web.Application:
+        """Create aiohttp application with all routes."""
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get(f"{API_PREFIX}/search", self._handler("search", self.search)),
+                web.get(
+                    f"{API_PREFIX}/videos", self._handler("videos", self.list_videos)
+                ),
+                web.get(
+                    f"{API_PREFIX}/channels",
+                    self._handler("channels", self.list_channels),
+                ),
+                web.get(
+                    f"{API_PREFIX}/captions",
+                    self._handler("captions", self.list_captions),
+                ),
+                web.get("/_stats", self.stats),
+                web.post("/_reset", self.reset),
+            ]
+        )
+        return app
+
+    # ======================================================================= #
+    # ======                         ENDPOINTS                         ====== #
+    # ======================================================================= #
+
+    def search(self, params) -> Dict[str, Any]:
+        """Search videos by title words, ordered by views or date."""
+        words = params.get("q", "").lower().split()
+        videos = list(self.videos.values())
+        matches = [
+            v for v in videos if any(w in v["snippet"]["title"].lower() for w in words)
+        ]
+        # unknown terms still return results, load tests should not depend on vocabulary
+        videos = matches or videos
+
+        if "publishedAfter" in params:
+            videos = [
+                v
+                for v in videos
+                if v["snippet"]["publishedAt"] >= params["publishedAfter"]
+            ]
+
+        if params.get("order") == "date":
+            videos.sort(key=lambda v: v["snippet"]["publishedAt"], reverse=True)
+        else:
+            videos.sort(key=lambda v: int(v["statistics"]["viewCount"]), reverse=True)
+
+        page, next_token = self._paginate(videos, params)
+        items = [
+            {
+                "kind": "youtube#searchResult",
+                "id": {"kind": "youtube#video", "videoId": v["id"]},
+                "snippet": v["snippet"],
+            }
+            for v in page
+        ]
+
+        return self._list_response(
+            "youtube#searchListResponse", items, next_token, len(videos)
+        )
+
+    def list_videos(self, params) -> Dict[str, Any]:
+        """Get videos by comma separated ids."""
+        items = self._by_ids(self.videos, params)
+        return self._list_response("youtube#videoListResponse", items)
+
+    def list_channels(self, params) -> Dict[str, Any]:
+        """Get channels by comma separated ids."""
+        items = self._by_ids(self.channels, params)
+        return self._list_response("youtube#channelListResponse", items)
+
+    def list_captions(self, params) -> Dict[str, Any]:
+        """List caption tracks of a video."""
+        items = self.captions.get(params.get("videoId", ""), [])
+        return self._list_response("youtube#captionListResponse", items)
+
+    async def stats(self, request) -> web.Response:
+        """Return request counters and spent quota."""
+        return self._json(
+            {
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "quota_used": self.quota_used,
+                "quota": self.quota,
+            }
+        )
+
+    async def reset(self, request) -> web.Response:
+        """Reset counters and spent quota."""
+        self.quota_used = 0
+        self.requests.clear()
+        self.errors.clear()
+        return self._json({})
+
+    # ======================================================================= #
+    # ======                       PRIVATE METHODS                     ====== #
+    # ======================================================================= #
+
+    def _handler(self, endpoint: str, method):
+        async def handle(request) -> web.Response:
+            self.requests[endpoint] += 1
+
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors["backendError"] += 1
+                return self._error(500, "backendError", "Backend Error")
+
+            cost = YOUTUBE_API_QUOTA_COSTS[endpoint]
+            if self.quota and self.quota_used + cost > self.quota:
+                self.errors["quotaExceeded"] += 1
+                return self._error(
+                    403,
+                    "quotaExceeded",
+                    "The request cannot be completed because you have exceeded your quota.",
+                )
+            self.quota_used += cost
+
+            payload = method(request.query)
+            if request.headers.get("If-None-Match") == payload["etag"]:
+                self.requests["not_modified"] += 1
+                return web.Response(status=304, headers={"ETag": payload["etag"]})
+
+            return self._json(payload, headers={"ETag": payload["etag"]})
+
+        return handle
+
+    @staticmethod
+    def _paginate(items: List[dict], params):
+        max_results = min(
+            int(params.get("maxResults", DEFAULT_MAX_RESULTS)), MAX_RESULTS
+        )
+        offset = int(params.get("pageToken") or 0)
+        end = offset + max_results
+        next_token = str(end) if end < len(items) else None
+
+        return items[offset:end], next_token
+
+    @staticmethod
+    def _by_ids(resources: Dict[str, dict], params) -> List[dict]:
+        ids = [i for i in params.get("id", "").split(",") if i]
+        return [resources[i] for i in ids if i in resources]
+
+    @staticmethod
+    def _list_response(
+        kind: str,
+        items: List[dict],
+        next_token: Optional[str] = None,
+        total: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        res: Dict[str, Any] = {
+            "kind": kind,
+            "etag": "fake-{:x}".format(
+                zlib.crc32(",".join(item.get("etag", "") for item in items).encode())
+            ),
+            "pageInfo": {
+                "totalResults": len(items) if total is None else total,
+                "resultsPerPage": len(items),
+            },
+            "items": items,
+        }
+        if next_token is not None:
+            res["nextPageToken"] = next_token
+
+        return res
+
+    @staticmethod
+    def _error(status: int, reason: str, message: str) -> web.Response:
+        payload = {
+            "error": {
+                "code": status,
+                "message": message,
+                "errors": [
+                    {"message": message, "domain": "youtube.quota", "reason": reason}
+                ],
+            }
+        }
+        return web.Response(
+            status=status, text=json.dumps(payload), content_type="application/json"
+        )
+
+    @staticmethod
+    def _json(payload, headers: Optional[Dict[str, str]] = None) -> web.Response:
+        return web.Response(
+            text=json.dumps(payload), content_type="application/json", headers=headers
+        )
+
+
+def generate_fixtures(
+    nvideo: int = 1_000, nchannel: int = 50, seed: int = 0
+) -> Dict[str, Any]:
+    """Generate a deterministic synthetic dataset of videos, channels and captions."""
+    rand = random.Random(seed)
+    now = datetime(2022, 1, 1)
+
+    channels = []
+    for i in range(nchannel):
+        hidden = rand.random() < 0.05
+        statistics = {
+            "viewCount": str(rand.randint(10_000, 100_000_000)),
+            "hiddenSubscriberCount": hidden,
+            "videoCount": str(rand.randint(1, 2_000)),
+        }
+        if not hidden:
+            statistics["subscriberCount"] = str(rand.randint(100, 10_000_000))
+
+        channel_id = f"UCfake{i:018d}"
+        channels.append(
+            {
+                "kind": "youtube#channel",
+                "etag": f"channel-{i}",
+                "id": channel_id,
+                "statistics": statistics,
+                "brandingSettings": {"channel": {"title": f"Fake channel {i}"}},
+            }
+        )
+
+    videos = []
+    captions: Dict[str, List[dict]] = {}
+    for i in range(nvideo):
+        channel = channels[rand.randrange(nchannel)]
+        published = now - timedelta(days=rand.randint(1, 3 * 365))
+        length = rand.randint(60, 3 * 3600)
+        title = " ".join(rand.sample(WORDS, 4))
+        # some videos have chapters in their description
+        description = f"{title}\n" + "".join(
+            f"({s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}) part {j}\n"
+            for j, s in enumerate(range(0, length, max(length // 4, 1)))
+            if i % 3 == 0
+        )
+
+        video_id = f"fake{i:07d}"
+        videos.append(
+            {
+                "kind": "youtube#video",
+                "etag": f"video-{i}",
+                "id": video_id,
+                "snippet": {
+                    "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "channelId": channel["id"],
+                    "title": title,
+                    "description": description,
+                    "channelTitle": channel["brandingSettings"]["channel"]["title"],
+                },
+                "statistics": {"viewCount": str(int(rand.paretovariate(1.2) * 1_000))},
+                "contentDetails": {"duration": f"PT{length // 60}M{length % 60}S"},
+            }
+        )
+        captions[video_id] = [
+            {
+                "kind": "youtube#caption",
+                "etag": f"caption-{i}",
+                "id": f"caption{i:07d}",
+                "snippet": {"videoId": video_id, "language": "en", "trackKind": "asr"},
+            }
+        ]
+
+    return {"videos": videos, "channels": channels, "captions": captions}
+
+
+def load_fixtures(path: Path) -> Dict[str, Any]:
+    """Load fixtures json file."""
+    with open(path, "r", encoding="utf8") as f:
+        return json.loads(f.read())
+
+
+def save_fixtures(fixtures: Dict[str, Any], path: Path) -> None:
+    """Save fixtures to json file, to edit or reuse them."""
+    with open(path, "w", encoding="utf8") as f:
+        f.write(json.dumps(fixtures))
+
+    logger.info(f"saved {len(fixtures['videos']):,} fake videos to {path.as_posix()}")
+
+
+parser = argparse.ArgumentParser(description="Run a local fake YouTube Data API")
+parser.add_argument("--host", default="localhost", help="host to bind to")
+parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to bind to")
+parser.add_argument(
+    "--fixtures",
+    type=Path,
+    default=None,
+    help="json fixtures file, generates synthetic fixtures if not passed",
+)
+parser.add_argument(
+    "--save-fixtures",
+    type=Path,
+    default=None,
+    help="save the generated fixtures to this file",
+)
+parser.add_argument("--nvideo", type=int, default=1_000, help="synthetic videos")
+parser.add_argument("--nchannel", type=int, default=50, help="synthetic channels")
+parser.add_argument(
+    "--latency", type=float, default=0.0, help="seconds to wait per request"
+)
+parser.add_argument(
+    "--jitter", type=float, default=0.0, help="max extra random latency in seconds"
+)
+parser.add_argument(
+    "--error-rate",
+    type=float,
+    default=0.0,
+    help="fraction of requests that fail with a 500 backendError",
+)
+parser.add_argument(
+    "--quota",
+    type=int,
+    default=0,
+    help="quota units before requests fail with quotaExceeded, 0 is unlimited",
+)
+parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.fixtures is not None:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = generate_fixtures(args.nvideo, args.nchannel, seed=args.seed)
+        if args.save_fixtures is not None:
+            save_fixtures(fixtures, args.save_fixtures)
+
+    fake_api = FakeYouTubeApi(
+        fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        quota=args.quota,
+        seed=args.seed,
+    )
+    web.run_app(fake_api.make_app(), host=args.host, port=args.port)
@@ -45,7 +45,7 @@ Datasets explained:
 How to get comments for specific channel_ids:
     - run a specific query that returns the channel ids of channels without comments, example:
 
-    (run first: refresh materialized view top_channels_with_comments; )
+    (top_channels_with_comments reads from channel_summary, no refresh needed)
     docker exec -it postgres-master \                                                              
         psql -d youtube -U postgres -c "select channel_id from top_channels_with_comments where comment_count = 0 and channel_id IS NOT NUll" --quiet --csv > ~/other_repos/postgres_output/channel_ids.csv
 
@@ -71,13 +71,14 @@ from typing import Any, Dict, Iterator, List
 import pandas as pd
 from rarc_utils.decorators import items_per_sec
 from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import get_async_session
 from youtube_comment_downloader.downloader import \
     YoutubeCommentDownloader  # type: ignore[import]
 from youtube_recommender import config as config_dir
 from youtube_recommender.comments_methods import comments_methods as cm
 from youtube_recommender.core.setup import psql_config as psql
 from youtube_recommender.data_methods import data_methods as dm
+from youtube_recommender.data_methods import set_copy_on_write
+from youtube_recommender.db.engine import get_async_session, pool_metrics
 from youtube_recommender.db.helpers import get_video_ids_by_channel_ids
 from youtube_recommender.io_methods import io_methods as im
 from youtube_recommender.settings import (COMMENTS_FEATHER_FILE,
@@ -232,6 +233,7 @@ parser.add_argument(
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    set_copy_on_write()
 
     # psql = load_config(
     #     db_name="youtube",
@@ -294,5 +296,6 @@ if __name__ == "__main__":
     # push new comments to db
     if args.push_db:
         res = loop.run_until_complete(
-            dm.push_comments(df, async_session, autobulk=True, returnExisting=False)
+            dm.push_comments(df, async_session)
         )
+        logger.info(f"connection pools: {pool_metrics()}")
@@ -0,0 +1,124 @@
+"""language.py, language identification of titles and captions.
+
+langid is CPU bound, so texts are classified in chunks by a process pool.
+Long texts, like full captions, are sampled first: the start and the middle
+of a text identify its language as well as the whole text does.
+
+Results are cached per (column, video_id) in the current process, a text is
+classified again only when its sample changed.
+
+usage:
+    codes, confs = classify_texts(df["text"], ids=df["video_id"], column="text")
+"""
+
+import logging
+import os
+import zlib
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langid.langid import LanguageIdentifier, model  # type: ignore[import]
+
+from .settings import (LANGUAGE_CHUNKSIZE, LANGUAGE_MIN_PARALLEL,
+                       LANGUAGE_NPROCESS, LANGUAGE_SAMPLE_CHARS)
+from .utils.misc import chunks
+
+logger = logging.getLogger(__name__)
+
+# language code and normalized probability, by (column, video_id), with the crc32 of the sample
+_cache: Dict[Tuple[str, str], Tuple[int, str, float]] = {}
+# one identifier per process, loading the model takes about a second
+_identifier: Dict[str, LanguageIdentifier] = {}
+
+__all__ = [
+    "sample_text",
+    "classify_texts",
+    "clear_cache",
+]
+
+
+def sample_text(text: str, nchar: int = LANGUAGE_SAMPLE_CHARS) -> str:
+    """Start and middle of `text`, at most `nchar` characters in total."""
+    if len(text) <= nchar:
+        return text
+
+    half = nchar // 2
+    mid = len(text) // 2
+
+    return text[:half] + " " + text[mid - half // 2 : mid + half // 2]
+
+
+def classify_texts(
+    texts: Iterable[Optional[str]],
+    ids: Optional[Iterable[str]] = None,
+    column: str = "",
+    nprocess: int = LANGUAGE_NPROCESS,
+) -> Tuple[List[str], np.ndarray]:
+    """Classify the language of `texts`, return language codes and confidences in [0, 1].
+
+    ids:        video_id per text, classified texts are cached under (column, video_id)
+    nprocess:   processes in the pool, small inputs are classified in this process
+    """
+    samples = [sample_text(text or "") for text in texts]
+    keys = [(column, id_) for id_ in ids] if ids is not None else [None] * len(samples)
+    crcs = [zlib.crc32(sample.encode()) for sample in samples]
+
+    codes: List[str] = [""] * len(samples)
+    confs = np.zeros(len(samples), dtype=np.float32)
+    todo: List[int] = []
+    for i, (key, crc) in enumerate(zip(keys, crcs)):
+        hit = _cache.get(key) if key is not None else None
+        if hit is not None and hit[0] == crc:
+            codes[i], confs[i] = hit[1], hit[2]
+        else:
+            todo.append(i)
+
+    results = _classify_samples([samples[i] for i in todo], nprocess)
+    for i, (code, conf) in zip(todo, results):
+        codes[i], confs[i] = code, conf
+        if keys[i] is not None:
+            _cache[keys[i]] = (crcs[i], code, conf)
+
+    logger.info(
+        f"classified language of {len(todo):,} texts, {len(samples) - len(todo):,} from cache"
+    )
+
+    return codes, confs
+
+
+def clear_cache() -> None:
+    """Forget cached classifications."""
+    _cache.clear()
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _get_identifier() -> LanguageIdentifier:
+    if "langid" not in _identifier:
+        _identifier["langid"] = LanguageIdentifier.from_modelstring(
+            model, norm_probs=True
+        )
+
+    return _identifier["langid"]
+
+
+def _classify_chunk(samples: Sequence[str]) -> List[Tuple[str, float]]:
+    identifier = _get_identifier()
+    return [identifier.classify(sample) for sample in samples]
+
+
+def _classify_samples(samples: List[str], nprocess: int) -> List[Tuple[str, float]]:
+    nprocess = min(nprocess, os.cpu_count() or 1)
+    if len(samples) < LANGUAGE_MIN_PARALLEL or nprocess <= 1:
+        return _classify_chunk(samples)
+
+    # load the model before forking, so workers share it
+    _get_identifier()
+    with Pool(processes=nprocess) as pool:
+        results = pool.map(_classify_chunk, chunks(samples, LANGUAGE_CHUNKSIZE))
+
+    return [res for chunk in results for res in chunk]
@@ -24,13 +24,13 @@ from pytube import Channel as pytube_channel  # type: ignore[import]
 from pytube import YouTube  # type: ignore[import]
 # from pytube import Playlist, Search
 from rarc_utils.log import get_create_logger
-from rarc_utils.sqlalchemy_base import get_async_session
 from youtube_recommender import config as config_dir
 from youtube_recommender.core.setup import psql_config
 from youtube_recommender.data_methods import data_methods as dm
-from youtube_recommender.db.db_methods import refresh_view
+from youtube_recommender.data_methods import set_copy_on_write
 # from youtube_recommender.db.helpers import (
 #     get_keyword_association_rows_by_ids, get_video_ids_by_ids)
+from youtube_recommender.db.engine import get_async_session, pool_metrics
 from youtube_recommender.db.helpers import get_video_ids_by_channel_ids
 from youtube_recommender.settings import (CHANNEL_FIELDS, PYTUBE_VIDEOS_PATH,
                                           VIDEO_FIELDS)
@@ -212,6 +212,7 @@ parser.add_argument(
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    set_copy_on_write()
     if args.dryrun:
         sys.exit()
 
@@ -280,10 +281,6 @@ if __name__ == "__main__":
     # push keywords, channels and videos to db
     if args.push_db:
         df, cdf = dm.extract_chapters(df)
-        datad = loop.run_until_complete(dm.push_videos(df, async_session))
-
-    # ask user to refresh materialized view
-    view = "top_channels_with_comments"
-    input_ = input("refresh view {}? Type `y`: ".format(view))
-    if input_ == "y":
-        refresh_view(view)
+        # also updates channel_summary, other views are refreshed by `db_methods --refresh-views`
+        datad = loop.run_until_complete(dm.push_videos(df, async_session, cdf=cdf))
+        logger.info(f"connection pools: {pool_metrics()}")
@@ -0,0 +1,251 @@
+"""quota.py, quota-aware scheduling of YouTube Data API requests.
+
+Every endpoint has a fixed cost in quota units (search.list costs 100,
+videos.list and channels.list cost 1), and the daily budget resets at
+midnight Pacific Time. QuotaScheduler persists the units spent per quota day,
+in a local json file or in Redis, so separate runs share one budget.
+
+usage:
+    quota = QuotaScheduler(FileQuotaStore())
+    plan = loop.run_until_complete(quota.plan(search_terms, n=200))
+    # {term: nitems}, terms that do not fit the budget are in `quota.deferred`
+    res = loop.run_until_complete(search_each_term(search_terms, api_key, uploaded_since, quota=quota))
+    logger.info(quota.summary())
+    await quota.flush()
+"""
+
+import atexit
+import json
+import logging
+import math
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from aiocache import Cache  # type: ignore[import]
+
+from .settings import (YOUTUBE_API_DAILY_QUOTA, YOUTUBE_API_QUOTA_COSTS,
+                       YOUTUBE_API_QUOTA_FILE, YOUTUBE_API_QUOTA_TIMEZONE)
+
+logger = logging.getLogger(__name__)
+
+RESULT_PER_PAGE = 50
+# keys expire after the quota day is over
+REDIS_KEY_TTL = 2 * 24 * 3600
+
+__all__ = [
+    "QuotaExceeded",
+    "FileQuotaStore",
+    "RedisQuotaStore",
+    "QuotaScheduler",
+    "quota_day",
+]
+
+
+class QuotaExceeded(Exception):
+    """Request does not fit the remaining daily quota."""
+
+
+def quota_day(now: Optional[datetime] = None) -> str:
+    """Return the current quota day, quota resets at midnight Pacific Time."""
+    now = now or datetime.now(tz=ZoneInfo(YOUTUBE_API_QUOTA_TIMEZONE))
+    return now.astimezone(ZoneInfo(YOUTUBE_API_QUOTA_TIMEZONE)).date().isoformat()
+
+
+class FileQuotaStore:
+    """Persist units spent per quota day in a local json file.
+
+    Units are counted in memory and written on `flush` and at exit, not on
+    every call. Meant for one process at a time, use RedisQuotaStore for
+    concurrent workers.
+    """
+
+    def __init__(self, path: Path = YOUTUBE_API_QUOTA_FILE):
+        self.path = path
+        self._spent: Optional[Dict[str, int]] = None
+        self._dirty = False
+        atexit.register(self._write)
+
+    async def get(self, day: str) -> int:
+        """Get units spent on `day`."""
+        return self._load().get(day, 0)
+
+    async def incr(self, day: str, units: int) -> int:
+        """Add `units` to `day`, return total units spent on `day`."""
+        spent = self._load()
+        # only keep the current quota day
+        self._spent = {day: spent.get(day, 0) + units}
+        self._dirty = True
+
+        return self._spent[day]
+
+    async def flush(self) -> None:
+        """Write units spent to the json file."""
+        self._write()
+
+    def _load(self) -> Dict[str, int]:
+        if self._spent is None:
+            self._spent = {}
+            if self.path.exists():
+                with open(self.path, "r", encoding="utf8") as f:
+                    self._spent = json.load(f)
+
+        return self._spent
+
+    def _write(self) -> None:
+        if not self._dirty:
+            return
+
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(self._spent, f)
+        tmp_path.replace(self.path)
+        self._dirty = False
+
+
+class RedisQuotaStore:
+    """Persist units spent per quota day in Redis, shared by all workers."""
+
+    def __init__(self, key_prefix: str = "youtube_api_quota", **cache_kwargs):
+        self.key_prefix = key_prefix
+        self.cache = Cache(Cache.REDIS, **cache_kwargs)
+
+    async def get(self, day: str) -> int:
+        """Get units spent on `day`."""
+        return int(await self.cache.get(self._key(day)) or 0)
+
+    async def incr(self, day: str, units: int) -> int:
+        """Add `units` to `day`, return total units spent on `day`."""
+        key = self._key(day)
+        total = await self.cache.increment(key, units)
+        await self.cache.expire(key, REDIS_KEY_TTL)
+
+        return int(total)
+
+    async def flush(self) -> None:
+        """Nothing to do, every increment is stored right away."""
+
+    def _key(self, day: str) -> str:
+        return f"{self.key_prefix}:{day}"
+
+
+class QuotaScheduler:
+    """Charge API calls against the daily budget and plan search terms to fit it.
+
+    reserve:    units kept aside for other jobs, never planned or spent
+    """
+
+    def __init__(
+        self,
+        store=None,
+        daily_quota: int = YOUTUBE_API_DAILY_QUOTA,
+        costs: Optional[Dict[str, int]] = None,
+        reserve: int = 0,
+    ):
+        self.store = store if store is not None else FileQuotaStore()
+        self.daily_quota = daily_quota
+        self.costs = costs or YOUTUBE_API_QUOTA_COSTS
+        self.reserve = reserve
+
+        # counters of this run
+        self.calls: Counter = Counter()
+        self.spent: Counter = Counter()
+        self.deferred: List[str] = []
+
+    async def remaining(self) -> int:
+        """Units left today."""
+        spent = await self.store.get(quota_day())
+        return max(self.daily_quota - self.reserve - spent, 0)
+
+    async def charge(self, endpoint: str) -> None:
+        """Charge one `endpoint` call, raise QuotaExceeded if it does not fit.
+
+        Units are added first and rolled back when the total exceeds the budget,
+        so concurrent workers sharing a RedisQuotaStore never overspend.
+        """
+        cost = self.costs[endpoint]
+        day = quota_day()
+        total = await self.store.incr(day, cost)
+        if total > self.daily_quota - self.reserve:
+            await self.store.incr(day, -cost)
+            raise QuotaExceeded(f"no quota left for {endpoint=}, costs {cost} units")
+
+        self.calls[endpoint] += 1
+        self.spent[endpoint] += cost
+
+    async def refund(self, endpoint: str) -> None:
+        """Give back the units of a charged `endpoint` call that never reached the API."""
+        cost = self.costs[endpoint]
+        await self.store.incr(quota_day(), -cost)
+        self.calls[endpoint] -= 1
+        self.spent[endpoint] -= cost
+
+    async def exhaust(self) -> None:
+        """Mark today's budget as spent, after the API answered quotaExceeded."""
+        remaining = await self.remaining()
+        if remaining > 0:
+            await self.store.incr(quota_day(), remaining)
+
+    async def flush(self) -> None:
+        """Persist units spent, call when the run is done."""
+        await self.store.flush()
+
+    def estimate(self, n: int) -> int:
+        """Estimate units needed to fetch and enrich `n` search results."""
+        pages = math.ceil(n / RESULT_PER_PAGE)
+        return pages * (self.costs["search"] + self.costs["videos"] + self.costs["channels"])
+
+    async def plan(
+        self,
+        search_terms: List[str],
+        n: int,
+        priorities: Optional[Dict[str, int]] = None,
+    ) -> Dict[str, int]:
+        """Fit `search_terms` into the remaining budget.
+
+        Terms are served in order of priority (highest first, ties keep their order).
+        Every term first gets one page, then pages are added up to `n` items per
+        term while the budget allows. Terms that do not get a single page are deferred.
+
+        Returns the number of items to fetch per term.
+        """
+        priorities = priorities or {}
+        queue = sorted(search_terms, key=lambda term: -priorities.get(term, 0))
+
+        budget = await self.remaining()
+        page_cost = self.estimate(RESULT_PER_PAGE)
+        max_pages = math.ceil(n / RESULT_PER_PAGE)
+
+        pages: Dict[str, int] = {}
+        self.deferred = []
+        for term in queue:
+            if budget >= page_cost:
+                pages[term] = 1
+                budget -= page_cost
+            else:
+                self.deferred.append(term)
+
+        for term in pages:
+            extra = min(max_pages - 1, budget // page_cost)
+            pages[term] += extra
+            budget -= extra * page_cost
+
+        plan = {term: min(npage * RESULT_PER_PAGE, n) for term, npage in pages.items()}
+
+        degraded = [term for term, nitem in plan.items() if nitem < n]
+        if degraded:
+            logger.warning(f"low quota, fetching fewer items for {degraded=}")
+        if self.deferred:
+            logger.warning(f"no quota left, deferring {self.deferred=}")
+
+        return plan
+
+    def summary(self) -> str:
+        """Summarise calls and units spent in this run."""
+        per_endpoint = ", ".join(
+            f"{endpoint}={self.calls[endpoint]:,} calls / {units:,} units"
+            for endpoint, units in self.spent.most_common()
+        )
+        return f"spent {sum(self.spent.values()):,} quota units ({per_endpoint})"
@@ -0,0 +1,229 @@
+"""response_cache.py, persistent cache of YouTube Data API responses.
+
+search.list responses are cached per request, videos.list and channels.list
+items are cached per id, so a channel shared by many videos and terms is
+fetched once per TTL. Entries are kept after their TTL expires, stale
+responses are revalidated with `If-None-Match`: an unchanged response costs
+a 304 without a body.
+
+Only whole requests are revalidated. The API compares `If-None-Match` with the
+ETag of the whole response, so the ETags of cached items cannot revalidate a
+videos.list or channels.list request that batches other ids. Stale items are
+refetched in full, their ETags are stored for inspection only.
+
+Entries live in Redis, or in a local SQLite file when Redis is not reachable.
+
+usage:
+    cache = ResponseCache()
+    async with YouTubeClient(api_key, cache=cache) as client:
+        page = await client.search_list("python")
+    logger.info(cache.summary())
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from aiocache import Cache  # type: ignore[import]
+from aiocache.serializers import JsonSerializer  # type: ignore[import]
+
+from .settings import (YOUTUBE_API_CACHE_FILE, YOUTUBE_API_CACHE_RETENTION,
+                       YOUTUBE_API_CACHE_TTL)
+from .utils.errors import CACHE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "youtube_api"
+
+__all__ = [
+    "ResponseCache",
+    "RedisCacheStore",
+    "SqliteCacheStore",
+]
+
+
+class RedisCacheStore:
+    """Keep cache entries in Redis."""
+
+    def __init__(self, **cache_kwargs):
+        self.cache = Cache(Cache.REDIS, serializer=JsonSerializer(), **cache_kwargs)
+
+    async def multi_get(self, keys: List[str]) -> List[Optional[dict]]:
+        return await self.cache.multi_get(keys)
+
+    async def multi_set(self, entries: Dict[str, dict], ttl: int) -> None:
+        await self.cache.multi_set(list(entries.items()), ttl=ttl)
+
+
+class SqliteCacheStore:
+    """Keep cache entries in a local SQLite file."""
+
+    def __init__(self, path: Path = YOUTUBE_API_CACHE_FILE):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def multi_get(self, keys: List[str]) -> List[Optional[dict]]:
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT key, value FROM response WHERE expires > ? AND key IN ({})".format(
+                ", ".join("?" * len(keys))
+            ),
+            [time.time(), *keys],
+        ).fetchall()
+        values = {key: json.loads(value) for key, value in rows}
+
+        return [values.get(key) for key in keys]
+
+    async def multi_set(self, entries: Dict[str, dict], ttl: int) -> None:
+        conn = self._connect()
+        expires = time.time() + ttl
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO response (key, value, expires) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires) for key, value in entries.items()],
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            # expired rows are dropped on open, not on every write
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM response WHERE expires <= ?", (time.time(),)
+                )
+
+        return self._conn
+
+
+class ResponseCache:
+    """Cache API responses with per-endpoint TTLs.
+
+    ttls:           seconds a cached response is served without asking the API
+    retention:      seconds a stale response is kept, to revalidate it with its ETag
+    fallback_path:  SQLite file used when the store cannot be reached
+    """
+
+    def __init__(
+        self,
+        store=None,
+        ttls: Optional[Dict[str, int]] = None,
+        retention: int = YOUTUBE_API_CACHE_RETENTION,
+        fallback_path: Path = YOUTUBE_API_CACHE_FILE,
+    ):
+        self.store = store if store is not None else RedisCacheStore()
+        self.ttls = ttls or YOUTUBE_API_CACHE_TTL
+        self.retention = retention
+        self.fallback_path = fallback_path
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.revalidated: int = 0
+
+    def is_fresh(self, endpoint: str, entry: Dict[str, Any]) -> bool:
+        """Whether `entry` can be served without asking the API."""
+        return time.time() - entry["fetched"] < self.ttls.get(endpoint, 0)
+
+    async def get(self, endpoint: str, params: Dict[str, Any]) -> Optional[dict]:
+        """Get cached response for a request, might be stale."""
+        (entry,) = await self._multi_get([self._request_key(endpoint, params)])
+        if entry is not None and self.is_fresh(endpoint, entry):
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return entry
+
+    async def set(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        payload: Dict[str, Any],
+        etag: Optional[str] = None,
+    ) -> None:
+        """Cache response of a request."""
+        entry = {"fetched": time.time(), "etag": etag, "payload": payload}
+        await self._multi_set({self._request_key(endpoint, params): entry})
+
+    async def get_items(
+        self, endpoint: str, part: str, ids: List[str]
+    ) -> Dict[str, dict]:
+        """Get fresh cached resources by id, missing and stale ids are left out."""
+        if not ids:
+            return {}
+
+        keys = [self._item_key(endpoint, part, id_) for id_ in ids]
+        entries = await self._multi_get(keys)
+        items = {
+            id_: entry["payload"]
+            for id_, entry in zip(ids, entries)
+            if entry is not None and self.is_fresh(endpoint, entry)
+        }
+        self.hits += len(items)
+        self.misses += len(ids) - len(items)
+
+        return items
+
+    async def set_items(self, endpoint: str, part: str, items: List[dict]) -> None:
+        """Cache resources by id."""
+        if not items:
+            return
+
+        fetched = time.time()
+        await self._multi_set(
+            {
+                self._item_key(endpoint, part, item["id"]): {
+                    "fetched": fetched,
+                    "etag": item.get("etag"),
+                    "payload": item,
+                }
+                for item in items
+            }
+        )
+
+    def summary(self) -> str:
+        """Summarise cache usage of this run."""
+        return f"api cache: {self.hits:,} hits, {self.misses:,} misses, {self.revalidated:,} revalidated"
+
+    # ======================================================================= #
+    # ======                       PRIVATE METHODS                     ====== #
+    # ======================================================================= #
+
+    async def _multi_get(self, keys: List[str]) -> List[Optional[dict]]:
+        try:
+            return await self.store.multi_get(keys)
+        except CACHE_ERRORS as e:
+            self._fallback(e)
+            return await self.store.multi_get(keys)
+
+    async def _multi_set(self, entries: Dict[str, dict]) -> None:
+        try:
+            await self.store.multi_set(entries, ttl=self.retention)
+        except CACHE_ERRORS as e:
+            self._fallback(e)
+            await self.store.multi_set(entries, ttl=self.retention)
+
+    def _fallback(self, exc: Exception) -> None:
+        if isinstance(self.store, SqliteCacheStore):
+            raise exc
+        logger.warning(f"cannot reach cache store, falling back to sqlite: {exc}")
+        self.store = SqliteCacheStore(self.fallback_path)
+
+    @staticmethod
+    def _request_key(endpoint: str, params: Dict[str, Any]) -> str:
+        params = {k: v for k, v in params.items() if k != "key"}
+        digest = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"{KEY_PREFIX}:{endpoint}:{digest}"
+
+    @staticmethod
+    def _item_key(endpoint: str, part: str, id_: str) -> str:
+        return f"{KEY_PREFIX}:{endpoint}:{part}:{id_}"
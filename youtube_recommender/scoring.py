@@ -0,0 +1,55 @@
+"""scoring.py, score videos by views, subscribers and age.
+
+Only depends on numpy and pandas, so the database layer can rescore cached
+rows without importing the YouTube API client.
+
+usage:
+    from youtube_recommender.scoring import score_videos
+
+    df = score_videos(df)
+"""
+
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+__all__ = [
+    "score_videos",
+]
+
+
+def score_videos(df: pd.DataFrame, now: Optional[datetime] = None) -> pd.DataFrame:
+    """Compute `view_subscriber_atio` and `custom_score` for all rows at once.
+
+    Needs `views`, `num_subscribers` and `publish_date` columns, so it can also
+    rescore cached rows from `last_videos`. Naive dates and `now` are taken as UTC.
+
+    usage:
+        df = score_videos(df)
+    """
+    now = _naive_utc(pd.Timestamp(now or pd.Timestamp.utcnow()))
+    views = df["views"].to_numpy(dtype=float)
+    num_subs = df["num_subscribers"].to_numpy(dtype=float)
+
+    ratio = np.divide(views, num_subs, out=np.zeros_like(views), where=num_subs != 0)
+    publish_date = pd.to_datetime(df["publish_date"], utc=True).dt.tz_localize(None)
+    days_since_published = (now - publish_date).dt.days.to_numpy().clip(min=1)
+
+    df["view_subscriber_atio"] = ratio
+    df["custom_score"] = views * np.minimum(ratio, 5) / days_since_published
+
+    return df
+
+
+# ======================================================================= #
+# ======                       PRIVATE METHODS                     ====== #
+# ======================================================================= #
+
+
+def _naive_utc(ts: pd.Timestamp) -> pd.Timestamp:
+    if ts.tzinfo is None:
+        return ts
+
+    return ts.tz_convert("UTC").tz_localize(None)
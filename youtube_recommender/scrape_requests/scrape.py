@@ -17,6 +17,7 @@ from rarc_utils.log import setup_logger
 from rarc_utils.sqlalchemy_base import get_async_session, load_config
 from youtube_recommender import config as config_dir
 from youtube_recommender.data_methods import data_methods as dm
+from youtube_recommender.data_methods import set_copy_on_write
 # from youtube_recommender.db.helpers import (
 #     get_keyword_association_rows_by_ids, get_video_ids_by_ids)
 from youtube_recommender.db.helpers import get_video_ids_by_channel_ids
@@ -76,6 +77,7 @@ parser.add_argument(
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    set_copy_on_write()
     if args.dryrun:
         sys.exit()
 
@@ -140,4 +142,4 @@ if __name__ == "__main__":
     # push keywords, channels and videos to db
     if args.push_db:
         df, cdf = dm.extract_chapters(df)
-        datad = loop.run_until_complete(dm.push_videos(df, async_session))
+        datad = loop.run_until_complete(dm.push_videos(df, async_session, cdf=cdf))
@@ -56,11 +56,11 @@ import numpy as np
 # from google.protobuf.json_format import MessageToJson
 from google.protobuf.json_format import MessageToDict
 from grpc import ssl_channel_credentials
-from rarc_utils.sqlalchemy_base import get_async_session, get_session
 from scrape_requests_pb2 import ScrapeCategory, ScrapeRequest
 from scrape_requests_pb2_grpc import (ChannelScrapingsStub,
                                       CommentScrapingsStub, VideoScrapingsStub)
 from youtube_recommender.core.setup import psql_config as psql
+from youtube_recommender.db.engine import get_async_session, get_session
 from youtube_recommender.db.helpers import (get_top_channels_with_comments,
                                             get_top_videos_by_channel_ids)
 from youtube_recommender.settings import (YOUTUBE_CHANNEL_PREFIX,
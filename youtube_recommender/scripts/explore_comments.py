@@ -9,6 +9,7 @@ Explore the comments dataset using NLP, uses libraries spaCy and SpacyTextBlob
     ipy explore_comments.py -i -- --load_db --video_ids vLnPwxZdW4Y SPTfmiYiuok --dryrun
     ipy explore_comments.py -i -- --load_db --video_ids vLnPwxZdW4Y SPTfmiYiuok
     ipy explore_comments.py -i -- --load_db --video_ids vLnPwxZdW4Y SPTfmiYiuok --save_pickle
+    ipy explore_comments.py -i -- --load_db --video_ids vLnPwxZdW4Y SPTfmiYiuok --chunksize 5000
 
 Datasets explained:
     comments.feather    holds parsed rows. rows that can be parsed to SQLAlchemy objects
@@ -25,13 +26,14 @@ import pandas as pd
 import spacy
 from rarc_utils.decorators import items_per_sec
 from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import get_async_session
 from spacytextblob.spacytextblob import SpacyTextBlob  # type: ignore[import]
-from youtube_recommender.db.helpers import get_comments_by_video_ids
+from youtube_recommender.db.engine import get_async_session
+from youtube_recommender.db.helpers import stream_comments_by_video_ids
 from youtube_recommender.db.models import psql
 from youtube_recommender.io_methods import io_methods as im
 from youtube_recommender.settings import (COMMENTS_FEATHER_FILE,
-                                          COMMENTS_PICKLE_FILE)
+                                          COMMENTS_PICKLE_FILE,
+                                          PSQL_STREAM_CHUNKSIZE)
 
 log_fmt = "%(asctime)s - %(module)-16s - %(lineno)-4s - %(funcName)-20s - %(levelname)-7s - %(message)s"  # name
 logger = setup_logger(
@@ -44,13 +46,25 @@ loop = asyncio.get_event_loop()
 NLP_COMMENT = "nlp_comment"
 
 
+async def load_comments(video_ids: List[str], chunksize: int) -> pd.DataFrame:
+    """Stream comments from DB, dropping unused columns per chunk."""
+    dfs = [
+        df.drop(["updated", "created", "channel_id"], axis=1)
+        async for df in stream_comments_by_video_ids(
+            async_session, video_ids, chunksize=chunksize
+        )
+    ]
+    if not dfs:
+        return pd.DataFrame()
+
+    return pd.concat(dfs, ignore_index=True)
+
+
 @items_per_sec
-def comments_by_vids(video_ids: List[str]):
+def comments_by_vids(video_ids: List[str], chunksize=PSQL_STREAM_CHUNKSIZE):
     """Get comments by video_ids wrapper."""
     logger.info(f"get rows from DB..")
-    return loop.run_until_complete(
-        get_comments_by_video_ids(async_session, args.video_ids)
-    )
+    return loop.run_until_complete(load_comments(video_ids, chunksize))
 
 
 parser = argparse.ArgumentParser(description="Define get_coments parameters")
@@ -78,6 +92,12 @@ parser.add_argument(
     default=False,
     help="load dataset from db",
 )
+parser.add_argument(
+    "--chunksize",
+    type=int,
+    default=PSQL_STREAM_CHUNKSIZE,
+    help="rows per chunk when streaming comments from db",
+)
 parser.add_argument(
     "--load_feather",
     action="store_true",
@@ -117,12 +137,8 @@ if __name__ == "__main__":
     LOADED_DF = False
     if args.load_db:
         assert args.video_ids, f"please pass video_ids"
-        items = comments_by_vids(args.video_ids)
-
-        df = pd.DataFrame(items)
+        df = comments_by_vids(args.video_ids, chunksize=args.chunksize)
         # df["hash_id"] = df.id.map(hash)
-        # df = df.drop(["id", "updated", "created", "channel_id"], axis=1)
-        df = df.drop(["updated", "created", "channel_id"], axis=1)
         LOADED_DF = True
 
     elif args.load_feather:
@@ -37,6 +37,7 @@ from rarc_utils.sqlalchemy_base import (get_async_session, get_session,
                                         load_config)
 from youtube_recommender import config as config_dir
 from youtube_recommender.data_methods import data_methods as dm
+from youtube_recommender.data_methods import set_copy_on_write
 from youtube_recommender.db.models import scrapeJob
 from youtube_recommender.io_methods import io_methods as im
 from youtube_recommender.settings import (SEARCH_HISTORY_JSON,
@@ -232,6 +233,7 @@ parser.add_argument(
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     cli_args = parser.parse_args()
+    set_copy_on_write()
 
     psql = load_config(
         db_name="youtube",
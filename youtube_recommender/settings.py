@@ -1,5 +1,6 @@
 """Settings.py, general settings for youtube-recommender."""
 
+import os
 from pathlib import Path
 
 __all__ = [
@@ -61,9 +62,103 @@ SPACY_MODEL = "en_core_web_sm"
 # max hours ago for cache item to remain valid
 PSQL_HOURS_AGO = 7 * 24
 HOUR_LIMIT = 99_999_999
+# rows per chunk when streaming large query results
+PSQL_STREAM_CHUNKSIZE = 10_000
+# seconds a cached query result lives in redis, writers invalidate it earlier
+PSQL_CACHE_TTL = 24 * 3600
+# materialized views refreshed off the hot path, with REFRESH ... CONCURRENTLY
+PSQL_REFRESH_VIEWS = (
+    "top_videos",
+    "top_videos_with_description",
+    "top_videos_with_comments",
+    "top_channels",
+    "top_keywords",
+    "channels_over_educational",
+    "vw_videos_with_chapters",
+)
+# seconds between scheduled refreshes
+PSQL_REFRESH_INTERVAL = 30 * 60
+# connection pool per engine, see db/engine.py. Every process holds up to
+# pool_size + max_overflow connections per engine, size workers against max_connections
+PSQL_POOL_SIZE = int(os.environ.get("PSQL_POOL_SIZE", 5))
+PSQL_MAX_OVERFLOW = int(os.environ.get("PSQL_MAX_OVERFLOW", 5))
+PSQL_POOL_TIMEOUT = 30
+# seconds after which connections are replaced, before server or proxy timeouts drop them
+PSQL_POOL_RECYCLE = 30 * 60
+PSQL_POOL_PRE_PING = True
+# prepared statements cached per asyncpg connection, set to 0 behind pgbouncer
+PSQL_STATEMENT_CACHE_SIZE = int(os.environ.get("PSQL_STATEMENT_CACHE_SIZE", 100))
+# seconds a read-only replica may lag behind the primary before reads go to the primary
+PSQL_REPLICA_MAX_LAG = float(os.environ.get("PSQL_REPLICA_MAX_LAG", 60))
+# seconds a replica lag measurement, or a failed replica, is remembered
+PSQL_REPLICA_CHECK_INTERVAL = 15
+# opt in to pandas copy-on-write mode (pandas >= 1.5), see data_methods.set_copy_on_write
+# pandas 1.5 also reads this variable itself, as the default of mode.copy_on_write
+PANDAS_COPY_ON_WRITE = os.environ.get("PANDAS_COPY_ON_WRITE", "0") == "1"
 YOUTUBE_VIDEO_PREFIX = "https://www.youtube.com/watch?v="
 YOUTUBE_CHANNEL_PREFIX = "https://www.youtube.com/channel/"
 
+############################
+##### YouTube Data API #####
+############################
+
+DEFAULT_YOUTUBE_API_BASE_URL = "https://www.googleapis.com/youtube/v3"
+# point to a local fake_youtube_api server for offline load tests, e.g.
+# export YOUTUBE_API_BASE_URL=http://localhost:8088/youtube/v3
+YOUTUBE_API_BASE_URL = os.environ.get(
+    "YOUTUBE_API_BASE_URL", DEFAULT_YOUTUBE_API_BASE_URL
+)
+# max requests in flight, also the size of the shared connection pool
+YOUTUBE_API_MAX_CONCURRENCY = 20
+# max requests started per second, <= 0 disables rate limiting
+YOUTUBE_API_RATE_LIMIT = 10.0
+YOUTUBE_API_TIMEOUT = 30
+YOUTUBE_API_KEEPALIVE = 60
+YOUTUBE_API_MAX_RETRIES = 3
+
+# quota units per call, see https://developers.google.com/youtube/v3/determine_quota_cost
+YOUTUBE_API_QUOTA_COSTS = {"search": 100, "videos": 1, "channels": 1, "captions": 50}
+YOUTUBE_API_DAILY_QUOTA = 10_000
+# units per quota day are persisted here, or in Redis
+YOUTUBE_API_QUOTA_FILE = DATA_DIR / "youtube_api_quota.json"
+YOUTUBE_API_QUOTA_TIMEZONE = "America/Los_Angeles"
+
+# response cache, seconds a cached response is served without asking the API
+YOUTUBE_API_CACHE_TTL = {
+    "search": 6 * 3600,
+    "videos": 3600,
+    "channels": 24 * 3600,
+    "captions": 24 * 3600,
+}
+# stale responses are kept this long, to revalidate them with If-None-Match
+YOUTUBE_API_CACHE_RETENTION = 7 * 24 * 3600
+# fallback when Redis is not reachable
+YOUTUBE_API_CACHE_FILE = DATA_DIR / "youtube_api_cache.sqlite"
+
+####################
+##### Language #####
+####################
+
+# characters of a text used to identify its language, see language.py
+LANGUAGE_SAMPLE_CHARS = 2_000
+# texts per task of the process pool, and fewer texts than this are classified serially
+LANGUAGE_CHUNKSIZE = 500
+LANGUAGE_MIN_PARALLEL = 2_000
+LANGUAGE_NPROCESS = int(os.environ.get("LANGUAGE_NPROCESS", os.cpu_count() or 1))
+
+####################
+##### Captions #####
+####################
+
+# codec of new captions: zstd uses the latest trained dictionary, see db/compression.py
+CAPTION_CODEC = os.environ.get("CAPTION_CODEC", "zstd")
+CAPTION_ZSTD_LEVEL = 9
+# dictionary size in bytes, and number of captions sampled to train it
+CAPTION_DICT_SIZE = 112_640
+CAPTION_DICT_SAMPLES = 10_000
+# captions recompressed per transaction
+CAPTION_RECOMPRESS_BATCH = 1_000
+
 #############################
 ##### Scrape attributes #####
 #############################
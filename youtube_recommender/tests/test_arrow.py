@@ -0,0 +1,90 @@
+"""test_arrow.py, tests for db/arrow.py, parsing COPY CSV output without a database."""
+
+import io
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from youtube_recommender.db.arrow import _export_query, _parse_csv
+
+
+def copy_csv(header, rows) -> io.BytesIO:
+    """Write rows like COPY ... (FORMAT csv, HEADER true).
+
+    NULL is an unquoted empty field, strings are quoted, so empty strings are "".
+    """
+    lines = [",".join(header)]
+    for row in rows:
+        lines.append(",".join(map(_copy_value, row)))
+
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"{}"'.format(value.replace('"', '""'))
+
+    return str(value)
+
+
+def test_multiline_values_larger_than_one_block():
+    # the reader splits its input in blocks of 1 MB by default
+    descriptions = [
+        f"video {i}\n\nchapters:\n0:00 intro\n1:30 part {i}\n" + "x" * 200
+        for i in range(20_000)
+    ]
+    buf = copy_csv(
+        ["id", "description"], [(i, text) for i, text in enumerate(descriptions)]
+    )
+    assert len(buf.getvalue()) > 3 * pa_csv.ReadOptions().block_size
+
+    table = _parse_csv(buf, [("id", "int4"), ("description", "text")])
+
+    assert table.num_rows == len(descriptions)
+    assert table["description"].to_pylist() == descriptions
+
+
+def test_types():
+    buf = copy_csv(
+        ["created", "duration", "compr", "title"],
+        [
+            ("2022-06-11 12:00:00.123456+02", 90_000_000, "0a0bff", ""),
+            ("2022-06-11 12:00:00-07", None, None, None),
+        ],
+    )
+    columns = [
+        ("created", "timestamptz"),
+        ("duration", "interval"),
+        ("compr", "bytea"),
+        ("title", "text"),
+    ]
+
+    table = _parse_csv(buf, columns)
+
+    assert table.schema.types == [
+        pa.timestamp("us", tz="UTC"),
+        pa.duration("us"),
+        pa.binary(),
+        pa.string(),
+    ]
+    assert table["created"].to_pylist() == [
+        datetime(2022, 6, 11, 10, 0, 0, 123456, tzinfo=timezone.utc),
+        datetime(2022, 6, 11, 19, tzinfo=timezone.utc),
+    ]
+    assert table["duration"].to_pylist() == [timedelta(seconds=90), None]
+    assert table["compr"].to_pylist() == [b"\x0a\x0b\xff", None]
+    # empty strings are quoted by COPY, NULL is not
+    assert table["title"].to_pylist() == ["", None]
+
+
+def test_export_query():
+    query = "SELECT id, length FROM video"
+
+    assert _export_query(query, [("id", "varchar"), ("length", "int4")]) == query
+    assert _export_query(query, [("id", "varchar"), ("length", "interval")]) == (
+        'SELECT "id", (EXTRACT(EPOCH FROM "length") * 1000000)::int8 AS "length" '
+        f"FROM ({query}) q"
+    )
@@ -0,0 +1,42 @@
+"""test_bulk.py, tests for db/bulk.py, with a connection that records statements."""
+
+import asyncio
+
+from youtube_recommender.db.bulk import ORDINAL_COLUMN, copy_upsert
+
+
+class RecordingConnection:
+    """asyncpg connection stand-in, keeps executed SQL and copied records."""
+
+    def __init__(self):
+        self.statements = []
+        self.copied = []
+
+    async def execute(self, query, *args):
+        self.statements.append(" ".join(query.split()))
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copied.append((table, list(columns), list(records)))
+
+    async def fetch(self, query, *args):
+        self.statements.append(" ".join(query.split()))
+        return []
+
+
+def test_last_row_of_a_duplicate_key_wins():
+    conn = RecordingConnection()
+    records = [("c1", "first"), ("c2", "other"), ("c1", "last")]
+
+    asyncio.run(copy_upsert(conn, "channel", ["id", "name"], records))
+
+    create, add_ordinal, merge = conn.statements
+    tmp_table = create.split()[3]
+    assert add_ordinal.endswith(f"ADD COLUMN {ORDINAL_COLUMN} bigserial")
+    # the ordinal is left to its default, numbered in COPY order
+    assert conn.copied == [(tmp_table, ["id", "name"], records)]
+    assert merge == (
+        'INSERT INTO channel ("id", "name") '
+        f'SELECT DISTINCT ON ("id") "id", "name" FROM {tmp_table} '
+        f'ORDER BY "id", {ORDINAL_COLUMN} DESC '
+        'ON CONFLICT ("id") DO UPDATE SET "name" = EXCLUDED."name"'
+    )
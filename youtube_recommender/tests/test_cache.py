@@ -0,0 +1,108 @@
+"""test_cache.py, tests for db/cache.py, with an in-memory cache or one that is down."""
+
+import asyncio
+
+import pandas as pd
+import pytest
+from aiocache import Cache  # type: ignore[import]
+
+from youtube_recommender.db import cache as db_cache
+from youtube_recommender.db.cache import (ArrowSerializer, cached_frame,
+                                          invalidate_view)
+
+VIDEOS = pd.DataFrame(
+    {
+        "channel_id": ["c1", "c1", "c2", "c3"],
+        "video_id": ["v1", "v2", "v3", "v4"],
+        "views": [10, 20, 30, 40],
+    }
+)
+
+
+class DownCache:
+    """Cache whose Redis server cannot be reached."""
+
+    def __init__(self, exc: Exception):
+        self.exc = exc
+
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise self.exc
+
+        return fail
+
+
+def redis_connection_error() -> Exception:
+    exceptions = pytest.importorskip("redis.exceptions")
+    return exceptions.ConnectionError("Error 111 connecting to localhost:6379")
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    caches = {}
+
+    def get_cache(namespace):
+        if namespace not in caches:
+            caches[namespace] = Cache(
+                Cache.MEMORY, namespace=namespace, serializer=ArrowSerializer()
+            )
+        return caches[namespace]
+
+    monkeypatch.setattr(db_cache, "_get_cache", get_cache)
+
+
+def make_getter(name):
+    queried = []
+
+    @cached_frame(name, views=(f"{name}_view",), split_on="channel_id")
+    async def get_videos(asession, channel_ids=None):
+        queried.append(channel_ids)
+        if channel_ids is None:
+            return VIDEOS
+        return VIDEOS[VIDEOS["channel_id"].isin(channel_ids)].reset_index(drop=True)
+
+    return get_videos, queried
+
+
+def test_entries_are_cached_per_id(memory_cache):
+    get_videos, queried = make_getter("test_per_id")
+
+    async def run():
+        first = await get_videos(None, ["c1", "c2"])
+        second = await get_videos(None, ["c2", "c3", "c9"])
+        await invalidate_view("test_per_id_view", ids=["c2"])
+        third = await get_videos(None, ["c2", "c3"])
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first["video_id"].tolist() == ["v1", "v2", "v3"]
+    assert second["video_id"].tolist() == ["v3", "v4"]
+    assert third["video_id"].tolist() == ["v3", "v4"]
+    # only missing and invalidated ids are queried
+    assert queried == [["c1", "c2"], ["c3", "c9"], ["c2"]]
+
+
+def test_queries_db_when_redis_is_down(monkeypatch):
+    exc = redis_connection_error()
+    monkeypatch.setattr(db_cache, "_get_cache", lambda namespace: DownCache(exc))
+    get_videos, queried = make_getter("test_down")
+
+    async def run():
+        return await get_videos(None, ["c1"]), await get_videos(None)
+
+    by_id, everything = asyncio.run(run())
+
+    assert by_id["video_id"].tolist() == ["v1", "v2"]
+    assert len(everything) == len(VIDEOS)
+    # the db is queried once per call, not again after the cache failed
+    assert queried == [["c1"], None]
+
+
+def test_invalidate_view_never_raises(monkeypatch):
+    exc = redis_connection_error()
+    monkeypatch.setattr(db_cache, "_get_cache", lambda namespace: DownCache(exc))
+    make_getter("test_invalidate")
+
+    asyncio.run(invalidate_view("test_invalidate_view", ids=["c1"]))
+    asyncio.run(invalidate_view("test_invalidate_view"))
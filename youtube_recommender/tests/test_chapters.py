@@ -0,0 +1,203 @@
+"""test_chapters.py, tests for chapter extraction in db/helpers.py."""
+
+import random
+import re
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from youtube_recommender.db.helpers import (chapter_locations_to_df,
+                                            find_chapter_locations,
+                                            replace_pat, time_pattern)
+
+COLUMNS = [
+    "video_id",
+    "video_length",
+    "video_end",
+    "s",
+    "name",
+    "start",
+    "start_seconds",
+    "end",
+    "end_seconds",
+    "sub_id",
+]
+
+
+def videos(*descriptions, length=600):
+    return pd.DataFrame(
+        {
+            "id": [f"v{i}" for i in range(len(descriptions))],
+            "title": [f"title {i}" for i in range(len(descriptions))],
+            "length": length,
+            "description": descriptions,
+        }
+    )
+
+
+def test_find_chapter_locations():
+    df = find_chapter_locations(
+        videos(
+            "⌨️ (0:00:00) Introduction\n⌨️ (0:00:34) Colab intro (importing wine dataset)",
+            "no chapters here",
+            None,
+            "0:01:00- first\n0:02:00] second",
+        )
+    )
+
+    assert df["video_id"].tolist() == ["v0", "v0", "v3", "v3"]
+    assert df["s"].tolist() == ["0:00:00", "0:00:34", "0:01:00", "0:02:00"]
+    assert df["name"].tolist() == [
+        "Introduction",
+        "Colab intro (importing wine dataset)",
+        "first",
+        "second",
+    ]
+    assert (df["video_end"] == timedelta(seconds=600)).all()
+
+
+def test_no_chapters():
+    assert find_chapter_locations(videos("nothing", None)).empty
+    assert find_chapter_locations(videos()).empty
+    assert chapter_locations_to_df([]).empty
+
+
+def test_chapter_locations_to_df():
+    locations = [
+        # H:M:S and M:S
+        {"video_id": "v1", "video_length": 4000, "s": "0:00:00", "name": "intro"},
+        {"video_id": "v1", "video_length": 4000, "s": "23:20", "name": "middle"},
+        {"video_id": "v1", "video_length": 4000, "s": "1:02:03", "name": "end"},
+        {"video_id": "v2", "video_length": 90, "s": "0:30", "name": "only"},
+        # duplicate chapter of v1
+        {"video_id": "v1", "video_length": 4000, "s": "0:00:00", "name": "intro"},
+    ]
+
+    df = chapter_locations_to_df(locations)
+
+    rows = df[["video_id", "name", "start_seconds", "end_seconds", "sub_id"]]
+    assert rows.values.tolist() == [
+        ["v1", "intro", 0, 1400, 0],
+        ["v2", "only", 30, 90, 0],
+        ["v1", "middle", 1400, 3723, 1],
+        # ends where the next listed chapter starts, the repeated intro
+        ["v1", "end", 3723, 0, 2],
+    ]
+    assert df["start"].tolist() == [
+        timedelta(0),
+        timedelta(seconds=30),
+        timedelta(minutes=23, seconds=20),
+        timedelta(hours=1, minutes=2, seconds=3),
+    ]
+    assert df["end"].iloc[0] == timedelta(minutes=23, seconds=20)
+
+
+def test_invalid_times_are_dropped():
+    locations = [
+        {"video_id": "v1", "video_length": 60, "s": "1:2:3:4", "name": "bad"},
+        {"video_id": "v1", "video_length": 60, "s": "0:10", "name": "good"},
+    ]
+
+    df = chapter_locations_to_df(locations)
+
+    assert df["name"].tolist() == ["good"]
+    assert df["end_seconds"].tolist() == [60]
+
+
+# ====== ROW-WISE IMPLEMENTATION ======
+# the implementation before chapter extraction was vectorized, kept to check equivalence
+
+
+def parse_time_rowwise(row, levels=("seconds", "minutes", "hours")):
+    parts = row.s.split(":")[::-1]
+    if len(parts) > 3:
+        return None
+
+    dd_level = defaultdict(int)
+    for part, level in zip(parts, levels):
+        dd_level[level] = int(part)
+
+    return timedelta(**dd_level)
+
+
+def find_chapter_locations_rowwise(video_recs):
+    ret = []
+    for video_rec in video_recs:
+        for r in time_pattern.findall(video_rec["description"]):
+            ret.append(
+                {
+                    "video_id": video_rec["id"],
+                    "video_length": video_rec["length"],
+                    "video_end": timedelta(seconds=video_rec["length"]),
+                    "s": r[0],
+                    "name": re.sub(replace_pat, "", r[1]).strip(),
+                }
+            )
+
+    return ret
+
+
+def chapter_locations_to_df_rowwise(ret):
+    df = pd.DataFrame(ret)
+    if df.empty:
+        return df
+
+    df["start"] = df.apply(parse_time_rowwise, axis=1)
+    df["start_seconds"] = df["start"].dt.total_seconds().astype(int)
+
+    by_vid = df.groupby("video_id")
+    df["end"] = by_vid["start"].shift(-1)
+    df["end"] = np.where(df["end"].isnull(), df["video_end"], df["end"])
+    df["end_seconds"] = df["end"].dt.total_seconds().astype(int)
+
+    df = df.sort_values(["start", "end"])
+    df = df.drop_duplicates(subset=["video_id", "name", "start"])
+
+    df["sub_id"] = by_vid["video_id"].cumcount()
+
+    return df
+
+
+def synthetic_videos(n, seed=0):
+    rnd = random.Random(seed)
+    recs = []
+    for i in range(n):
+        length = rnd.randint(60, 4 * 3600)
+        starts = sorted(rnd.sample(range(length), rnd.randint(0, 8)))
+        lines = [
+            f"{rnd.choice(['', '⌨️ (', '[', '- '])}{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}"
+            f"{rnd.choice([') ', '] ', ' - ', ' '])}chapter {j}"
+            for j, s in enumerate(starts)
+        ]
+        if lines and rnd.random() < 0.2:
+            # chapter listed twice in the description
+            lines.append(lines[0])
+        recs.append(
+            {
+                "id": f"vid{i}",
+                "title": f"video {i}",
+                "length": length,
+                "description": "\n".join(["intro text"] + lines + ["outro"]),
+            }
+        )
+
+    # videos that were scraped twice
+    return recs + rnd.sample(recs, n // 10)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_equivalent_to_rowwise(seed):
+    recs = synthetic_videos(500, seed=seed)
+
+    expected = chapter_locations_to_df_rowwise(find_chapter_locations_rowwise(recs))
+    df = chapter_locations_to_df(find_chapter_locations(recs))
+
+    assert len(expected) > 1_000
+    key = ["video_id", "sub_id"]
+    pd.testing.assert_frame_equal(
+        df[COLUMNS].sort_values(key).reset_index(drop=True),
+        expected[COLUMNS].sort_values(key).reset_index(drop=True),
+    )
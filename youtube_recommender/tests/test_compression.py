@@ -0,0 +1,114 @@
+"""test_compression.py, codec round-trips of db/compression.py."""
+
+import asyncio
+import zlib
+
+import pytest
+import zstandard as zstd  # type: ignore[import]
+
+from youtube_recommender.db import compression
+from youtube_recommender.db.compression import (CODEC_ZLIB, CODEC_ZSTD,
+                                                codec_tag, decode,
+                                                decode_many, encode,
+                                                ensure_dictionaries,
+                                                register_dictionary,
+                                                train_dictionary)
+
+TEXTS = [
+    "hello everyone and welcome back to the channel, today we are going to look at "
+    f"part {i} of the series about python and pandas. don't forget to subscribe"
+    for i in range(500)
+] + ["", "ünïcødé ✓ 字幕"]
+
+
+@pytest.fixture(autouse=True)
+def stored(monkeypatch):
+    """Dictionaries in table caption_dictionary, none loaded in this process."""
+    stored = []
+    monkeypatch.setattr(compression, "_dictionaries", {})
+    monkeypatch.setattr(compression, "_compressors", {})
+    monkeypatch.setattr(compression, "_decompressors", {})
+    monkeypatch.setattr(compression, "_fetch_dictionaries", lambda: list(stored))
+
+    return stored
+
+
+@pytest.fixture
+def dictionary_tag():
+    return register_dictionary(train_dictionary(TEXTS, dict_size=4_096))
+
+
+def test_zlib_is_compatible_with_stored_captions():
+    compr = encode(TEXTS[0], CODEC_ZLIB)
+
+    assert compr == zlib.compress(TEXTS[0].encode())
+    assert decode(compr, CODEC_ZLIB) == TEXTS[0]
+
+
+@pytest.mark.parametrize("text", [TEXTS[0], "", "ünïcødé ✓ 字幕"])
+def test_zstd_roundtrip(text):
+    assert decode(encode(text, CODEC_ZSTD), CODEC_ZSTD) == text
+
+
+def test_zstd_dictionary_roundtrip(dictionary_tag):
+    assert codec_tag(CODEC_ZSTD) == dictionary_tag
+    assert codec_tag(CODEC_ZLIB) == CODEC_ZLIB
+
+    comprs = [encode(text, dictionary_tag) for text in TEXTS]
+
+    assert [decode(compr, dictionary_tag) for compr in comprs] == TEXTS
+    # the dictionary holds the shared phrasing
+    assert len(comprs[0]) < len(encode(TEXTS[0], CODEC_ZSTD))
+
+
+def test_decode_many_mixed_codecs(dictionary_tag):
+    tags = [CODEC_ZLIB, CODEC_ZSTD, dictionary_tag]
+    comprs = [encode(TEXTS[i], tag) for i, tag in enumerate(tags)]
+
+    assert decode_many(comprs, tags) == TEXTS[:3]
+
+
+def test_codec_tag_without_dictionary():
+    assert codec_tag(CODEC_ZSTD) == CODEC_ZSTD
+
+    with pytest.raises(ValueError):
+        codec_tag("lz4")
+
+
+def test_unknown_dictionary(dictionary_tag):
+    compr = encode(TEXTS[0], dictionary_tag)
+    compression._dictionaries.clear()
+    compression._decompressors.clear()
+
+    with pytest.raises(KeyError):
+        decode(compr, dictionary_tag)
+
+
+def test_dictionary_trained_by_another_process(dictionary_tag, stored):
+    # trained and stored after this process loaded its dictionaries
+    newer = train_dictionary(TEXTS[::-1], dict_size=2_048)
+    newer_tag = f"{CODEC_ZSTD}:{newer.dict_id()}"
+    compr = zstd.ZstdCompressor(dict_data=newer).compress(TEXTS[0].encode())
+    stored += [d.as_bytes() for d in compression._dictionaries.values()]
+    stored += [newer.as_bytes()]
+
+    assert decode(compr, newer_tag) == TEXTS[0]
+    # new captions are compressed with the newest dictionary
+    assert codec_tag(CODEC_ZSTD) == newer_tag
+
+
+def test_ensure_dictionaries_reloads_on_unknown_tags(monkeypatch, dictionary_tag):
+    loads = []
+
+    async def load_dictionaries(asession):
+        loads.append(asession)
+
+    monkeypatch.setattr(compression, "load_dictionaries", load_dictionaries)
+
+    async def run():
+        await ensure_dictionaries("asession", [CODEC_ZLIB, dictionary_tag])
+        await ensure_dictionaries("asession", [CODEC_ZSTD, f"{CODEC_ZSTD}:1234"])
+
+    asyncio.run(run())
+
+    assert loads == ["asession"]
@@ -0,0 +1,100 @@
+"""test_data_methods.py, tests for the record builders and pandas options of data_methods.py."""
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from youtube_recommender.data_methods import data_methods as dm
+from youtube_recommender.data_methods import set_copy_on_write
+
+COMMENTS = pd.DataFrame(
+    {
+        "id": ["c1", "c2", "c1"],
+        "text": ["first", "second", "first again"],
+        "votes": [1, 2, 3],
+        "channel": ["ch1", "ch2", "ch1"],
+        "video_id": ["v1", "v1", "v1"],
+        "time_parsed": pd.to_datetime(["2022-01-01", "2022-01-02", "2022-01-03"]),
+    }
+)
+
+
+@pytest.fixture
+def copy_on_write():
+    try:
+        pd.get_option("mode.copy_on_write")
+    except KeyError:
+        pytest.skip(f"pandas {pd.__version__} has no copy-on-write mode")
+
+    with pd.option_context("mode.copy_on_write", False):
+        yield
+
+
+def test_import_leaves_pandas_options_alone(copy_on_write):
+    # in a fresh process, this one imported data_methods already
+    code = (
+        "import pandas as pd\n"
+        "from youtube_recommender import settings\n"
+        "settings.PANDAS_COPY_ON_WRITE = True\n"
+        "import youtube_recommender.data_methods\n"
+        "print(pd.get_option('mode.copy_on_write'))\n"
+    )
+    # pandas 1.5 reads this variable itself as the option default
+    env = {k: v for k, v in os.environ.items() if k != "PANDAS_COPY_ON_WRITE"}
+
+    out = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.split()[-1] == "False"
+
+
+def test_set_copy_on_write(copy_on_write):
+    set_copy_on_write(False)
+    assert pd.get_option("mode.copy_on_write") is False
+
+    set_copy_on_write(True)
+    assert pd.get_option("mode.copy_on_write") is True
+
+
+def test_comment_recs_keep_first():
+    recs = dm._make_comment_recs_scylla(COMMENTS)
+
+    assert list(recs) == ["c1", "c2"]
+    assert recs["c1"] == {
+        "id": "c1",
+        "text": "first",
+        "votes": 1,
+        "channel_id": "ch1",
+        "video_id": "v1",
+        "time_parsed": pd.Timestamp("2022-01-01"),
+    }
+
+
+def test_caption_recs_keep_last():
+    df = pd.DataFrame(
+        {
+            "video_id": ["v1", "v2", "v1"],
+            "text_len": [10, 20, 30],
+            "compr": [b"a", b"b", b"c"],
+            "compr_length": [1, 1, 1],
+            "codec": ["zlib", "zlib", "zstd"],
+            "language_code": ["en", "nl", "en"],
+        }
+    )
+
+    recs = dm._make_caption_recs(df)
+
+    assert list(recs) == ["v1", "v2"]
+    assert recs["v1"] == {
+        "video_id": "v1",
+        "length": 30,
+        "compr": b"c",
+        "compr_length": 1,
+        "codec": "zstd",
+        "lang": "en",
+    }
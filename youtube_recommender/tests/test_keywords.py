@@ -0,0 +1,103 @@
+"""test_keywords.py, tests for the keyword rows of data_methods.py."""
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from youtube_recommender.data_methods import data_methods as dm
+
+
+def keyword_ids(kdf):
+    return {k: i for i, k in enumerate(kdf["keyword"].cat.categories, start=100)}
+
+
+def test_explode_keywords():
+    vdf = pd.DataFrame(
+        {
+            "video_id": ["v1", "v2", "v3", "v4", "v5"],
+            "keywords": [
+                ["python", "pandas", "python"],
+                np.array(["rust", "python"], dtype=object),
+                np.nan,
+                [],
+                ["pandas", None],
+            ],
+        }
+    )
+
+    kdf = dm._explode_keywords(vdf)
+
+    assert kdf["keyword"].dtype == "category"
+    assert sorted(kdf["keyword"].cat.categories) == ["pandas", "python", "rust"]
+    assert list(zip(kdf["video_id"], kdf["keyword"])) == [
+        ("v1", "python"),
+        ("v1", "pandas"),
+        ("v2", "rust"),
+        ("v2", "python"),
+        ("v5", "pandas"),
+    ]
+    # the caller's frame is left alone
+    assert isinstance(vdf.loc[1, "keywords"], np.ndarray)
+
+
+def test_no_keywords_column():
+    kdf = dm._explode_keywords(pd.DataFrame({"video_id": ["v1"]}))
+
+    assert kdf.empty
+    assert kdf["keyword"].dtype == "category"
+    assert dm._make_video_keyword_recs(kdf, {}) == []
+
+
+def test_make_video_keyword_recs():
+    vdf = pd.DataFrame(
+        {"video_id": ["v1", "v2"], "keywords": [["a", "b"], ["b", "c", "b"]]}
+    )
+    kdf = dm._explode_keywords(vdf)
+
+    recs = dm._make_video_keyword_recs(kdf, {"a": 1, "b": 2, "c": 3})
+
+    assert recs == [("v1", 1), ("v1", 2), ("v2", 2), ("v2", 3)]
+    assert all(isinstance(id_, int) for _, id_ in recs)
+
+
+# ====== PREVIOUS BUILDER ======
+# the set-based builder before keywords were exploded, kept to check equivalence
+
+
+def keyword_names_setwise(df):
+    keywords = df["keywords"].map(list).to_list()
+    return set(sum(keywords, []))
+
+
+def video_keyword_recs_setwise(df, keyword_ids):
+    return {
+        (video_id, keyword_ids[keyword])
+        for video_id, keywords in zip(df["video_id"], df["keywords"])
+        for keyword in keywords
+    }
+
+
+def test_equivalent_to_setwise():
+    rnd = random.Random(0)
+    vocabulary = [f"keyword{i}" for i in range(300)]
+    keywords = [rnd.choices(vocabulary, k=rnd.randint(0, 12)) for _ in range(2_000)]
+    vdf = pd.DataFrame(
+        {
+            # videos that were scraped twice
+            "video_id": [f"v{rnd.randrange(1_800)}" for _ in keywords],
+            # lists as scraped, arrays as loaded from feather
+            "keywords": [
+                kws if i % 2 else np.array(kws, dtype=object)
+                for i, kws in enumerate(keywords)
+            ],
+        }
+    )
+
+    kdf = dm._explode_keywords(vdf)
+    ids = keyword_ids(kdf)
+    recs = dm._make_video_keyword_recs(kdf, ids)
+
+    assert set(kdf["keyword"].cat.categories) == keyword_names_setwise(vdf)
+    assert len(recs) == len(set(recs))
+    assert set(recs) == video_keyword_recs_setwise(vdf, ids)
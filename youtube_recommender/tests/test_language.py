@@ -0,0 +1,92 @@
+"""test_language.py, tests for language.py."""
+
+import pytest
+
+from youtube_recommender import language
+from youtube_recommender.language import classify_texts, clear_cache, sample_text
+
+TEXTS = [
+    "this is a video about machine learning in python, we train a model on wine data",
+    "dit is een video over machine learning met python, we trainen een model",
+    "dies ist ein Video über maschinelles Lernen mit Python und einem Modell",
+]
+
+
+@pytest.fixture
+def classified(monkeypatch):
+    """Samples passed to the classifier, per call."""
+    calls = []
+    classify_samples = language._classify_samples
+
+    def record(samples, nprocess):
+        calls.append(list(samples))
+        return classify_samples(samples, nprocess)
+
+    monkeypatch.setattr(language, "_cache", {})
+    monkeypatch.setattr(language, "_classify_samples", record)
+
+    return calls
+
+
+def test_sample_text():
+    text = "a" * 1_000 + "b" * 1_000
+
+    assert sample_text("short", nchar=10) == "short"
+    assert sample_text(text[:10], nchar=10) == text[:10]
+    sample = sample_text(text, nchar=100)
+    assert sample == "a" * 50 + " " + "a" * 25 + "b" * 25
+    # deterministic, so the cache can key on it
+    assert sample_text(text, nchar=100) == sample
+
+
+def test_classify_texts(classified):
+    codes, confs = classify_texts(TEXTS + [None], nprocess=1)
+
+    assert codes[:3] == ["en", "nl", "de"]
+    assert confs.dtype == "float32"
+    assert ((confs >= 0) & (confs <= 1)).all()
+    assert len(codes) == len(confs) == 4
+
+
+def test_cache_hits_and_changed_texts(classified):
+    ids = ["v1", "v2", "v3"]
+
+    first = classify_texts(TEXTS, ids=ids, column="title", nprocess=1)
+    second = classify_texts(TEXTS, ids=ids, column="title", nprocess=1)
+    changed = [TEXTS[0], TEXTS[2], TEXTS[2]]
+    third = classify_texts(changed, ids=ids, column="title", nprocess=1)
+    # other column, other cache entries
+    classify_texts(TEXTS[:1], ids=ids[:1], column="text", nprocess=1)
+
+    assert second[0] == first[0]
+    assert second[1].tolist() == first[1].tolist()
+    assert third[0] == ["en", "de", "de"]
+    assert classified == [TEXTS, [], [TEXTS[2]], TEXTS[:1]]
+
+
+def test_texts_without_ids_are_not_cached(classified):
+    classify_texts(TEXTS, nprocess=1)
+    classify_texts(TEXTS, nprocess=1)
+
+    assert classified == [TEXTS, TEXTS]
+    assert language._cache == {}
+
+
+def test_clear_cache(classified):
+    classify_texts(TEXTS, ids=["v1", "v2", "v3"], nprocess=1)
+    clear_cache()
+    classify_texts(TEXTS, ids=["v1", "v2", "v3"], nprocess=1)
+
+    assert classified == [TEXTS, TEXTS]
+
+
+def test_pool_matches_serial(monkeypatch):
+    texts = TEXTS * 4
+    monkeypatch.setattr(language, "LANGUAGE_MIN_PARALLEL", 2)
+    monkeypatch.setattr(language, "LANGUAGE_CHUNKSIZE", 5)
+    monkeypatch.setattr(language.os, "cpu_count", lambda: 2)
+
+    serial = language._classify_samples(texts, nprocess=1)
+    pooled = language._classify_samples(texts, nprocess=2)
+
+    assert pooled == serial
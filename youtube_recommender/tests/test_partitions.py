@@ -0,0 +1,76 @@
+"""test_partitions.py, tests for db/partitions.py, with a connection that records statements."""
+
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+
+from youtube_recommender.db.partitions import (MAX_TIME, MIN_TIME,
+                                               comment_partition_bounds,
+                                               create_comment_partition_sql,
+                                               ensure_comment_partitions,
+                                               time_window)
+
+
+class RecordingConnection:
+    """asyncpg connection stand-in, `default_rows` is the number of rows the default partition holds per year."""
+
+    def __init__(self, partitions, default_rows=None):
+        self.partitions = partitions
+        self.default_rows = default_rows or {}
+        self.statements = []
+
+    async def fetch(self, query, *args):
+        return [{"relname": name} for name in self.partitions]
+
+    async def fetchval(self, query, start, end):
+        return self.default_rows.get(start.year, 0) > 0
+
+    async def execute(self, query, *args):
+        self.statements.append(" ".join(query.split()))
+        if query.lstrip().startswith("WITH moved"):
+            return f"INSERT 0 {self.default_rows.get(args[0].year, 0)}"
+        return "OK"
+
+
+def test_time_window():
+    since = datetime(2021, 1, 1)
+
+    assert time_window() == {"since": MIN_TIME, "until": MAX_TIME}
+    assert time_window(since=since) == {"since": since, "until": MAX_TIME}
+
+
+def test_partition_bounds_and_sql():
+    assert comment_partition_bounds(2021) == (datetime(2021, 1, 1), datetime(2022, 1, 1))
+    assert " ".join(create_comment_partition_sql(2021).split()) == (
+        "CREATE TABLE IF NOT EXISTS comment_y2021 PARTITION OF comment "
+        "FOR VALUES FROM ('2021-01-01T00:00:00') TO ('2022-01-01T00:00:00')"
+    )
+
+
+def test_only_missing_partitions_are_created():
+    conn = RecordingConnection(["comment_y2021", "comment_default"])
+    times = pd.Series([datetime(2021, 5, 1), datetime(2022, 2, 1), pd.NaT])
+
+    created = asyncio.run(ensure_comment_partitions(conn, times))
+
+    assert created == ["comment_y2022"]
+    assert conn.statements == [" ".join(create_comment_partition_sql(2022).split())]
+
+
+def test_default_partition_rows_are_moved():
+    conn = RecordingConnection(["comment_default"], default_rows={2020: 3})
+
+    created = asyncio.run(
+        ensure_comment_partitions(conn, [datetime(2019, 1, 1), datetime(2020, 6, 1)])
+    )
+
+    assert created == ["comment_y2019", "comment_y2020"]
+    assert [statement.split(" (")[0] for statement in conn.statements] == [
+        # no rows of 2019 in the default partition, plain create
+        "CREATE TABLE IF NOT EXISTS comment_y2019 PARTITION OF comment FOR VALUES FROM",
+        "ALTER TABLE comment DETACH PARTITION comment_default",
+        "CREATE TABLE IF NOT EXISTS comment_y2020 PARTITION OF comment FOR VALUES FROM",
+        "WITH moved AS",
+        "ALTER TABLE comment ATTACH PARTITION comment_default DEFAULT",
+    ]
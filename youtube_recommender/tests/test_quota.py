@@ -0,0 +1,121 @@
+"""test_quota.py, tests for quota.py."""
+
+import asyncio
+import json
+
+import pytest
+
+from youtube_recommender.quota import (FileQuotaStore, QuotaExceeded,
+                                       QuotaScheduler, quota_day)
+
+COSTS = {"search": 100, "videos": 1, "channels": 1}
+# one page of search results, enriched with videos.list and channels.list
+PAGE_COST = 102
+
+
+class MemoryQuotaStore:
+    """Quota store that yields to the event loop inside incr, like a network store."""
+
+    def __init__(self):
+        self.spent = {}
+
+    async def get(self, day):
+        return self.spent.get(day, 0)
+
+    async def incr(self, day, units):
+        await asyncio.sleep(0)
+        self.spent[day] = self.spent.get(day, 0) + units
+        return self.spent[day]
+
+    async def flush(self):
+        pass
+
+
+def make_scheduler(daily_quota, store=None):
+    return QuotaScheduler(
+        store or MemoryQuotaStore(), daily_quota=daily_quota, costs=COSTS
+    )
+
+
+def test_plan_fits_all_terms():
+    quota = make_scheduler(10_000)
+    plan = asyncio.run(quota.plan(["a", "b"], n=120))
+
+    assert plan == {"a": 120, "b": 120}
+    assert quota.deferred == []
+
+
+def test_plan_gives_every_term_one_page_first():
+    quota = make_scheduler(4 * PAGE_COST)
+    plan = asyncio.run(quota.plan(["a", "b", "c"], n=150))
+
+    # three first pages, one extra page for the first term
+    assert plan == {"a": 100, "b": 50, "c": 50}
+
+
+def test_plan_defers_low_priority_terms():
+    quota = make_scheduler(2 * PAGE_COST)
+    plan = asyncio.run(quota.plan(["a", "b", "c"], n=50, priorities={"c": 1}))
+
+    assert plan == {"c": 50, "a": 50}
+    assert quota.deferred == ["b"]
+
+
+def test_charge_refuses_when_budget_is_spent():
+    quota = make_scheduler(150)
+
+    async def run():
+        await quota.charge("search")
+        with pytest.raises(QuotaExceeded):
+            await quota.charge("search")
+        return await quota.store.get(quota_day())
+
+    # the refused charge is rolled back
+    assert asyncio.run(run()) == 100
+    assert quota.spent["search"] == 100
+
+
+def test_concurrent_charges_never_overspend():
+    quota = make_scheduler(1_000)
+
+    async def charge():
+        try:
+            await quota.charge("search")
+            return True
+        except QuotaExceeded:
+            return False
+
+    async def run():
+        return await asyncio.gather(*(charge() for _ in range(25)))
+
+    charged = asyncio.run(run())
+
+    assert sum(charged) == 10
+    assert asyncio.run(quota.store.get(quota_day())) == 1_000
+
+
+def test_refund():
+    quota = make_scheduler(1_000)
+
+    async def run():
+        await quota.charge("search")
+        await quota.refund("search")
+        return await quota.remaining()
+
+    assert asyncio.run(run()) == 1_000
+    assert quota.spent["search"] == 0
+
+
+def test_file_store_writes_on_flush(tmp_path):
+    path = tmp_path / "quota.json"
+    quota = make_scheduler(1_000, store=FileQuotaStore(path))
+
+    asyncio.run(quota.charge("search"))
+    assert not path.exists()
+
+    asyncio.run(quota.flush())
+    assert json.loads(path.read_text()) == {quota_day(): 100}
+
+    # a new run continues from the file
+    quota = make_scheduler(1_000, store=FileQuotaStore(path))
+    assert asyncio.run(quota.remaining()) == 900
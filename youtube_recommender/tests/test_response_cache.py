@@ -0,0 +1,76 @@
+"""test_response_cache.py, tests for response_cache.py."""
+
+import asyncio
+
+import pytest
+
+from youtube_recommender.response_cache import ResponseCache, SqliteCacheStore
+
+PARAMS = {"q": "python", "part": "snippet"}
+PAYLOAD = {"etag": "abc", "items": [{"id": "v1"}]}
+
+
+class DownStore:
+    """Cache store whose backend cannot be reached."""
+
+    def __init__(self, exc: Exception):
+        self.exc = exc
+
+    async def multi_get(self, keys):
+        raise self.exc
+
+    async def multi_set(self, entries, ttl):
+        raise self.exc
+
+
+def redis_errors():
+    exceptions = pytest.importorskip("redis.exceptions")
+    return [exceptions.ConnectionError("down"), exceptions.TimeoutError("slow")]
+
+
+def roundtrip(cache: ResponseCache):
+    async def run():
+        await cache.set("search", PARAMS, PAYLOAD, etag="abc")
+        return await cache.get("search", PARAMS)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "exc", [ConnectionRefusedError("refused"), asyncio.TimeoutError()]
+)
+def test_falls_back_to_sqlite(tmp_path, exc):
+    cache = ResponseCache(DownStore(exc), fallback_path=tmp_path / "cache.db")
+
+    entry = roundtrip(cache)
+
+    assert isinstance(cache.store, SqliteCacheStore)
+    assert entry["payload"] == PAYLOAD
+    assert cache.hits == 1
+
+
+def test_falls_back_to_sqlite_on_redis_errors(tmp_path):
+    for i, exc in enumerate(redis_errors()):
+        cache = ResponseCache(DownStore(exc), fallback_path=tmp_path / f"{i}.db")
+
+        assert roundtrip(cache)["payload"] == PAYLOAD
+        assert isinstance(cache.store, SqliteCacheStore)
+
+
+def test_sqlite_errors_are_raised(tmp_path):
+    cache = ResponseCache(SqliteCacheStore(tmp_path / "missing" / "cache.db"))
+
+    with pytest.raises(Exception):
+        roundtrip(cache)
+
+
+def test_items_are_cached_per_id(tmp_path):
+    cache = ResponseCache(SqliteCacheStore(tmp_path / "cache.db"))
+    items = [{"id": "v1", "etag": "a"}, {"id": "v2", "etag": "b"}]
+
+    async def run():
+        await cache.set_items("videos", "snippet", items)
+        return await cache.get_items("videos", "snippet", ["v2", "v3"])
+
+    assert asyncio.run(run()) == {"v2": items[1]}
+    assert (cache.hits, cache.misses) == (1, 1)
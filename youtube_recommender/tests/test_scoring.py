@@ -0,0 +1,56 @@
+"""test_scoring.py, tests for scoring.py."""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from youtube_recommender.scoring import score_videos
+
+NOW = datetime(2022, 6, 11, 12)
+
+
+def make_df(publish_date):
+    return pd.DataFrame(
+        {
+            "views": [1_000, 10_000, 500],
+            "num_subscribers": [100, 1_000_000, 0],
+            "publish_date": publish_date,
+        }
+    )
+
+
+def custom_score(views, subs, days):
+    """Score of a single video, as computed per search result before vectorizing."""
+    ratio = views / subs if subs else 0
+    return views * min(ratio, 5) / max(days, 1)
+
+
+def test_score_videos_matches_scalar_score():
+    dates = [datetime(2022, 6, 1, 12), datetime(2022, 1, 1), datetime(2022, 6, 11, 8)]
+    df = score_videos(make_df(dates), now=NOW)
+
+    expected = [custom_score(1_000, 100, 10), custom_score(10_000, 1_000_000, 161), 0]
+    assert df["custom_score"].tolist() == pytest.approx(expected)
+    assert df["view_subscriber_atio"].tolist() == pytest.approx([10, 0.01, 0])
+
+
+def test_score_videos_same_age_for_naive_and_aware_dates():
+    # API rows are naive UTC, cached rows from the database are tz-aware
+    naive = pd.to_datetime(["2022-06-01 12:00", "2022-01-01", "2022-06-11 08:00"])
+    aware = naive.tz_localize("UTC").tz_convert("Europe/Amsterdam")
+
+    scores = score_videos(make_df(naive), now=NOW)["custom_score"]
+    aware_scores = score_videos(make_df(aware), now=NOW)["custom_score"]
+
+    assert aware_scores.tolist() == scores.tolist()
+
+
+def test_score_videos_aware_now():
+    dates = [datetime(2022, 6, 1, 12), datetime(2022, 1, 1), datetime(2022, 6, 11, 8)]
+    now = pd.Timestamp(NOW).tz_localize("UTC").tz_convert("America/Los_Angeles")
+
+    scores = score_videos(make_df(dates), now=NOW)["custom_score"]
+    aware_scores = score_videos(make_df(dates), now=now)["custom_score"]
+
+    assert aware_scores.tolist() == scores.tolist()
@@ -0,0 +1,54 @@
+"""test_summary.py, tests for the channel_summary deltas of db/summary.py."""
+
+from datetime import datetime
+
+from youtube_recommender.db.bulk import _returning
+from youtube_recommender.db.summary import video_deltas
+
+T1 = datetime(2022, 6, 1)
+T2 = datetime(2022, 6, 2)
+
+
+def video_row(id_, channel_id, views, inserted, updated=T1):
+    return {
+        "id": id_,
+        "channel_id": channel_id,
+        "views": views,
+        "updated": updated,
+        "inserted": inserted,
+    }
+
+
+def test_new_videos_add_counts_and_views():
+    rows = [
+        video_row("v1", "c1", 100, True),
+        video_row("v2", "c1", 50, True, updated=T2),
+        video_row("v3", "c2", None, True),
+    ]
+
+    assert video_deltas({}, rows) == {"c1": (2, 150, T2), "c2": (1, 0, T1)}
+
+
+def test_updated_videos_add_view_differences():
+    old = {"v1": ("c1", 100), "v2": ("c1", 80)}
+    rows = [video_row("v1", "c1", 130, False), video_row("v2", "c1", 80, False)]
+
+    assert video_deltas(old, rows) == {"c1": (0, 30, T1)}
+
+
+def test_video_moved_to_another_channel():
+    old = {"v1": ("c1", 100)}
+    rows = [video_row("v1", "c2", 120, False)]
+
+    assert video_deltas(old, rows) == {"c1": (-1, -100, None), "c2": (1, 120, T1)}
+
+
+def test_video_inserted_concurrently_is_not_counted_twice():
+    # not locked before the upsert, but updated: another push inserted and counted it
+    rows = [video_row("v1", "c1", 120, False)]
+
+    assert video_deltas({}, rows) == {"c1": (0, 0, T1)}
+
+
+def test_returning_inserted():
+    assert _returning(["id", "inserted"]) == '"id", (xmax = 0) AS inserted'
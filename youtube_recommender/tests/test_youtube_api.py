@@ -0,0 +1,74 @@
+"""test_youtube_api.py, tests for youtube_api.py against the fake YouTube API."""
+
+import asyncio
+import socket
+
+import pytest
+from aiohttp import ClientConnectorError, web
+
+from youtube_recommender.fake_youtube_api import (API_PREFIX, FakeYouTubeApi,
+                                                  generate_fixtures)
+from youtube_recommender.quota import QuotaScheduler
+from youtube_recommender.youtube_api import YouTubeClient
+
+from .test_quota import COSTS, MemoryQuotaStore
+
+
+async def serve(api: FakeYouTubeApi) -> web.AppRunner:
+    runner = web.AppRunner(api.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+
+    return runner
+
+
+def base_url(runner: web.AppRunner) -> str:
+    port = runner.addresses[0][1]
+    return f"http://127.0.0.1:{port}{API_PREFIX}"
+
+
+def test_cancelled_call_waiting_for_a_slot_is_not_charged():
+    api = FakeYouTubeApi(generate_fixtures(nvideo=100, nchannel=5), latency=0.2)
+    quota = QuotaScheduler(MemoryQuotaStore(), daily_quota=10_000, costs=COSTS)
+
+    async def run():
+        runner = await serve(api)
+        client = YouTubeClient(
+            "key", base_url=base_url(runner), max_concurrency=1, quota=quota
+        )
+        try:
+            async with client:
+                first = asyncio.ensure_future(client.search_list("python"))
+                await asyncio.sleep(0.05)
+                # waits for the only slot, like a prefetched page that is closed early
+                second = asyncio.ensure_future(client.search_list("music"))
+                await asyncio.sleep(0.05)
+                second.cancel()
+                await first
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+    assert api.requests["search"] == 1
+    assert quota.spent["search"] == COSTS["search"]
+    assert api.quota_used == quota.spent["search"]
+
+
+def test_call_that_cannot_connect_is_refunded():
+    quota = QuotaScheduler(MemoryQuotaStore(), daily_quota=10_000, costs=COSTS)
+    with socket.socket() as sock:
+        # a port nothing listens on
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def run():
+        url = f"http://127.0.0.1:{port}{API_PREFIX}"
+        async with YouTubeClient("key", base_url=url, quota=quota) as client:
+            await client.search_list("python")
+
+    with pytest.raises(ClientConnectorError):
+        asyncio.run(run())
+
+    assert quota.calls["search"] == 0
+    assert asyncio.run(quota.remaining()) == 10_000
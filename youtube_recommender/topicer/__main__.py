@@ -12,11 +12,12 @@ from typing import Any, Dict, List
 import pyperclip
 import uvloop
 from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import get_async_session, get_session
 
 from ..caption_finder import (adownload_captions, captions_to_df, save_feather,
                               select_video_ids)
 from ..data_methods import data_methods as dm
+from ..data_methods import set_copy_on_write
+from ..db.engine import get_async_session, get_session
 from ..db.helpers import get_captions_by_vids
 from ..db.models import Caption, psql
 from ..settings import CAPTIONS_PATH, VIDEOS_PATH
@@ -103,6 +104,7 @@ parser.add_argument(
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    set_copy_on_write()
     exiting = False
 
     # load videos df and select video_ids
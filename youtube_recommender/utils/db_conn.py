@@ -2,11 +2,16 @@
 import pandas as pd
 import psycopg2
 from config.config import config
+from youtube_recommender.db.arrow import read_dataframe
 
 
 # Take in a PostgreSQL table and outputs a pandas dataframe
-def load_db_table(config_db, query):
+def load_db_table(config_db, query) -> pd.DataFrame:
     params = config(config_db)
-    engine = psycopg2.connect(**params)
-    data = pd.read_sql(query, con=engine)
+    conn = psycopg2.connect(**params)
+    try:
+        # COPY to Arrow, instead of building Python objects per row
+        data = read_dataframe(conn, query)
+    finally:
+        conn.close()
     return data
@@ -0,0 +1,26 @@
+"""errors.py, exceptions raised by the Redis cache backends.
+
+redis-py errors do not subclass OSError, and aiocache gives up on slow
+calls with asyncio.TimeoutError, so catching OSError alone misses Redis
+being down.
+
+usage:
+    try:
+        df = await cache.get(key)
+    except CACHE_ERRORS as e:
+        logger.warning(f"cannot reach cache: {e}")
+"""
+
+import asyncio
+
+try:
+    from redis.exceptions import RedisError  # type: ignore[import]
+except ImportError:  # aiocache without the redis backend
+    RedisError = OSError
+
+# ConnectionError and TimeoutError of redis-py subclass RedisError
+CACHE_ERRORS = (OSError, asyncio.TimeoutError, RedisError)
+
+__all__ = [
+    "CACHE_ERRORS",
+]
@@ -1,9 +1,14 @@
 """misc.py, miscelannous utility methods for youtube-recommender."""
 
+from typing import Iterator, List, Sequence, TypeVar
+
 import yaml
 
 ENC = "utf8"
 
+T = TypeVar("T")
+
+
 def load_yaml(filepath):
     """Import YAML config file."""
     with open(filepath, "r", encoding=ENC) as stream:
@@ -13,3 +18,10 @@ def load_yaml(filepath):
             print(exc)
 
     return None
+
+
+def chunks(items: Sequence[T], size: int) -> Iterator[List[T]]:
+    """Yield successive `size`-sized chunks from `items`."""
+    assert size > 0
+    for i in range(0, len(items), size):
+        yield list(items[i : i + size])
@@ -9,20 +9,35 @@ From:
 """
 import asyncio
 import logging
+import re
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import partial
 from os import path
 from pathlib import Path
 from time import time
-from typing import Any, Dict, List, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import pandas as pd
-from apiclient.discovery import build  # type: ignore[import]
+
+from .core.types import ChannelId, VideoId
+from .quota import QuotaExceeded, QuotaScheduler
+from .response_cache import ResponseCache
+from .scoring import score_videos
+from .settings import YOUTUBE_API_RATE_LIMIT
+from .utils.misc import chunks
+from .youtube_api import (CHANNEL_PARTS, MAX_IDS_PER_REQUEST, VIDEO_PARTS,
+                          YouTubeClient, build_youtube_api)
 
 logger = logging.getLogger(__name__)
 
 RESULT_PER_PAGE = 50
 MAX_RESULTS = 100
 
+duration_pattern = re.compile(
+    r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$"
+)
+
 __all__ = [
     "get_start_date_string",
     "search_each_term",
@@ -54,16 +69,38 @@ async def search_each_term(
     views_threshold=5000,
     num_to_print=5,
     n=MAX_RESULTS,
+    rate_limit=YOUTUBE_API_RATE_LIMIT,
+    quota: Optional[QuotaScheduler] = None,
+    priorities: Optional[Dict[str, int]] = None,
+    cache: Optional[ResponseCache] = None,
 ) -> Dict[str, pd.DataFrame]:
-    """Use search term list to execute API calls and print results."""
+    """Use search term list to execute API calls and print results.
+
+    quota:          charge calls against the daily budget, and fetch fewer items or
+                    defer low priority terms when the budget is low
+    priorities:     higher priority terms are served first by `quota`
+    cache:          serve repeated API responses from cache
+    """
     if isinstance(search_terms, str):
         search_terms = [search_terms]
 
+    nitems: Dict[str, int] = dict.fromkeys(search_terms, n)
+    if quota is not None:
+        nitems = await quota.plan(search_terms, n, priorities=priorities)
+        search_terms = list(nitems)
+
     t0 = time()
 
     # list_of_dfs = _find_all_terms(search_terms, api_key, uploaded_since, views_threshold)
     list_of_dfs = await _afind_all_terms(
-        search_terms, api_key, uploaded_since, views_threshold, n=n
+        search_terms,
+        api_key,
+        uploaded_since,
+        views_threshold,
+        n=nitems,
+        rate_limit=rate_limit,
+        quota=quota,
+        cache=cache,
     )
 
     elapsed = time() - t0
@@ -124,32 +161,30 @@ def save_feather(df: pd.DataFrame, videos_path: Path) -> None:
 # ======================================================================= #
 
 
-def _find_videos(search_terms, api_key, views_threshold, uploaded_since, n=MAX_RESULTS):
+def _find_videos(
+    search_terms,
+    api_key,
+    views_threshold,
+    uploaded_since,
+    n=MAX_RESULTS,
+    youtube_api=None,
+):
     """Call other functions (below) to find results and populate dataframe."""
     # Initialise results dataframe
-    dataframe = pd.DataFrame(
-        columns=(
-            "title",
-            "video_url",
-            "custom_score",
-            "views",
-            "description",
-            "channel_name",
-            "num_subscribers",
-            "view_subscriber_atio",
-            "channel_url",
-        )
-    )
+    dataframe = _init_dataframe()
 
     # Run search
     search_results, youtube_api = _search_api(
-        search_terms, api_key, uploaded_since, n=n
+        search_terms, api_key, uploaded_since, n=n, youtube_api=youtube_api
     )
 
-    # raise SystemError("debugging")
+    # resolve video and channel metadata in batches, instead of per search hit
+    video_details, channel_details = _enrich_search_results(
+        search_results, youtube_api
+    )
 
     results_df = _populate_dataframe(
-        search_results, youtube_api, dataframe, views_threshold
+        search_results, video_details, channel_details, dataframe, views_threshold
     )
 
     results_df = results_df.sort_values(["custom_score"], ascending=[0])
@@ -157,8 +192,83 @@ def _find_videos(search_terms, api_key, views_threshold, uploaded_since, n=MAX_R
     return results_df
 
 
+async def _afind_videos(
+    client: YouTubeClient,
+    search_term: str,
+    views_threshold,
+    uploaded_since,
+    n=MAX_RESULTS,
+) -> pd.DataFrame:
+    """Find results and populate dataframe, using the shared async client.
+
+    Pages are enriched while the next page downloads. Search results are ordered
+    by viewCount, so paging stops at the first page without any video above
+    `views_threshold`.
+    """
+    frames: List[pd.DataFrame] = []
+    pages = _aiter_search_pages(client, search_term, uploaded_since, n=n)
+    try:
+        async for page in pages:
+            video_details, channel_details = await _aenrich_search_results(
+                page, client
+            )
+            frames.append(
+                _populate_dataframe(
+                    page,
+                    video_details,
+                    channel_details,
+                    _init_dataframe(),
+                    views_threshold,
+                )
+            )
+
+            if not any(
+                _find_viewcount(video) > views_threshold
+                for video in video_details.values()
+            ):
+                logger.debug(f"page below {views_threshold=}, stop paging {search_term=}")
+                break
+
+    except QuotaExceeded as e:
+        logger.warning(f"quota exceeded for {search_term=}, keeping results so far: {e}")
+
+    finally:
+        await pages.aclose()
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return _init_dataframe()
+
+    results_df = pd.concat(frames, ignore_index=True)
+    results_df = results_df.sort_values(["custom_score"], ascending=[0])
+
+    return results_df
+
+
+def _init_dataframe() -> pd.DataFrame:
+    """Initialise results dataframe."""
+    return pd.DataFrame(
+        columns=(
+            "title",
+            "video_url",
+            "custom_score",
+            "views",
+            "description",
+            "channel_name",
+            "num_subscribers",
+            "view_subscriber_atio",
+            "channel_url",
+            "publish_date",
+            "length",
+        )
+    )
+
+
 def _find_all_terms(search_terms: List[str], api_key, uploaded_since, views_threshold):
     """Find all terms in search terms."""
+    # build the discovery client once, not per search term
+    youtube_api = build_youtube_api(api_key)
+
     list_of_dfs = []
     for index, _ in enumerate(search_terms):
         df = _find_videos(
@@ -166,6 +276,7 @@ def _find_all_terms(search_terms: List[str], api_key, uploaded_since, views_thre
             api_key,
             views_threshold=views_threshold,
             uploaded_since=uploaded_since,
+            youtube_api=youtube_api,
         )
 
         list_of_dfs.append(df)
@@ -174,30 +285,52 @@ def _find_all_terms(search_terms: List[str], api_key, uploaded_since, views_thre
 
 
 async def _afind_all_terms(
-    search_terms: List[str], api_key, uploaded_since, views_threshold, n=MAX_RESULTS
+    search_terms: List[str],
+    api_key,
+    uploaded_since,
+    views_threshold,
+    n: Union[int, Dict[str, int]] = MAX_RESULTS,
+    rate_limit=YOUTUBE_API_RATE_LIMIT,
+    quota: Optional[QuotaScheduler] = None,
+    cache: Optional[ResponseCache] = None,
 ):
-    """Speed up downloading of captions by running them concurrently.
+    """Speed up searching by running all terms concurrently on one async client.
+
+    n:      max results for all terms, or per term
 
     usage:
-        results_df_dict = loop.run_until_complete(vf.afind_all_terms(search_terms, api_key, uploaded_since, views_threshold))
+        list_of_dfs = loop.run_until_complete(vf._afind_all_terms(search_terms, api_key, uploaded_since, views_threshold))
     """
-    loop = asyncio.get_running_loop()
+    nitems = n if isinstance(n, dict) else dict.fromkeys(search_terms, n)
+
+    async with YouTubeClient(
+        api_key, rate_limit=rate_limit, quota=quota, cache=cache
+    ) as client:
+        cors = [
+            _afind_videos(
+                client,
+                search_term,
+                views_threshold,
+                uploaded_since,
+                n=nitems[search_term],
+            )
+            for search_term in search_terms
+        ]
 
-    cors = [
-        loop.run_in_executor(
-            None, _find_videos, search_term, api_key, views_threshold, uploaded_since, n
-        )
-        for search_term in search_terms
-    ]
+        list_of_dfs = await asyncio.gather(*cors)
+
+    logger.info(f"used {client.nrequest:,} API requests")
 
-    list_of_dfs = await asyncio.gather(*cors)
     return list_of_dfs
 
 
-def _search_api(search_terms: List[str], api_key, uploaded_since, n=300):
+def _search_api(
+    search_terms: List[str], api_key, uploaded_since, n=300, youtube_api=None
+):
     """Execute search through API and returns result."""
     # Initialise API call
-    youtube_api = build("youtube", "v3", developerKey=api_key)
+    if youtube_api is None:
+        youtube_api = build_youtube_api(api_key)
 
     # Make the search
     # update by paul: I set relevanceLanguage to 'en', but it will still return other language videos
@@ -239,36 +372,153 @@ def _search_api(search_terms: List[str], api_key, uploaded_since, n=300):
     return search_response, youtube_api
 
 
-def _populate_dataframe(results, youtube_api, df, views_threshold) -> pd.DataFrame:
-    """Extract relevant information and put it into dataframe."""
-    # Loop over search results and add key information to dataframe
-    i = 1
+async def _aiter_search_pages(
+    client: YouTubeClient, search_term: str, uploaded_since, n=300
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield pages of search results as they arrive.
+
+    The next page is requested before the current page is yielded, so it
+    downloads while the caller enriches the current page. Closing the
+    iterator early cancels the pending request.
+    """
+    search = partial(
+        client.search_list,
+        search_term,
+        type="video",
+        order="viewCount",
+        maxResults=RESULT_PER_PAGE,
+        publishedAfter=uploaded_since,
+        relevanceLanguage="en",
+    )
+
+    nitem = 0
+    next_page: Optional[asyncio.Future] = asyncio.ensure_future(search())
+    try:
+        while next_page is not None:
+            try:
+                page = await next_page
+            except QuotaExceeded:
+                # degrade to the pages fetched so far
+                if nitem == 0:
+                    raise
+                logger.warning(f"quota exceeded, keeping first pages for {search_term=}")
+                return
+
+            nitem += len(page.get("items", []))
+            nextPageToken = page.get("nextPageToken")
+            next_page = None
+            if nextPageToken is not None and nitem < n:
+                next_page = asyncio.ensure_future(search(page_token=nextPageToken))
+
+            yield page
+
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+def _enrich_search_results(
+    results, youtube_api
+) -> Tuple[Dict[VideoId, dict], Dict[ChannelId, dict]]:
+    """Resolve all search hits with batched videos.list and channels.list calls.
+
+    A page of 50 search hits costs one videos.list call and at most one
+    channels.list call, instead of four calls per hit.
+    """
+    video_ids = _unique([_find_video_id(item) for item in results["items"]])
+    video_details = _list_videos(video_ids, youtube_api)
+
+    channel_ids = _unique([_find_channel_id(item) for item in video_details.values()])
+    channel_details = _list_channels(channel_ids, youtube_api)
+
+    logger.debug(
+        f"resolved {len(video_details):,} videos and {len(channel_details):,} channels"
+    )
+
+    return video_details, channel_details
+
+
+async def _aenrich_search_results(
+    results, client: YouTubeClient
+) -> Tuple[Dict[VideoId, dict], Dict[ChannelId, dict]]:
+    """Async version of `_enrich_search_results`."""
+    video_ids = _unique([_find_video_id(item) for item in results["items"]])
+    video_details = await client.videos_list(video_ids)
+
+    channel_ids = _unique([_find_channel_id(item) for item in video_details.values()])
+    channel_details = await client.channels_list(channel_ids)
+
+    return video_details, channel_details
+
+
+def _list_videos(video_ids: List[VideoId], youtube_api) -> Dict[VideoId, dict]:
+    """Get video resources for `video_ids`, `MAX_IDS_PER_REQUEST` ids per call."""
+    details: Dict[VideoId, dict] = {}
+    for chunk in chunks(video_ids, MAX_IDS_PER_REQUEST):
+        response = (
+            youtube_api.videos().list(id=",".join(chunk), part=VIDEO_PARTS).execute()
+        )
+        details.update({item["id"]: item for item in response.get("items", [])})
+
+    return details
+
+
+def _list_channels(channel_ids: List[ChannelId], youtube_api) -> Dict[ChannelId, dict]:
+    """Get channel resources for `channel_ids`, `MAX_IDS_PER_REQUEST` ids per call."""
+    details: Dict[ChannelId, dict] = {}
+    for chunk in chunks(channel_ids, MAX_IDS_PER_REQUEST):
+        response = (
+            youtube_api.channels()
+            .list(id=",".join(chunk), part=CHANNEL_PARTS)
+            .execute()
+        )
+        details.update({item["id"]: item for item in response.get("items", [])})
+
+    return details
+
+
+def _unique(items: List[str]) -> List[str]:
+    """Deduplicate `items`, preserving order."""
+    return list(dict.fromkeys(items))
+
+
+def _populate_dataframe(
+    results, video_details, channel_details, df, views_threshold
+) -> pd.DataFrame:
+    """Extract relevant information and put it into dataframe.
+
+    Columns are gathered in one pass over the search results, the dataframe
+    is built once and scored by `score_videos`.
+    """
+    columns: Dict[str, list] = defaultdict(list)
     for item in results["items"]:
-        viewcount = _find_viewcount(item, youtube_api)
-        if viewcount > views_threshold:
-            title = _find_title(item)
-            video_url = _find_video_url(item)
-            description = _find_description(item, youtube_api)
-            channel_url = _find_channel_url(item)
-            channel_id = _find_channel_id(item)
-            channel_name = _find_channel_title(channel_id, youtube_api)
-            num_subs = _find_num_subscribers(channel_id, youtube_api)
-            ratio = _view_to_sub_ratio(viewcount, num_subs)
-            days_since_published = _how_old(item)
-            score = _custom_score(viewcount, ratio, days_since_published)
-            df.loc[i] = [
-                title,
-                video_url,
-                score,
-                viewcount,
-                description,
-                channel_name,
-                num_subs,
-                ratio,
-                channel_url,
-            ]
-        i += 1
-    return df
+        video = video_details.get(_find_video_id(item))
+        # video was removed or made private between search and videos.list
+        if video is None:
+            continue
+
+        viewcount = _find_viewcount(video)
+        if viewcount <= views_threshold:
+            continue
+
+        channel = channel_details.get(_find_channel_id(item), {})
+        columns["title"].append(_find_title(item))
+        columns["video_url"].append(_find_video_url(item))
+        columns["views"].append(viewcount)
+        columns["description"].append(_find_description(video))
+        columns["channel_name"].append(_find_channel_title(channel))
+        columns["num_subscribers"].append(_find_num_subscribers(channel))
+        columns["channel_url"].append(_find_channel_url(item))
+        columns["publish_date"].append(_find_publish_date(item))
+        columns["length"].append(_find_length(video))
+
+    if not columns:
+        return df
+
+    columns["publish_date"] = pd.to_datetime(columns["publish_date"])
+    results_df = score_videos(pd.DataFrame(columns))
+
+    return results_df[df.columns]
 
 
 def _print_top_videos(df, num_to_print) -> None:
@@ -303,31 +553,47 @@ def _find_title(item):
     return title
 
 
+def _find_video_id(item) -> VideoId:
+    # search results nest the id, video resources do not
+    if isinstance(item["id"], dict):
+        return item["id"]["videoId"]
+    return item["id"]
+
+
 def _find_video_url(item):
-    video_id = item["id"]["videoId"]
+    video_id = _find_video_id(item)
     video_url = "https://www.youtube.com/watch?v=" + video_id
     return video_url
 
 
-def _find_viewcount(item, youtube):
-    video_id = item["id"]["videoId"]
-    video_statistics = youtube.videos().list(id=video_id, part="statistics").execute()
-    # logger.info(f"{video_id=} {video_statistics['items'][0]['statistics']=}")
+def _find_viewcount(video):
     # videos with comments turned off will not return viewCount
-    if "viewCount" not in video_statistics["items"][0]["statistics"]:
+    if "viewCount" not in video.get("statistics", {}):
         viewcount = 0
     else:
-        viewcount = int(video_statistics["items"][0]["statistics"]["viewCount"])
+        viewcount = int(video["statistics"]["viewCount"])
     return viewcount
 
 
-def _find_description(item, youtube):
-    video_id = item["id"]["videoId"]
-    video_statistics = youtube.videos().list(id=video_id, part="snippet").execute()
-    description = video_statistics["items"][0]["snippet"]["description"]
+def _find_description(video):
+    description = video["snippet"]["description"]
     return description
 
 
+def _find_length(video) -> int:
+    """Parse ISO 8601 `contentDetails.duration` to seconds, e.g. PT1H2M3S."""
+    duration = video.get("contentDetails", {}).get("duration", "")
+    match = duration_pattern.match(duration)
+    if match is None:
+        return 0
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _find_publish_date(item) -> datetime:
+    return datetime.strptime(item["snippet"]["publishedAt"], "%Y-%m-%dT%H:%M:%SZ")
+
+
 def _find_channel_id(item):
     channel_id = item["snippet"]["channelId"]
     return channel_id
@@ -339,44 +605,17 @@ def _find_channel_url(item):
     return channel_url
 
 
-def _find_channel_title(channel_id, youtube):
-    channel_search = (
-        youtube.channels().list(id=channel_id, part="brandingSettings").execute()
-    )
-    channel_name = channel_search["items"][0]["brandingSettings"]["channel"]["title"]
+def _find_channel_title(channel):
+    if "brandingSettings" not in channel:
+        return ""
+    channel_name = channel["brandingSettings"]["channel"]["title"]
     return channel_name
 
 
-def _find_num_subscribers(channel_id, youtube):
-    subs_search = youtube.channels().list(id=channel_id, part="statistics").execute()
-    if subs_search["items"][0]["statistics"]["hiddenSubscriberCount"]:
+def _find_num_subscribers(channel):
+    statistics = channel.get("statistics", {})
+    if statistics.get("hiddenSubscriberCount", True):
         num_subscribers = 1000000
     else:
-        num_subscribers = int(subs_search["items"][0]["statistics"]["subscriberCount"])
+        num_subscribers = int(statistics["subscriberCount"])
     return num_subscribers
-
-
-def _view_to_sub_ratio(viewcount, num_subscribers):
-    if num_subscribers == 0:
-        return 0
-    # else:
-    ratio = viewcount / num_subscribers
-    return ratio
-
-
-def _how_old(item):
-    when_published = item["snippet"]["publishedAt"]
-    when_published_datetime_object = datetime.strptime(
-        when_published, "%Y-%m-%dT%H:%M:%SZ"
-    )
-    today_date = datetime.today()
-    days_since_published = int((today_date - when_published_datetime_object).days)
-    if days_since_published == 0:
-        days_since_published = 1
-    return days_since_published
-
-
-def _custom_score(viewcount, ratio, days_since_published):
-    ratio = min(ratio, 5)
-    score = (viewcount * ratio) / days_since_published
-    return score
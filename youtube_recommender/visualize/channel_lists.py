@@ -19,9 +19,8 @@ import requests
 import streamlit as st
 from rarc_utils.misc import timeago_series
 # from rarc_utils.log import setup_logger
-from rarc_utils.sqlalchemy_base import get_async_session, get_session
 from youtube_recommender import config as config_dir
-from youtube_recommender.db.db_methods import refresh_view
+from youtube_recommender.db.engine import get_async_session, get_session
 from youtube_recommender.db.helpers import (get_top_channels_with_comments,
                                             get_top_videos_by_channel_ids)
 from youtube_recommender.db.models import load_config, psql
@@ -73,15 +72,7 @@ async def main():
     else:
         st.write("goodbye")
 
-    if st.button(
-        "Refresh top channels view",
-        on_click=refresh_view,
-        args=("top_channels_with_comments",),
-    ):
-        st.write("refreshed view")
-    else:
-        st.write("Goodbye")
-
+    # top channels are kept up to date by the push pipeline, see db/summary.py
     st.dataframe(df)
 
     """ 
@@ -0,0 +1,295 @@
+"""youtube_api.py, asyncio client for the YouTube Data API v3.
+
+Only wraps the endpoints youtube-recommender uses: search.list, videos.list,
+channels.list and captions.list. All requests share one aiohttp connection
+pool (HTTP/1.1 keep-alive), concurrency is bounded by a semaphore and
+requests are spread out by a per-second rate limit. Pass a `ResponseCache`
+to serve repeated requests and resources from cache.
+
+usage:
+    async with YouTubeClient(api_key) as client:
+        page = await client.search_list("python", publishedAfter=uploaded_since)
+        videos = await client.videos_list([item["id"]["videoId"] for item in page["items"]])
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from apiclient.discovery import build  # type: ignore[import]
+
+from .core.types import ChannelId, VideoId
+from .quota import QuotaExceeded, QuotaScheduler
+from .response_cache import ResponseCache
+from .settings import (DEFAULT_YOUTUBE_API_BASE_URL, YOUTUBE_API_BASE_URL,
+                       YOUTUBE_API_KEEPALIVE, YOUTUBE_API_MAX_CONCURRENCY,
+                       YOUTUBE_API_MAX_RETRIES, YOUTUBE_API_RATE_LIMIT,
+                       YOUTUBE_API_TIMEOUT)
+from .utils.misc import chunks
+
+logger = logging.getLogger(__name__)
+
+# videos.list and channels.list accept at most 50 comma separated ids per call
+MAX_IDS_PER_REQUEST = 50
+VIDEO_PARTS = "statistics,snippet,contentDetails"
+CHANNEL_PARTS = "statistics,brandingSettings"
+
+# transient errors that are worth retrying
+RETRY_STATUSES = (500, 502, 503, 504)
+QUOTA_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+
+__all__ = [
+    "YouTubeApiError",
+    "RateLimiter",
+    "YouTubeClient",
+    "MAX_IDS_PER_REQUEST",
+    "VIDEO_PARTS",
+    "CHANNEL_PARTS",
+    "build_youtube_api",
+]
+
+
+def build_youtube_api(api_key: str, base_url: str = YOUTUBE_API_BASE_URL):
+    """Build blocking googleapiclient resource, honouring `YOUTUBE_API_BASE_URL`."""
+    client_options = None
+    if base_url.rstrip("/") != DEFAULT_YOUTUBE_API_BASE_URL:
+        # googleapiclient appends the `youtube/v3/` service path itself
+        root_url = base_url.rstrip("/").rsplit("/youtube/v3", 1)[0]
+        client_options = {"api_endpoint": root_url + "/"}
+
+    return build("youtube", "v3", developerKey=api_key, client_options=client_options)
+
+
+class YouTubeApiError(Exception):
+    """Non-200 response from the YouTube Data API."""
+
+    def __init__(self, status: int, payload: Optional[dict] = None):
+        self.status = status
+        self.payload = payload or {}
+        error = self.payload.get("error", {})
+        errors = error.get("errors") or [{}]
+        self.reason: str = errors[0].get("reason", "")
+        super().__init__(f"{status=} reason={self.reason!r} {error.get('message', '')}")
+
+
+class RateLimiter:
+    """Spread requests evenly, so at most `rate` requests start per second.
+
+    rate <= 0 disables rate limiting
+    """
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Wait for the next free slot."""
+        if not self._interval:
+            return
+
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class YouTubeClient:
+    """Async YouTube Data API client with one shared connection pool."""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = YOUTUBE_API_BASE_URL,
+        max_concurrency: int = YOUTUBE_API_MAX_CONCURRENCY,
+        rate_limit: float = YOUTUBE_API_RATE_LIMIT,
+        timeout: float = YOUTUBE_API_TIMEOUT,
+        max_retries: int = YOUTUBE_API_MAX_RETRIES,
+        quota: Optional[QuotaScheduler] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.quota = quota
+        self.cache = cache
+
+        self.nrequest: int = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = RateLimiter(rate_limit)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "YouTubeClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        """Create the shared aiohttp session."""
+        if self._session is not None:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency, keepalive_timeout=YOUTUBE_API_KEEPALIVE
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        """Close the shared aiohttp session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        logger.debug(f"closed client after {self.nrequest:,} requests")
+
+    async def search_list(
+        self,
+        q: str,
+        page_token: Optional[str] = None,
+        part: str = "snippet",
+        **params,
+    ) -> Dict[str, Any]:
+        """Get one page of search results."""
+        return await self.get("search", q=q, part=part, pageToken=page_token, **params)
+
+    async def videos_list(
+        self, video_ids: List[VideoId], part: str = VIDEO_PARTS
+    ) -> Dict[VideoId, dict]:
+        """Get video resources by id, `MAX_IDS_PER_REQUEST` ids per call."""
+        return await self._list_by_ids("videos", video_ids, part)
+
+    async def channels_list(
+        self, channel_ids: List[ChannelId], part: str = CHANNEL_PARTS
+    ) -> Dict[ChannelId, dict]:
+        """Get channel resources by id, `MAX_IDS_PER_REQUEST` ids per call."""
+        return await self._list_by_ids("channels", channel_ids, part)
+
+    async def captions_list(
+        self, video_id: VideoId, part: str = "snippet"
+    ) -> Dict[str, Any]:
+        """List caption tracks of a video."""
+        return await self.get("captions", videoId=video_id, part=part)
+
+    async def get(self, endpoint: str, **params) -> Dict[str, Any]:
+        """GET `endpoint`, served from `cache` while fresh.
+
+        Stale cached responses are revalidated with their ETag.
+        """
+        params = {k: v for k, v in params.items() if v is not None}
+        if self.cache is None:
+            _, payload, _ = await self._fetch(endpoint, params)
+            return payload
+
+        entry = await self.cache.get(endpoint, params)
+        if entry is not None and self.cache.is_fresh(endpoint, entry):
+            return entry["payload"]
+
+        etag = entry["etag"] if entry is not None else None
+        status, payload, etag = await self._fetch(endpoint, params, etag=etag)
+        if status == 304:
+            assert entry is not None
+            self.cache.revalidated += 1
+            payload = entry["payload"]
+
+        await self.cache.set(endpoint, params, payload, etag)
+
+        return payload
+
+    # ======================================================================= #
+    # ======                       PRIVATE METHODS                     ====== #
+    # ======================================================================= #
+
+    async def _fetch(
+        self, endpoint: str, params: Dict[str, Any], etag: Optional[str] = None
+    ) -> Tuple[int, Dict[str, Any], Optional[str]]:
+        """GET `endpoint`, retrying transient errors with exponential backoff.
+
+        Every attempt is charged against `quota`, if passed, right before it is
+        sent. A call cancelled while it waits for a slot, like a prefetched
+        search page nobody reads, costs nothing, and a call that cannot connect
+        is refunded, it never reached the API.
+        Returns status, payload and ETag, status is 304 when `etag` still matches.
+        """
+        assert self._session is not None, "open the client first, or use `async with`"
+
+        params = {**params, "key": self.api_key}
+        headers = {"If-None-Match": etag} if etag else {}
+        url = f"{self.base_url}/{endpoint}"
+
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._rate_limiter.wait()
+                if self.quota is not None:
+                    await self.quota.charge(endpoint)
+                self.nrequest += 1
+                try:
+                    async with self._session.get(
+                        url, params=params, headers=headers
+                    ) as resp:
+                        status = resp.status
+                        if status == 304:
+                            return status, {}, etag
+                        payload = await resp.json(content_type=None)
+                        resp_etag = resp.headers.get("ETag")
+                except aiohttp.ClientConnectorError:
+                    if self.quota is not None:
+                        await self.quota.refund(endpoint)
+                    raise
+
+            if status == 200:
+                return status, payload, resp_etag or payload.get("etag")
+
+            error = YouTubeApiError(status, payload)
+            if error.reason in QUOTA_REASONS:
+                if self.quota is not None:
+                    await self.quota.exhaust()
+                raise QuotaExceeded(str(error)) from error
+
+            if status not in RETRY_STATUSES or attempt == self.max_retries:
+                raise error
+
+            logger.warning(f"{endpoint=} returned {status=}, retry {attempt + 1}")
+            await asyncio.sleep(2**attempt)
+
+        raise YouTubeApiError(status, payload)
+
+    async def _list_by_ids(
+        self, endpoint: str, ids: List[str], part: str
+    ) -> Dict[str, dict]:
+        """Get resources by id, only ids missing from `cache` are requested.
+
+        Missing ids are requested without `If-None-Match`, see response_cache.py.
+        """
+        ids = list(dict.fromkeys(ids))
+        cached: Dict[str, dict] = {}
+        if self.cache is not None:
+            cached = await self.cache.get_items(endpoint, part, ids)
+
+        missing = [id_ for id_ in ids if id_ not in cached]
+        cors = [
+            self._fetch(endpoint, {"id": ",".join(chunk), "part": part})
+            for chunk in chunks(missing, MAX_IDS_PER_REQUEST)
+        ]
+        responses = await asyncio.gather(*cors)
+
+        items = [
+            item for _, response, _ in responses for item in response.get("items", [])
+        ]
+        if self.cache is not None:
+            await self.cache.set_items(endpoint, part, items)
+
+        details = {**cached, **{item["id"]: item for item in items}}
+
+        return {id_: details[id_] for id_ in ids if id_ in details}